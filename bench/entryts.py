@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Entry time stamp microbenchmark.
+
+Compares ilog.EntryTS with the sec/nsec implementation it replaced, measuring
+the time per operation of:
+ - construction,
+ - comparison with another time stamp and with a float,
+ - conversion to a float,
+ - pickling and unpickling, and
+ - the per-entry time stamp work of the playback loop: taking due entries
+   from the read-ahead buffer and computing when each is due.
+The memory used by one time stamp is also given.
+
+'''
+
+
+import collections
+import cPickle as pickle
+import json
+import optparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rt_logplayer import ilog
+
+
+class OldEntryTS(object):
+    '''The previous implementation of ilog.EntryTS, for comparison.'''
+    def __init__(self, sec=0, nsec=0, time=None):
+        super(OldEntryTS, self).__init__()
+        if time is not None:
+            self._sec, self._nsec = self._get_values(time)
+        else:
+            self._sec = sec
+            self._nsec = nsec
+
+    def __lt__(self, other):
+        sec, nsec = self._get_values(other)
+        if self._sec < sec:
+            return True
+        elif self._sec == sec:
+            if self._nsec < nsec:
+                return True
+        return False
+
+    def __le__(self, other):
+        sec, nsec = self._get_values(other)
+        if self._sec < sec:
+            return True
+        elif self._sec == sec:
+            if self._nsec <= nsec:
+                return True
+        return False
+
+    def __gt__(self, other):
+        sec, nsec = self._get_values(other)
+        if self._sec > sec:
+            return True
+        elif self._sec == sec:
+            if self._nsec > nsec:
+                return True
+        return False
+
+    @property
+    def float(self):
+        return float(self._sec) + float(self._nsec) / 1e9
+
+    @property
+    def sec(self):
+        return self._sec
+
+    @property
+    def nsec(self):
+        return self._nsec
+
+    def _get_values(self, other):
+        if type(other) == OldEntryTS:
+            return other.sec, other.nsec
+        else:
+            return int(other), int((other * 1000000000) % 1000000000)
+
+
+# Implementations: name: time stamp class
+CLASSES = [('old', OldEntryTS), ('new', ilog.EntryTS)]
+
+
+def make_stamps(cls, count, period):
+    '''Make the time stamps of a log with entries period seconds apart.'''
+    period_ns = int(period * 1e9)
+    return [cls(sec=ns // 1000000000, nsec=ns % 1000000000)
+            for ns in xrange(1000000000000, 1000000000000 + count * period_ns,
+                period_ns)]
+
+
+def per_op(f, number, repeats):
+    '''Get the best time per call of a function, in nanoseconds.'''
+    return min(timeit.repeat(f, number=number, repeat=repeats)) / number * 1e9
+
+
+def play_loop(cls, stamps, batch):
+    '''Play a log's time stamps in batches as the player does.
+
+    Each batch takes the entries due by a time limit from a buffer, as
+    read_ahead.ReadAhead.read does, and computes the wall time at which each
+    is due, as playback.Player does.
+
+    '''
+    period = (stamps[1].float - stamps[0].float) * batch
+    start = stamps[0].float
+    def play():
+        buf = collections.deque((0, ts, None, 0) for ts in stamps)
+        limit = start
+        due = 0.0
+        while buf:
+            limit += period
+            # ReadAhead.read converts the limit once per batch
+            lim = cls(time=limit)
+            while buf and not buf[0][1] > lim:
+                e = buf.popleft()
+                due = e[1].float - start
+        return due
+    return play
+
+
+def main(argv=None):
+    usage = '''Usage: %prog [options]
+Benchmark entry time stamps.'''
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-b', '--batch', dest='batch', action='store',
+            type='int', default=10,
+            help='Entries played per batch in the playback loop. '
+            '[Default: %default]')
+    parser.add_option('-n', '--number', dest='number', action='store',
+            type='int', default=100000,
+            help='Number of operations, and of entries in the playback loop, '
+            'per measurement. [Default: %default]')
+    parser.add_option('--repeats', dest='repeats', action='store',
+            type='int', default=5,
+            help='Number of times to repeat each measurement, taking the '
+            'best. [Default: %default]')
+    options, args = parser.parse_args(argv)
+    n = options.number
+    r = options.repeats
+
+    results = {}
+    for name, cls in CLASSES:
+        a = cls(sec=1000, nsec=500)
+        b = cls(sec=1000, nsec=600)
+        pickled = pickle.dumps(a, pickle.HIGHEST_PROTOCOL)
+        stamps = make_stamps(cls, n, 0.001)
+        size = sys.getsizeof(a)
+        if hasattr(a, '__dict__'):
+            size += sys.getsizeof(a.__dict__)
+        results[name] = {
+            'bytes': size,
+            'construct_ns': per_op(lambda: cls(sec=1000, nsec=500), n, r),
+            'compare_ts_ns': per_op(lambda: a < b, n, r),
+            'compare_float_ns': per_op(lambda: a < 1000.5, n, r),
+            'float_ns': per_op(lambda: a.float, n, r),
+            'pickle_ns': per_op(lambda: pickle.dumps(a,
+                pickle.HIGHEST_PROTOCOL), n, r),
+            'unpickle_ns': per_op(lambda: pickle.loads(pickled), n, r),
+            'play_loop_ns_per_entry': per_op(play_loop(cls, stamps,
+                options.batch), 1, r) / n}
+        print >>sys.stderr, 'Finished {0}'.format(name)
+    results['speedup'] = dict((k, results['old'][k] / results['new'][k])
+            for k in results['new'] if k.endswith('_ns') or
+            k.endswith('_entry'))
+    print json.dumps(results, sort_keys=True, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+# vim: tw=79
@@ -0,0 +1,34 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Write a synthetic log file. See rt_logplayer.log_gen.
+
+'''
+
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import rt_logplayer.log_gen
+
+
+if __name__ == '__main__':
+    sys.exit(rt_logplayer.log_gen.main())
+
+
+# vim: tw=79
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Log reading and playback benchmark.
+
+Generates a synthetic log, or uses a given one, and measures for each log
+format and reading mode:
+ - the time to open the log,
+ - the time to look up its start and end,
+ - the latency of forward and backward seeks to random times,
+ - sequential read throughput,
+ - playback dispatch throughput at the maximum rate, forward and in
+   reverse, and
+ - playback timing error at a fixed rate.
+
+Playback writes to in-process sinks rather than a facade component's ports,
+so no name server or ORB is needed.
+
+'''
+
+
+import json
+import optparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rt_logplayer import blk_log
+from rt_logplayer import clock
+from rt_logplayer import hdrpkl_log
+from rt_logplayer import log_formats
+from rt_logplayer import log_gen
+from rt_logplayer import playback
+from rt_logplayer import sinks
+
+
+# Log variants: name: (log class to convert to or None, options to open with)
+VARIANTS = [('simple', (None, {})),
+        ('simple-index', (None, {'index': True})),
+        ('simple-mmap', (None, {'index': True, 'mmap': True})),
+        ('header', (hdrpkl_log.HeaderPickleLog, {'index': True})),
+        ('block', (blk_log.BlockLog, {}))]
+
+
+def stats(values):
+    '''Get the mean, median, 99th percentile and maximum of some values.'''
+    if not values:
+        return {}
+    values = sorted(values)
+    return {'mean': sum(values) / len(values),
+            'median': values[len(values) / 2],
+            'p99': values[min(int(len(values) * 0.99), len(values) - 1)],
+            'max': values[-1]}
+
+
+def time_call(f):
+    '''Call a function, returning the time it took and its result.'''
+    t = clock.monotonic()
+    result = f()
+    return clock.monotonic() - t, result
+
+
+def bench_open(fn, opts, repeats):
+    times = []
+    for ii in range(repeats):
+        t, l = time_call(lambda: log_formats.open_log(fn, **opts))
+        times.append(t)
+        l.close()
+    return stats(times)
+
+
+def bench_start_end(fn, opts):
+    l = log_formats.open_log(fn, **opts)
+    try:
+        t_start, start = time_call(lambda: l.start)
+        t_end, end = time_call(lambda: l.end)
+    finally:
+        l.close()
+    return {'start': t_start, 'end': t_end}
+
+
+def bench_seek(fn, opts, seeks):
+    l = log_formats.open_log(fn, **opts)
+    try:
+        start = l.start[1].float
+        end = l.end[1].float
+        rng = random.Random(0)
+        targets = sorted(rng.uniform(start, end) for ii in range(seeks))
+        result = {}
+        for name, order in [('forward', targets),
+                ('backward', list(reversed(targets)))]:
+            l.rewind()
+            if name == 'backward':
+                l.seek(timestamp=end)
+            times = []
+            for t in order:
+                times.append(time_call(lambda: l.seek(timestamp=t))[0])
+            result[name] = stats(times)
+    finally:
+        l.close()
+    return result
+
+
+def bench_read(fn, opts):
+    l = log_formats.open_log(fn, **opts)
+    try:
+        def read_all():
+            n = 0
+            while l.read():
+                n += 1
+            return n
+        t, n = time_call(read_all)
+    finally:
+        l.close()
+    return {'entries': n, 'time': t, 'entries_per_sec': n / t,
+            'mb_per_sec': os.path.getsize(fn) / t / 1e6}
+
+
+def bench_dispatch(fn, opts, reverse=False):
+    l = log_formats.open_log(fn, **opts)
+    p = playback.Player(l, sinks.CountingSink(),
+            rate=playback.Player.MAX_RATE, reverse=reverse)
+    try:
+        if reverse:
+            p.skip_to(l.end[1].float)
+            # Wait for the seek, so that it is not counted
+            p.pos
+        t, finished = time_call(p.play)
+    finally:
+        p.close()
+        l.close()
+    return {'entries': p.played, 'time': t, 'entries_per_sec': p.played / t}
+
+
+def bench_jitter(fn, opts, rate, duration):
+    '''Measure how late entries are written, relative to the first.
+
+    Uses the time stamps carried in the generated data.
+
+    '''
+    l = log_formats.open_log(fn, **opts)
+    sink = sinks.RecordingSink()
+    p = playback.Player(l, sink, rate=rate)
+    try:
+        p.play(end=l.start[1].float + duration * rate)
+    finally:
+        p.close()
+        l.close()
+    if not sink.records:
+        return {}
+    times = [(wall, data.tm.sec + data.tm.nsec * 1e-9)
+            for wall, chan, data in sink.records]
+    wall0, log0 = times[0]
+    late = [(wall - wall0 - (ts - log0) / rate) * 1e6 for wall, ts in times]
+    result = stats(late)
+    result['units'] = 'us'
+    return result
+
+
+def main(argv=None):
+    usage = '''Usage: %prog [options]
+Benchmark log reading and playback.'''
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-c', '--channels', dest='channels', action='store',
+            type='int', default=4,
+            help='Number of channels to generate. [Default: %default]')
+    parser.add_option('-d', '--duration', dest='duration', action='store',
+            type='float', default=10.0,
+            help='Length of the generated log in seconds. '
+            '[Default: %default]')
+    parser.add_option('-j', '--jitter-time', dest='jitter_time',
+            action='store', type='float', default=2.0,
+            help='Wall time in seconds to measure playback timing error '
+            'over. [Default: %default]')
+    parser.add_option('-l', '--log', dest='log', action='store',
+            type='string', default=None,
+            help='Use this log instead of generating one. Its data must have '
+            'a tm member for the timing error to be measured.')
+    parser.add_option('-n', '--seeks', dest='seeks', action='store',
+            type='int', default=100,
+            help='Number of seeks in each direction. [Default: %default]')
+    parser.add_option('-p', '--payload', dest='payload', action='store',
+            type='choice', default='long',
+            choices=sorted(log_gen.PAYLOADS.keys()),
+            help='Payload type to generate. [Default: %default]')
+    parser.add_option('-r', '--rate', dest='rate', action='store',
+            type='float', default=250.0,
+            help='Rate of each generated channel in Hz. [Default: %default]')
+    parser.add_option('--play-rate', dest='play_rate', action='store',
+            type='float', default=1.0,
+            help='Playback rate for measuring timing error. '
+            '[Default: %default]')
+    parser.add_option('--repeats', dest='repeats', action='store',
+            type='int', default=5,
+            help='Number of times to open each log. [Default: %default]')
+    parser.add_option('-s', '--size', dest='size', action='store',
+            type='string', default='0',
+            help='Size of generated octets payloads in bytes, optionally '
+            'with a k or M suffix. [Default: %default]')
+    parser.add_option('-V', '--variant', dest='variants', action='append',
+            type='choice', default=[], choices=[v[0] for v in VARIANTS],
+            help='Log format and reading mode to benchmark. May be given '
+            'multiple times. [Default: all]')
+    options, args = parser.parse_args(argv)
+    variants = [v for v in VARIANTS
+            if not options.variants or v[0] in options.variants]
+
+    tmp = tempfile.mkdtemp(prefix='rtlp_bench')
+    try:
+        if options.log:
+            src = options.log
+        else:
+            src = os.path.join(tmp, 'source.rtlog')
+            log_gen.generate(src, channels=options.channels,
+                    rate=options.rate, duration=options.duration,
+                    payload=options.payload,
+                    size=log_gen.parse_size(options.size))
+        results = {'log': {'file': options.log, 'size': os.path.getsize(src)}}
+        for name, (log_class, opts) in variants:
+            fn = os.path.join(tmp, name + '.rtlog')
+            if log_class:
+                log_formats.convert(src, fn, log_class)
+            else:
+                shutil.copy(src, fn)
+            r = {'size': os.path.getsize(fn)}
+            r['open'] = bench_open(fn, opts, options.repeats)
+            r['start_end'] = bench_start_end(fn, opts)
+            r['seek'] = bench_seek(fn, opts, options.seeks)
+            r['read'] = bench_read(fn, opts)
+            r['dispatch'] = bench_dispatch(fn, opts)
+            r['dispatch_reverse'] = bench_dispatch(fn, opts, reverse=True)
+            r['timing_error'] = bench_jitter(fn, opts, options.play_rate,
+                    options.jitter_time)
+            results[name] = r
+            print >>sys.stderr, 'Finished {0}'.format(name)
+    finally:
+        shutil.rmtree(tmp)
+    print json.dumps(results, sort_keys=True, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+# vim: tw=79
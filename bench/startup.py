@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Startup benchmark.
+
+Measures, in fresh interpreters, the time to import the entry point modules and
+the time until the main window has been shown and its first frame processed.
+It also checks that the slow CORBA, rtctree and rtshell modules have not been
+imported by then. Exits with status 1 if a check fails or a limit given on the
+command line is exceeded.
+
+'''
+
+
+import json
+import optparse
+import os
+import subprocess
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must not be imported before they are needed
+HEAVY_MODULES = ['omniORB', 'OpenRTM_aist', 'RTC', 'rtctree', 'rtshell']
+
+IMPORT = '''
+import sys, time
+t = time.time()
+import %s
+print time.time() - t
+print ' '.join(m for m in %r if m in sys.modules)
+'''
+
+FIRST_FRAME = '''
+import sys, time
+t = time.time()
+from PySide import QtCore, QtGui
+import rt_logplayer.rtlpwindow
+app = QtGui.QApplication(sys.argv)
+w = rt_logplayer.rtlpwindow.RTLPWindow()
+w.show()
+def done():
+    print time.time() - t
+    print ' '.join(m for m in %r if m in sys.modules)
+    app.quit()
+QtCore.QTimer.singleShot(0, done)
+app.exec_()
+''' % HEAVY_MODULES
+
+
+def run(code):
+    '''Run code in a fresh interpreter, returning its output lines.'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] +
+            filter(None, [env.get('PYTHONPATH')]))
+    p = subprocess.Popen([sys.executable, '-c', code], env=env,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError(err.strip().splitlines()[-1])
+    return out.splitlines()
+
+
+def measure(code, repeats):
+    '''Run code that prints a time and the heavy modules it imported.
+
+    Returns a dictionary of the minimum and median times, and the heavy
+    modules imported.
+
+    '''
+    times = []
+    heavy = set()
+    for ii in range(repeats):
+        out = run(code)
+        times.append(float(out[0]))
+        if len(out) > 1:
+            heavy.update(out[1].split())
+    times.sort()
+    return {'min': times[0], 'median': times[len(times) / 2],
+            'heavy_modules': sorted(heavy)}
+
+
+def main(argv=None):
+    usage = '''Usage: %prog [options]
+Measure the startup time of rtlogplayer and rtlogplayer-cli.'''
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-n', '--repeats', dest='repeats', action='store',
+            type='int', default=5,
+            help='Number of times to start each. [Default: %default]')
+    parser.add_option('--max-import', dest='max_import', action='store',
+            type='float', default=None,
+            help='Fail if the median import time, in seconds, of either '
+            'entry point exceeds this.')
+    parser.add_option('--max-first-frame', dest='max_first_frame',
+            action='store', type='float', default=None,
+            help='Fail if the median time, in seconds, to the first frame '
+            'exceeds this.')
+    options, args = parser.parse_args(argv)
+
+    results = {}
+    failed = []
+    for name, code, limit in [
+            ('import_cli', IMPORT % ('rt_logplayer.cli', HEAVY_MODULES),
+                options.max_import),
+            ('import_gui', IMPORT % ('rt_logplayer.rtlpwindow', HEAVY_MODULES),
+                options.max_import),
+            ('first_frame', FIRST_FRAME, options.max_first_frame)]:
+        try:
+            results[name] = measure(code, options.repeats)
+        except RuntimeError, e:
+            results[name] = {'error': str(e)}
+            continue
+        if limit is not None and results[name]['median'] > limit:
+            failed.append(name)
+        if results[name]['heavy_modules']:
+            failed.append(name + ' imported heavy modules')
+    results['failed'] = sorted(set(failed))
+    print json.dumps(results, sort_keys=True, indent=2)
+    if failed:
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+
+# vim: tw=79
@@ -0,0 +1,521 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Block-compressed log.
+
+'''
+
+
+import bisect
+import os
+import struct
+import zlib
+try:
+    import lzma
+except ImportError:
+    lzma = None
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import hdrpkl_log
+import ilog
+import log_index
+
+
+###############################################################################
+## Block-compressed log object (rtlog version 2). Entries are grouped into
+## blocks, each compressed separately, and a table of the blocks is stored at
+## the end of the file. Seeking only needs to decompress the block containing
+## the target entry.
+##
+## The format is as follows:
+## File header: (magic, version, file position of the block table)
+## Metadata length, followed by the pickled metadata
+## [Blocks: (Block header, compressed entries)]
+## Block table: number of blocks, followed by [(file position, first index,
+##   number of entries, first time stamp, last time stamp)]
+##
+## Block headers are (compression, compressed length, uncompressed length,
+## first index, number of entries, first time stamp, last time stamp). Time
+## stamps are in nanoseconds. An uncompressed block is a sequence of entries,
+## each an entry header (index, seconds, nanoseconds, channel, data length)
+## followed by the data, encoded by hdrpkl_log.ChannelCodec.
+##
+## The block table position is written when the log is closed. If it is zero,
+## the block headers are scanned to rebuild the table.
+##
+## Keyframes (see log_index.Keyframes) are built every keyframe_interval
+## seconds, the first time they are needed, from an index of the entries made
+## by decompressing every block and reading the entry headers.
+##
+## Readers (see ilog.Log.reader), which are also used for random access and
+## range iteration, open the file again and have their own decompressed
+## block. Entries are counted using the block table, decompressing only the
+## blocks at the ends of the range.
+
+class BlockLog(ilog.Log):
+    MAGIC = 'RTLPBLK2'
+    VERSION = 2
+    FILE_HEADER = struct.Struct('<8sIq')
+    META_LEN = struct.Struct('<Q')
+    BLOCK_HEADER = struct.Struct('<BQQqqqq')
+    TABLE_LEN = struct.Struct('<Q')
+    TABLE_ENTRY = struct.Struct('<qqqqq')
+    ENTRY_HEADER = struct.Struct('<qqIiQ')
+    # Indices in entry headers
+    INDEX = 0
+    SEC = 1
+    NSEC = 2
+    CHAN = 3
+    LEN = 4
+    # Compression methods
+    NONE = 0
+    ZLIB = 1
+    LZMA = 2
+    COMPRESSION = {'none': NONE, 'zlib': ZLIB, 'lzma': LZMA}
+    # Default uncompressed size of a block
+    BLOCK_SIZE = 256 * 1024
+
+    def __init__(self, filename='', *args, **kwargs):
+        self._is_open = False
+        self._fn = filename
+        compression = kwargs.pop('compression', 'zlib')
+        if compression not in self.COMPRESSION:
+            raise ValueError('Unknown compression: {0}'.format(compression))
+        if compression == 'lzma' and lzma is None:
+            # Checked before the file is created
+            raise ValueError('LZMA compression is not available')
+        self._comp = self.COMPRESSION[compression]
+        self._block_size = kwargs.pop('block_size', self.BLOCK_SIZE)
+        self._kf_interval = log_index.check_keyframe_interval(
+                kwargs.pop('keyframe_interval', log_index.KEYFRAME_INTERVAL))
+        # Index of the entries and its keyframes, built for keyframes only
+        self._index = None
+        self._keyframes = None
+        self._codec = None
+        # The channel numbers to read, or None for all
+        self._chan_nums = None
+        self._data_start = 0
+        # The block table
+        self._blk_fp = []
+        self._blk_first_index = []
+        self._blk_count = []
+        self._blk_first_ns = []
+        self._blk_last_ns = []
+        # The currently-decompressed block
+        self._blk = None
+        self._blk_data = ''
+        self._blk_entries = []
+        self._blk_ns = []
+        # The block and entry within it of the next entry to be read
+        self._b = 0
+        self._e = 0
+        # The block being written
+        self._w_buf = []
+        self._w_size = 0
+        self._w_first_ns = 0
+        self._w_last_ns = 0
+        self._w_first_index = 0
+        self._w_count = 0
+        self._write_ind = 0
+        super(BlockLog, self).__init__(*args, **kwargs)
+
+    def __str__(self):
+        return 'BlockLog({0}, {1}) at block {2}, entry {3}.'.format(self._fn,
+                self._mode, self._b, self._e)
+
+    @classmethod
+    def is_log(cls, filename):
+        '''Check if a file is a log of this type.'''
+        with open(filename, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+
+    @property
+    def num_blocks(self):
+        '''The number of blocks in the log.'''
+        return len(self._blk_fp)
+
+    def write(self, timestamp, data):
+        chan, payload = self._codec.encode(data)
+        ns = log_index.ts_to_ns(timestamp)
+        sec, nsec = divmod(ns, 1000000000)
+        if not self._w_count:
+            self._w_first_ns = ns
+            self._w_first_index = self._write_ind
+        self._w_buf.append(self.ENTRY_HEADER.pack(self._write_ind, sec, nsec,
+            chan, len(payload)))
+        self._w_buf.append(payload)
+        self._w_size += self.ENTRY_HEADER.size + len(payload)
+        self._w_last_ns = ns
+        self._w_count += 1
+        self._vb_print('Buffered entry {0} at {1}.'.format(self._write_ind,
+            timestamp))
+        self._write_ind += 1
+        if self._w_size >= self._block_size:
+            self._flush_block()
+
+    def read(self, timestamp=None, number=None):
+        res = []
+        if number is not None:
+            if number < 0:
+                raise ValueError
+            self._vb_print('Reading {0} entries.'.format(number))
+            while len(res) < number and not self._eof():
+                res.append(self._read_entry())
+        elif timestamp is not None:
+            if timestamp < 0:
+                raise ValueError
+            self._vb_print('Reading until time stamp {0}.'.format(timestamp))
+            limit = log_index.ts_to_ns(timestamp)
+            while not self._eof():
+                self._load_block(self._b)
+                if self._blk_ns[self._e] > limit:
+                    break
+                res.append(self._read_entry())
+        elif not self._eof():
+            self._vb_print('Reading a single entry.')
+            res.append(self._read_entry())
+        self._vb_print('Finished reading; current position is ' \
+                '{0}.'.format(self))
+        return res
+
+    def rewind(self):
+        self._vb_print('Rewinding log from position {0}.'.format(self))
+        if self._mode == 'r':
+            self._b = 0
+            self._e = 0
+            self._skip_disabled()
+        else:
+            self._file.seek(self._data_start)
+            self._file.truncate()
+            self._clear_blocks()
+            self._w_buf = []
+            self._w_size = 0
+            self._w_count = 0
+            self._write_ind = 0
+
+    def seek(self, timestamp=None, index=None):
+        self._vb_print('Seeking log from position {0}.'.format(self))
+        if index is not None:
+            if index < 0:
+                raise ilog.InvalidIndexError
+            b = max(bisect.bisect_right(self._blk_first_index, index) - 1, 0)
+            self._set_pos(b, index - self._blk_first_index[b])
+        elif timestamp is not None:
+            target = log_index.ts_to_ns(timestamp)
+            b = bisect.bisect_left(self._blk_last_ns, target)
+            if b < self.num_blocks:
+                self._load_block(b)
+                self._set_pos(b, bisect.bisect_left(self._blk_ns, target))
+            else:
+                self._set_pos(b, 0)
+        # Do nothing if neither is set
+        self._skip_disabled()
+        self._vb_print('New current position: {0}.'.format(self))
+
+    def _add_block(self, fp, first_index, count, first_ns, last_ns):
+        self._blk_fp.append(fp)
+        self._blk_first_index.append(first_index)
+        self._blk_count.append(count)
+        self._blk_first_ns.append(first_ns)
+        self._blk_last_ns.append(last_ns)
+
+    def _clear_blocks(self):
+        self._blk_fp = []
+        self._blk_first_index = []
+        self._blk_count = []
+        self._blk_first_ns = []
+        self._blk_last_ns = []
+        self._blk = None
+
+    def _close(self):
+        if not self._is_open:
+            return
+        if self._mode == 'w':
+            self._flush_block()
+            table_fp = self._file.tell()
+            self._file.write(self.TABLE_LEN.pack(self.num_blocks))
+            for b in range(self.num_blocks):
+                self._file.write(self.TABLE_ENTRY.pack(self._blk_fp[b],
+                    self._blk_first_index[b], self._blk_count[b],
+                    self._blk_first_ns[b], self._blk_last_ns[b]))
+            self._file.seek(0)
+            self._file.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION,
+                table_fp))
+            self._vb_print('Wrote block table of {0} blocks at {1}'.format(
+                self.num_blocks, table_fp))
+        self._index = None
+        self._keyframes = None
+        self._file.close()
+        self._is_open = False
+        self._vb_print('Closed file.')
+
+    def _compress(self, data):
+        if self._comp == self.ZLIB:
+            return zlib.compress(data)
+        elif self._comp == self.LZMA:
+            return lzma.compress(data)
+        return data
+
+    def _count_range(self, start, end):
+        if not self.num_blocks:
+            return 0
+        # Indices are consecutive, so the count is the difference between the
+        # indices of the first entries at or after each end of the range,
+        # found by decompressing at most two blocks
+        with self.reader() as r:
+            if start is None:
+                lo = r.start[0]
+            else:
+                r.seek(timestamp=start)
+                lo = r.pos[0]
+            if end is None:
+                hi = r.end[0] + 1
+            else:
+                r.seek(timestamp=log_index.ns_to_ts(
+                    log_index.ts_to_ns(end) + 1))
+                hi = r.pos[0]
+        return max(hi - lo, 0)
+
+    def _decompress(self, comp, data):
+        if comp == self.ZLIB:
+            return zlib.decompress(data)
+        elif comp == self.LZMA:
+            if lzma is None:
+                raise ValueError('LZMA-compressed block in {0}, but LZMA '\
+                        'compression is not available'.format(self._fn))
+            return lzma.decompress(data)
+        return data
+
+    def _eof(self):
+        return self._b >= self.num_blocks
+
+    def _flush_block(self):
+        '''Compress and write the block being written.'''
+        if not self._w_count:
+            return
+        raw = ''.join(self._w_buf)
+        data = self._compress(raw)
+        fp = self._file.tell()
+        self._file.write(self.BLOCK_HEADER.pack(self._comp, len(data),
+            len(raw), self._w_first_index, self._w_count, self._w_first_ns,
+            self._w_last_ns))
+        self._file.write(data)
+        self._add_block(fp, self._w_first_index, self._w_count,
+                self._w_first_ns, self._w_last_ns)
+        self._vb_print('Wrote block of {0} entries, {1} bytes ({2} '\
+                'uncompressed) at {3}.'.format(self._w_count, len(data),
+                    len(raw), fp))
+        self._w_buf = []
+        self._w_size = 0
+        self._w_count = 0
+
+    def _get_cur_pos(self):
+        if self._eof():
+            return self._get_end()[0] + 1, self._get_end()[1]
+        self._load_block(self._b)
+        hdr, offset = self._blk_entries[self._e]
+        return hdr[self.INDEX], self._hdr_ts(hdr)
+
+    def _get_start(self):
+        if not self.num_blocks:
+            return 0, ilog.EntryTS()
+        return (self._blk_first_index[0],
+                log_index.ns_to_ts(self._blk_first_ns[0]))
+
+    def _get_end(self):
+        if not self.num_blocks:
+            return 0, ilog.EntryTS()
+        return (self._blk_first_index[-1] + self._blk_count[-1] - 1,
+                log_index.ns_to_ts(self._blk_last_ns[-1]))
+
+    def _hdr_ts(self, hdr):
+        return ilog.EntryTS(sec=hdr[self.SEC], nsec=hdr[self.NSEC])
+
+    def _init_log(self):
+        if self._mode == 'r':
+            self._vb_print('Initialising log for reading.')
+            self._file.seek(0)
+            magic, ver, table_fp = self.FILE_HEADER.unpack(
+                    self._file.read(self.FILE_HEADER.size))
+            if magic != self.MAGIC or ver != self.VERSION:
+                raise ValueError('Not a block log: {0}'.format(self._fn))
+            meta_len, = self.META_LEN.unpack(
+                    self._file.read(self.META_LEN.size))
+            self._meta = pickle.loads(self._file.read(meta_len))
+            self._data_start = self._file.tell()
+            self._codec = hdrpkl_log.ChannelCodec(self._meta)
+            self._clear_blocks()
+            if table_fp:
+                self._read_table(table_fp)
+            else:
+                self._vb_print('No block table; scanning blocks.')
+                self._scan_blocks()
+            self._vb_print('Read table of {0} blocks.'.format(
+                self.num_blocks))
+            self._b = 0
+            self._e = 0
+        else:
+            self._vb_print('Initialising log for writing.')
+            self._file.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION,
+                0))
+            meta = pickle.dumps(self._meta, pickle.HIGHEST_PROTOCOL)
+            self._file.write(self.META_LEN.pack(len(meta)))
+            self._file.write(meta)
+            self._data_start = self._file.tell()
+            self._codec = hdrpkl_log.ChannelCodec(self._meta)
+            self._write_ind = 0
+
+    def _keyframe(self, timestamp):
+        if self._keyframes is None:
+            self._vb_print('Building index.')
+            self._index = log_index.MemoryIndex(self._scan_entries())
+            self._keyframes = log_index.Keyframes(self._index,
+                    self._kf_interval)
+            self._vb_print('Built keyframes: {0}'.format(self._keyframes))
+        return self._read_indices(self._index.index(pos)
+                for pos in self._keyframes.latest(timestamp, self._chan_nums))
+
+    def _load_block(self, b):
+        '''Decompress a block and read its entry headers.'''
+        if b == self._blk:
+            return
+        self._vb_print('Loading block {0}.'.format(b))
+        self._file.seek(self._blk_fp[b])
+        comp, length, raw_length, first_index, count, first_ns, last_ns = \
+                self.BLOCK_HEADER.unpack(self._file.read(
+                    self.BLOCK_HEADER.size))
+        data = self._decompress(comp, self._file.read(length))
+        entries = []
+        ns = []
+        offset = 0
+        while offset < len(data):
+            hdr = self.ENTRY_HEADER.unpack_from(data, offset)
+            offset += self.ENTRY_HEADER.size
+            entries.append((hdr, offset))
+            ns.append(hdr[self.SEC] * 1000000000 + hdr[self.NSEC])
+            offset += hdr[self.LEN]
+        self._blk = b
+        self._blk_data = data
+        self._blk_entries = entries
+        self._blk_ns = ns
+
+    def _open(self):
+        if self._is_open:
+            return
+        if self._mode == 'r':
+            flags = 'rb'
+        elif self._mode == 'w':
+            flags = 'wb'
+        else:
+            raise NotImplementedError
+        self._file = open(self._fn, flags)
+        self._init_log()
+        self._is_open = True
+        self._vb_print('Opened file {0} in mode {1}.'.format(self._fn,
+            self._mode))
+
+    def _read_entry(self):
+        '''Read the next entry, including its data, and advance past it.'''
+        self._load_block(self._b)
+        hdr, offset = self._blk_entries[self._e]
+        data = self._codec.decode(hdr[self.CHAN],
+                self._blk_data[offset:offset + hdr[self.LEN]])
+        self._set_pos(self._b, self._e + 1)
+        self._skip_disabled()
+        return hdr[self.INDEX], self._hdr_ts(hdr), data
+
+    def _read_table(self, table_fp):
+        self._file.seek(table_fp)
+        num, = self.TABLE_LEN.unpack(self._file.read(self.TABLE_LEN.size))
+        table = self._file.read(num * self.TABLE_ENTRY.size)
+        for b in range(num):
+            self._add_block(*self.TABLE_ENTRY.unpack_from(table,
+                b * self.TABLE_ENTRY.size))
+
+    def _reader(self):
+        return BlockLog(self._fn, mode='r', verbose=self._vb)
+
+    def _scan_blocks(self):
+        '''Rebuild the block table from the block headers.
+
+        An incomplete final block, for example from a log that was not closed,
+        is ignored.
+
+        '''
+        fp = self._data_start
+        self._file.seek(0, os.SEEK_END)
+        file_end = self._file.tell()
+        while fp + self.BLOCK_HEADER.size <= file_end:
+            self._file.seek(fp)
+            comp, length, raw_length, first_index, count, first_ns, \
+                    last_ns = self.BLOCK_HEADER.unpack(self._file.read(
+                        self.BLOCK_HEADER.size))
+            if fp + self.BLOCK_HEADER.size + length > file_end:
+                break
+            self._add_block(fp, first_index, count, first_ns, last_ns)
+            fp += self.BLOCK_HEADER.size + length
+
+    def _scan_entries(self):
+        '''Read the position of every entry in the log, skipping the data.
+
+        Returns a generator of (index, timestamp in nanoseconds, block file
+        position, 0, channel number) tuples, in the form of an index entry.
+        The current position is not changed.
+
+        '''
+        for b in range(self.num_blocks):
+            self._load_block(b)
+            for (hdr, offset), ns in zip(self._blk_entries, self._blk_ns):
+                yield (hdr[self.INDEX], ns, self._blk_fp[b], 0,
+                        hdr[self.CHAN])
+
+    def _set_channels(self, channels):
+        if channels is None:
+            self._chan_nums = None
+        else:
+            self._chan_nums = self._codec.numbers(channels)
+        if self._mode == 'r':
+            self._skip_disabled()
+
+    def _skip_disabled(self):
+        '''Advance past entries of channels not being read, without decoding
+        their data.'''
+        nums = self._chan_nums
+        if nums is None:
+            return
+        while not self._eof():
+            self._load_block(self._b)
+            if self._blk_entries[self._e][0][self.CHAN] in nums:
+                break
+            self._set_pos(self._b, self._e + 1)
+
+    def _set_pos(self, b, e):
+        '''Move to an entry in a block, moving on to the following block if
+        the entry is past the end of the block.'''
+        while b < self.num_blocks and e >= self._blk_count[b]:
+            e -= self._blk_count[b]
+            b += 1
+        if b >= self.num_blocks:
+            b = self.num_blocks
+            e = 0
+        self._b = b
+        self._e = e
+
+
+# vim: tw=79
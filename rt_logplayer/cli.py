@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Command-line log player, for use without a display.
+
+The CORBA and rtshell modules are only imported once the arguments have been
+checked and playback is being set up.
+
+'''
+
+
+import json
+import optparse
+import os
+import sys
+
+import clock
+import instrument
+import log_formats
+import mem_log
+import playback
+import sinks
+
+
+# Exit codes
+EXIT_OK = 0
+# Playback could not be set up or failed
+EXIT_ERROR = 1
+# Invalid command line
+EXIT_USAGE = 2
+# Playback was interrupted before the end
+EXIT_INTERRUPTED = 3
+
+COMMANDS = ['play']
+
+
+def parse_rate(rate):
+    '''Parse a playback rate, which is a positive number or "max".'''
+    if rate.lower() == 'max':
+        return playback.Player.MAX_RATE
+    return playback.check_rate(float(rate))
+
+
+def parse_map(mapping):
+    '''Parse a channel mapping of the form channel=/path/to/comp.rtc:port.
+
+    Returns (channel, rtctree path, port name). ImportError is raised if
+    rtctree is not available.
+
+    '''
+    import rtctree.path
+    chan, sep, target = mapping.partition('=')
+    if not chan or not target:
+        raise ValueError(mapping)
+    path, port = rtctree.path.parse_path(target)
+    if not port:
+        raise ValueError(mapping)
+    return chan, path, port
+
+
+def make_facade(log, maps, verbose=False):
+    '''Create the facade component for a log and connect its ports.
+
+    Returns (tree, manager, component).
+
+    '''
+    import rtctree.tree
+    import rtshell.comp_mgmt
+    import facade_comp
+
+    st, chans = log.metadata
+    for c in chans:
+        c._input = False
+    names = [c.name for c in chans]
+    for chan, path, port in maps:
+        if chan not in names:
+            raise ValueError('No such channel in log: {0}'.format(chan))
+    if maps:
+        paths = [path for chan, path, port in maps]
+        tree = rtctree.tree.RTCTree(paths=paths, filter=paths)
+    else:
+        tree = rtctree.tree.RTCTree(servers=[])
+    comp_name, mgr = rtshell.comp_mgmt.make_comp('rtlp_player', tree,
+            facade_comp.Facade, chans)
+    comp = rtshell.comp_mgmt.find_comp_in_mgr(comp_name, mgr)
+    for ii, (chan, path, port) in enumerate(maps):
+        node = tree.get_node(path)
+        if not node or not node.is_component:
+            raise ValueError('No such component: {0}'.format(
+                '/'.join(path)))
+        tgt = node.get_port_by_name(port)
+        if not tgt:
+            raise ValueError('No such port: {0}:{1}'.format('/'.join(path),
+                port))
+        if not facade_comp.connect_port(comp, chan, tgt, str(ii)):
+            raise ValueError('Failed to connect {0} to {1}:{2}'.format(chan,
+                '/'.join(path), port))
+        if verbose:
+            print >>sys.stderr, 'Connected {0} to {1}:{2}'.format(chan,
+                    '/'.join(path), port)
+    return tree, mgr, comp
+
+
+def play(log, sink, rate, start=None, end=None, instruments=None,
+        catch_up=playback.Player.BURST, catch_up_threshold=0.05, passes=1,
+        channels=None, reverse=False, keyframes=False, verbose=False):
+    '''Play a log, returning a dictionary summarising playback.
+
+    If channels is not None, only the entries of those channels are played.
+    If reverse is True, the log is played backward from end to start.
+    If keyframes is True, the latest entry of each channel before the start
+    time is written before playback begins, and again at the start of each
+    pass.
+
+    '''
+    def show_pos(pos):
+        print >>sys.stderr, 'Position: {0:.3f}'.format(pos)
+
+    p = playback.Player(log, sink, rate=rate,
+            on_pos=show_pos if verbose else None, instruments=instruments,
+            catch_up=catch_up, catch_up_threshold=catch_up_threshold,
+            passes=passes, reverse=reverse, keyframes=keyframes)
+    if reverse:
+        # Play from the end time back to the start time
+        start, end = end, start
+        if start is None:
+            start = p.end[1].float
+    try:
+        if channels is not None:
+            p.set_channels(channels)
+        if start is not None:
+            p.skip_to(start)
+        first = p.pos[1].float
+        wall_start = clock.monotonic()
+        try:
+            finished = p.play(end=end, loop_start=start)
+        except KeyboardInterrupt:
+            finished = False
+        wall_time = clock.monotonic() - wall_start
+        last = p.pos[1].float
+        if end is not None:
+            last = max(last, end) if reverse else min(last, end)
+    finally:
+        p.close()
+    waits, mean_late, max_late, oversleep = p.lateness
+    summary = {'result': 'finished' if finished else 'interrupted',
+            'entries': p.played,
+            'passes': p.passes_done,
+            'skipped': p.skipped,
+            'skipped_channels': p.skipped_channels,
+            'log_start': first,
+            'log_end': last,
+            'log_time': abs(last - first),
+            'wall_time': wall_time,
+            'rate': 'max' if rate is playback.Player.MAX_RATE else rate,
+            'reverse': reverse,
+            'lateness': {'waits': waits, 'mean': mean_late, 'max': max_late}}
+    if wall_time > 0:
+        summary['entries_per_sec'] = p.played / wall_time
+        summary['achieved_rate'] = abs(last - first) / wall_time
+    if instruments:
+        summary['late'] = instruments.late()
+        summary['dropped'] = instruments.dropped()
+    return summary
+
+
+def main(argv=None):
+    usage = '''Usage: %prog [options] play <log file>
+Play a log file without a graphical interface.
+
+Each channel of the log is played to a port of the same name on a placeholder
+component. Ports are connected to targets with --map. When playback ends, a
+JSON summary of throughput and timing error is printed to standard output.
+
+Exit codes: 0 for success, 1 if playback failed, 2 for an invalid command
+line, 3 if playback was interrupted.'''
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-c', '--catch-up', dest='catch_up', action='store',
+            type='choice', default=playback.Player.BURST,
+            choices=playback.Player.CATCH_UP_POLICIES,
+            help='What to do with overdue entries when playback falls behind: '
+            'burst to write them all, latest to write only the newest of '
+            'each channel, or drop-late to skip those later than '
+            '--late-threshold. [Default: %default]')
+    parser.add_option('--channel', dest='channels', action='append',
+            type='string', default=[],
+            help='Play only this channel. Entries of other channels are '
+            'skipped without being decoded. May be given multiple times. '
+            '[Default: the channels given with --map, or all channels if '
+            'there are none]')
+    parser.add_option('-e', '--end', dest='end', action='store',
+            type='float', default=None,
+            help='Log time, in seconds, to end playback at. [Default: end '
+            'of the log]')
+    parser.add_option('-k', '--keyframes', dest='keyframes',
+            action='store_true', default=False,
+            help='Before playing from the start time, send the latest entry '
+            'of each channel before it, so that channels that change rarely '
+            'start with their current value. [Default: %default]')
+    parser.add_option('--late-threshold', dest='late_threshold',
+            action='store', type='float', default=0.05,
+            help='Lateness, in seconds, above which entries are skipped by '
+            'the drop-late catch-up policy. [Default: %default]')
+    parser.add_option('-l', '--loops', dest='loops', action='store',
+            type='int', default=1,
+            help='Number of times to play the log, or 0 to play it '
+            'repeatedly until interrupted. Each pass after the first starts '
+            'from the start time. [Default: %default]')
+    parser.add_option('--map', dest='maps', action='append', type='string',
+            default=[], help='Connect a channel to a port, given as '
+            'channel=/path/to/comp.rtc:port. May be given multiple times.')
+    parser.add_option('--max-memory', dest='max_memory', action='store',
+            type='float', default=512.0,
+            help='Maximum memory, in MB, to use with --preload. If the log '
+            'does not fit, it is played from the file. [Default: %default]')
+    parser.add_option('-m', '--mod', dest='modules', action='append',
+            type='string', default=[],
+            help='Extra modules to import for data types.')
+    parser.add_option('-p', '--path', dest='paths', action='append',
+            type='string', default=[],
+            help='Extra module search paths to add to the PYTHONPATH.')
+    parser.add_option('--preload', dest='preload', action='store_true',
+            default=False, help='Decode the entries between the start and '
+            'end times into memory before playing. [Default: %default]')
+    parser.add_option('-q', '--quiet', dest='quiet', action='store_true',
+            default=False, help='Do not print the summary.')
+    parser.add_option('-r', '--rate', dest='rate', action='store',
+            type='string', default='1',
+            help='Playback rate, or "max" to play as fast as possible. '
+            '[Default: %default]')
+    parser.add_option('-R', '--reverse', dest='reverse', action='store_true',
+            default=False, help='Play backward, from the end time to the '
+            'start time. [Default: %default]')
+    parser.add_option('-s', '--start', dest='start', action='store',
+            type='float', default=None,
+            help='Log time, in seconds, to start playback at. [Default: '
+            'start of the log]')
+    parser.add_option('--overflow', dest='overflow', action='store',
+            type='choice', default=sinks.DROP_OLDEST,
+            choices=sinks.OVERFLOW_POLICIES,
+            help='What to do when a writer thread\'s queue is full: block, '
+            'drop-oldest or drop-newest. [Default: %default]')
+    parser.add_option('--queue-size', dest='queue_size', action='store',
+            type='int', default=100,
+            help='Maximum number of entries queued for each writer thread. '
+            '[Default: %default]')
+    parser.add_option('--stats', dest='stats', action='store',
+            type='string', default=None,
+            help='Save per-channel statistics of decode time, lateness and '
+            'write time to this file at the end of playback, as CSV if its '
+            'name ends in .csv and as JSON otherwise.')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true',
+            default=False, help='Output verbose information. [Default: '
+            '%default]')
+    parser.add_option('-w', '--writer-threads', dest='threaded',
+            action='store_true', default=False,
+            help='Write each channel from its own thread, so that a slow '
+            'target does not delay the other channels. [Default: %default]')
+
+    options, args = parser.parse_args(argv)
+    if len(args) != 2 or args[0] not in COMMANDS:
+        parser.print_usage(sys.stderr)
+        return EXIT_USAGE
+    fn = args[1]
+    try:
+        rate = parse_rate(options.rate)
+    except ValueError:
+        print >>sys.stderr, '{0}: Invalid rate: {1}'.format(
+                os.path.basename(sys.argv[0]), options.rate)
+        return EXIT_USAGE
+    if options.loops < 0:
+        print >>sys.stderr, '{0}: Invalid number of loops: {1}'.format(
+                os.path.basename(sys.argv[0]), options.loops)
+        return EXIT_USAGE
+    if options.queue_size < 1:
+        print >>sys.stderr, '{0}: Invalid queue size: {1}'.format(
+                os.path.basename(sys.argv[0]), options.queue_size)
+        return EXIT_USAGE
+
+    sys.path = options.paths + sys.path
+    try:
+        maps = [parse_map(m) for m in options.maps]
+    except ValueError, e:
+        print >>sys.stderr, '{0}: Invalid mapping: {1}'.format(
+                os.path.basename(sys.argv[0]), e)
+        return EXIT_USAGE
+    except ImportError, e:
+        print >>sys.stderr, '{0}: Cannot map channels: {1}'.format(
+                os.path.basename(sys.argv[0]), e)
+        return EXIT_ERROR
+    if options.channels:
+        channels = options.channels
+    elif maps:
+        channels = sorted(set(chan for chan, path, port in maps))
+    else:
+        channels = None
+
+    try:
+        if options.modules:
+            # Data types must be available before the log can be read
+            import rtshell.modmgr
+            rtshell.modmgr.ModuleMgr().load_mods_and_poas(options.modules)
+        log = log_formats.open_log(fn,
+                sidecar=options.start is not None or bool(channels) or
+                options.reverse or options.keyframes,
+                mmap=True, verbose=options.verbose)
+    except Exception, e:
+        print >>sys.stderr, '{0}: {1}'.format(os.path.basename(sys.argv[0]),
+                e)
+        return EXIT_ERROR
+    file_log = log
+    if channels is not None:
+        names = [c.name for c in log.metadata[1]]
+        for c in channels:
+            if c not in names:
+                print >>sys.stderr, '{0}: No such channel in log: {1}'.format(
+                        os.path.basename(sys.argv[0]), c)
+                log.close()
+                return EXIT_USAGE
+        # Set before preloading, so that other channels are not loaded
+        log.set_channels(channels)
+    if options.preload:
+        try:
+            log = mem_log.preload(file_log, start=options.start,
+                    end=options.end,
+                    max_bytes=int(options.max_memory * 1024 * 1024),
+                    verbose=options.verbose)
+        except mem_log.TooLargeError, e:
+            print >>sys.stderr, '{0}: {1}; playing from the file'.format(
+                    os.path.basename(sys.argv[0]), e)
+        except Exception, e:
+            print >>sys.stderr, '{0}: {1}'.format(
+                    os.path.basename(sys.argv[0]), e)
+            file_log.close()
+            return EXIT_ERROR
+    mgr = None
+    try:
+        tree, mgr, comp = make_facade(log, maps, verbose=options.verbose)
+        instr = instrument.Instruments() if options.stats else None
+        sink = sinks.FacadeSink(comp)
+        if options.threaded:
+            sink = sinks.ThreadedSink(sink, queue_size=options.queue_size,
+                    overflow=options.overflow, instruments=instr)
+        try:
+            summary = play(log, sink, rate, start=options.start,
+                    end=options.end, instruments=instr,
+                    catch_up=options.catch_up,
+                    catch_up_threshold=options.late_threshold,
+                    passes=options.loops or playback.Player.LOOP_FOREVER,
+                    channels=channels, reverse=options.reverse,
+                    keyframes=options.keyframes, verbose=options.verbose)
+        finally:
+            # Finish writing queued entries before the component is destroyed
+            sink.close()
+        if options.threaded:
+            summary['writers'] = sink.lag()
+        if instr:
+            instr.save(options.stats)
+    except Exception, e:
+        if options.verbose:
+            import traceback
+            traceback.print_exc()
+        print >>sys.stderr, '{0}: {1}'.format(os.path.basename(sys.argv[0]),
+                e)
+        return EXIT_ERROR
+    finally:
+        if mgr:
+            import rtshell.comp_mgmt
+            tree.give_away_orb()
+            rtshell.comp_mgmt.shutdown(mgr)
+        if log is not file_log:
+            log.close()
+        file_log.close()
+
+    summary['log'] = fn
+    summary['preloaded'] = log is not file_log
+    if not options.quiet:
+        print json.dumps(summary, sort_keys=True)
+    if summary['result'] != 'finished':
+        return EXIT_INTERRUPTED
+    return EXIT_OK
+
+
+# vim: tw=79
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Monotonic clock.
+
+'''
+
+
+import ctypes
+import ctypes.util
+import sys
+import time
+
+
+def _posix_monotonic():
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    if sys.platform.startswith('linux'):
+        clock_id = 1 # CLOCK_MONOTONIC
+    elif sys.platform == 'darwin':
+        clock_id = 6 # CLOCK_MONOTONIC
+    else:
+        return None
+    lib = ctypes.util.find_library('rt') or ctypes.util.find_library('c')
+    if not lib:
+        return None
+    try:
+        clock_gettime = ctypes.CDLL(lib, use_errno=True).clock_gettime
+    except (OSError, AttributeError):
+        return None
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+    def monotonic():
+        # Each call has its own result, as the clock is read from many threads
+        ts = timespec()
+        if clock_gettime(clock_id, ctypes.byref(ts)) != 0:
+            raise OSError(ctypes.get_errno())
+        return ts.tv_sec + ts.tv_nsec * 1e-9
+    try:
+        monotonic()
+    except OSError:
+        return None
+    return monotonic
+
+
+def _windows_monotonic():
+    try:
+        kernel32 = ctypes.windll.kernel32
+    except AttributeError:
+        return None
+    freq = ctypes.c_int64()
+    if not kernel32.QueryPerformanceFrequency(ctypes.byref(freq)):
+        return None
+    period = 1.0 / freq.value
+
+    def monotonic():
+        count = ctypes.c_int64()
+        kernel32.QueryPerformanceCounter(ctypes.byref(count))
+        return count.value * period
+    return monotonic
+
+
+def _find_monotonic():
+    '''Find the best available monotonic clock.
+
+    Falls back to time.time(), which is not monotonic, if no monotonic clock
+    can be found.
+
+    '''
+    if hasattr(time, 'monotonic'):
+        return time.monotonic
+    if sys.platform == 'win32':
+        return _windows_monotonic() or time.time
+    return _posix_monotonic() or time.time
+
+
+# Get the time in seconds from a clock that is not affected by changes to the
+# system time. Only the difference between two values is meaningful.
+monotonic = _find_monotonic()
+
+
+# vim: tw=79
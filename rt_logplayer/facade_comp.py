@@ -19,6 +19,7 @@ Facade component - provides a front to create some ports on.
 '''
 
 import RTC
+import rtctree.utils
 import rtshell.gen_comp
 
 
@@ -36,3 +37,29 @@ class Facade(rtshell.gen_comp.GenComp):
     def ports(self):
         return self._ports
 
+
+def connect_port(comp, chan_name, tgt, conn_id):
+    '''Connect a channel's port on a facade component to another port.
+
+    @param comp The facade component's object.
+    @param chan_name The name of the channel.
+    @param tgt The rtctree port object to connect to.
+    @param conn_id The ID to give the connection.
+    @return True if the connection was made.
+
+    '''
+    def find_local_port(name, ports):
+        for p in ports:
+            if p.get_port_profile().name.split('.')[-1] == name:
+                return p
+
+    props = {'dataport.dataflow_type': 'push',
+            'dataport.interface_type': 'corba_cdr',
+            'dataport.subscription_type': 'new',
+            'dataport.data_type': tgt.properties['dataport.data_type']}
+    local_port = find_local_port(chan_name, comp.get_ports())
+    prof = RTC.ConnectorProfile(chan_name + '_' + tgt.name, conn_id,
+            [local_port, tgt.object], rtctree.utils.dict_to_nvlist(props))
+    res, connector = local_port.connect(prof)
+    return res == RTC.RTC_OK
+
@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Pickle-based log with binary entry headers.
+
+'''
+
+
+import struct
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import ilog
+import log_index
+
+
+###############################################################################
+## Channel-based data encoding
+##
+## If the log metadata is the usual (start time, port specifications) pair and
+## an entry's data is a (port name, value) pair, the data is stored as the
+## number of the port in the metadata (the channel) and the pickled value.
+## Otherwise, the channel is NO_CHANNEL and all the data is pickled.
+
+class ChannelCodec(object):
+    # Channel value for data not sent by a known port
+    NO_CHANNEL = -1
+
+    def __init__(self, meta):
+        super(ChannelCodec, self).__init__()
+        try:
+            start_time, port_specs = meta
+            self._chans = [p.name for p in port_specs]
+        except (TypeError, ValueError, AttributeError):
+            self._chans = []
+        self._chan_ids = dict([(n, ii) for ii, n in enumerate(self._chans)])
+
+    @property
+    def channels(self):
+        '''The channel names, in channel number order.'''
+        return self._chans
+
+    def numbers(self, names):
+        '''Get the set of channel numbers of some channel names.
+
+        Names that are not channels are ignored.
+
+        '''
+        return frozenset(self._chan_ids[n] for n in names
+                if n in self._chan_ids)
+
+    def decode(self, chan, payload):
+        '''Unpickle the data of an entry.'''
+        data = pickle.loads(payload)
+        if chan == self.NO_CHANNEL:
+            return data
+        return self._chans[chan], data
+
+    def encode(self, data):
+        '''Get the channel and pickled data for an entry.'''
+        chan = self.number(data)
+        if chan == self.NO_CHANNEL:
+            value = data
+        else:
+            value = data[1]
+        return chan, pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def number(self, data):
+        '''Get the channel number of an entry's data.'''
+        try:
+            name, value = data
+            return self._chan_ids.get(name, self.NO_CHANNEL)
+        except (TypeError, ValueError):
+            return self.NO_CHANNEL
+
+
+###############################################################################
+## Header/payload pickle-based log object. Each entry has a small fixed-size
+## binary header in front of its pickled data, so the log can be scanned and
+## searched without unpickling any data.
+##
+## The format is as follows:
+## File header: (magic, version, file position of the final entry)
+## Metadata length, followed by the pickled metadata
+## [Data entries: (Entry header, pickled data)]
+##
+## Entry headers are (index, seconds, nanoseconds, channel, data length,
+## previous entry file position). The data is encoded by ChannelCodec.
+##
+## The file position of the final entry is written when the log is closed. If
+## it is zero, the log will be scanned to find the final entry.
+##
+## Keyframes (see log_index.Keyframes) are built every keyframe_interval
+## seconds from the index, which is built from the entry headers if the log
+## was opened without one, the first time they are needed.
+##
+## Readers (see ilog.Log.reader), which are also used for random access and
+## range iteration, open the file again and share the index if there is one.
+## Entries are counted from the index, or from the entry headers if there is
+## none.
+
+class HeaderPickleLog(ilog.Log):
+    MAGIC = 'RTLPHDR1'
+    VERSION = 1
+    FILE_HEADER = struct.Struct('<8sIq')
+    META_LEN = struct.Struct('<Q')
+    ENTRY_HEADER = struct.Struct('<qqIiQq')
+    # Indices in entry headers
+    INDEX = 0
+    SEC = 1
+    NSEC = 2
+    CHAN = 3
+    LEN = 4
+    PREV = 5
+
+    def __init__(self, filename='', *args, **kwargs):
+        self._is_open = False
+        self._fn = filename
+        index = kwargs.pop('index', False)
+        if isinstance(index, log_index.EntryIndex):
+            # Shared with the log this is a reader of, which closes it
+            self._index = index
+            self._own_index = False
+        else:
+            self._index = None
+            self._own_index = True
+        self._use_index = self._index is not None or bool(index)
+        self._kf_interval = log_index.check_keyframe_interval(
+                kwargs.pop('keyframe_interval', log_index.KEYFRAME_INTERVAL))
+        self._keyframes = None
+        self._codec = None
+        # The channel numbers to read, or None for all
+        self._chan_nums = None
+        self._data_start = 0
+        # File position and header of the next entry to be read
+        self._fp = 0
+        self._next = None
+        # File positions and headers of the first and final entries
+        self._start_fp = 0
+        self._start = None
+        self._end_fp = 0
+        self._end = None
+        self._write_ind = 0
+        self._prev_pos = 0
+        super(HeaderPickleLog, self).__init__(*args, **kwargs)
+
+    def __str__(self):
+        return 'HeaderPickleLog({0}, {1}) at position {2}.'.format(self._fn,
+                self._mode, self._fp)
+
+    @classmethod
+    def is_log(cls, filename):
+        '''Check if a file is a log of this type.'''
+        with open(filename, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+
+    def write(self, timestamp, data):
+        chan, payload = self._codec.encode(data)
+        sec, nsec = divmod(log_index.ts_to_ns(timestamp), 1000000000)
+        hdr = (self._write_ind, sec, nsec, chan, len(payload), self._prev_pos)
+        fp = self._file.tell()
+        self._file.write(self.ENTRY_HEADER.pack(*hdr))
+        self._file.write(payload)
+        self._prev_pos = fp
+        self._end_fp = fp
+        self._end = hdr
+        self._write_ind += 1
+        self._vb_print('Wrote entry at ({0}, {1}, {2}, {3}).'.format(
+            hdr[self.INDEX], timestamp, fp, hdr[self.PREV]))
+
+    def read(self, timestamp=None, number=None):
+        res = []
+        if number is not None and number < 0:
+            raise ValueError
+        if number is None and timestamp is not None and timestamp < 0:
+            raise ValueError
+        try:
+            if number is not None:
+                self._vb_print('Reading {0} entries.'.format(number))
+                while self._next and len(res) < number:
+                    res.append(self._read_entry())
+            elif timestamp is not None:
+                self._vb_print('Reading until time stamp {0}.'.format(
+                    timestamp))
+                limit = log_index.ts_to_ns(timestamp)
+                while self._next and self._hdr_ns(self._next) <= limit:
+                    res.append(self._read_entry())
+            elif self._next:
+                self._vb_print('Reading a single entry.')
+                res.append(self._read_entry())
+        except ilog.EndOfLogError:
+            # The data of the final entry is incomplete, as in a log that was
+            # not closed; treat the log as ending before it
+            self._vb_print('End of log while reading entry data.')
+            self._next = None
+        self._vb_print('Finished reading; current position is ' \
+                '{0}.'.format(self._fp))
+        return res
+
+    def rewind(self):
+        self._vb_print('Rewinding log from position {0}.'.format(self._fp))
+        if self._mode == 'r':
+            self._seek_to_fp(self._start_fp)
+            self._skip_disabled()
+        else:
+            self._file.seek(self._data_start)
+            self._file.truncate()
+            self._write_ind = 0
+            self._prev_pos = 0
+            self._end_fp = 0
+            self._end = None
+
+    def seek(self, timestamp=None, index=None):
+        self._vb_print('Seeking log from position {0}.'.format(self._fp))
+        if index is not None:
+            if index < 0:
+                raise ilog.InvalidIndexError
+            if self._index:
+                self._seek_to_index_pos(self._index.find_index(index))
+            else:
+                self._seek_linear(lambda hdr: hdr[self.INDEX], index)
+        elif timestamp is not None:
+            if self._index:
+                self._seek_to_index_pos(self._index.find_ts(timestamp))
+            else:
+                self._seek_linear(self._hdr_ns,
+                        log_index.ts_to_ns(timestamp))
+        # Do nothing if neither is set
+        self._skip_disabled()
+        self._vb_print('New current position: {0}.'.format(self._fp))
+
+    def _backup_one(self):
+        '''Reverses in the log one entry, reading only the header.'''
+        if self._next is None:
+            self._seek_to_fp(self._end_fp)
+        elif self._fp != self._start_fp:
+            self._seek_to_fp(self._next[self.PREV])
+
+    def _close(self):
+        if not self._is_open:
+            return
+        if self._index:
+            if self._own_index:
+                self._index.close()
+            self._index = None
+        self._keyframes = None
+        if self._mode == 'w':
+            # Go back to the beginning and write the end position
+            self._file.seek(0)
+            self._file.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION,
+                self._end_fp))
+            self._vb_print('Wrote end pointer: {0}'.format(self._end_fp))
+        self._file.close()
+        self._is_open = False
+        self._vb_print('Closed file.')
+
+    def _count_range(self, start, end):
+        if self._index:
+            return self._index.count_ts(start, end)
+        # Count from the entry headers, without reading any data
+        lo = None if start is None else log_index.ts_to_ns(start)
+        hi = None if end is None else log_index.ts_to_ns(end)
+        count = 0
+        with self.reader() as r:
+            for index, ns, fp, prev, chan in r._scan_entries():
+                if hi is not None and ns > hi:
+                    break
+                if lo is None or ns >= lo:
+                    count += 1
+        return count
+
+    def _eof(self):
+        return self._next is None
+
+    def _get_cur_pos(self):
+        if self._next is None:
+            if self._end is None:
+                return 0, ilog.EntryTS()
+            return self._end[self.INDEX] + 1, self._hdr_ts(self._end)
+        return self._next[self.INDEX], self._hdr_ts(self._next)
+
+    def _get_start(self):
+        return self._start[self.INDEX], self._hdr_ts(self._start)
+
+    def _get_end(self):
+        return self._end[self.INDEX], self._hdr_ts(self._end)
+
+    def _hdr_ns(self, hdr):
+        return hdr[self.SEC] * 1000000000 + hdr[self.NSEC]
+
+    def _hdr_ts(self, hdr):
+        return ilog.EntryTS(sec=hdr[self.SEC], nsec=hdr[self.NSEC])
+
+    def _init_log(self):
+        if self._mode == 'r':
+            self._vb_print('Initialising log for reading.')
+            self._file.seek(0)
+            magic, ver, self._end_fp = self.FILE_HEADER.unpack(
+                    self._file.read(self.FILE_HEADER.size))
+            if magic != self.MAGIC or ver != self.VERSION:
+                raise ValueError('Not a header pickle log: {0}'.format(
+                    self._fn))
+            meta_len, = self.META_LEN.unpack(
+                    self._file.read(self.META_LEN.size))
+            self._meta = pickle.loads(self._file.read(meta_len))
+            self._data_start = self._file.tell()
+            self._codec = ChannelCodec(self._meta)
+            if self._use_index and self._index is None:
+                self._vb_print('Building index.')
+                self._index = log_index.MemoryIndex(self._scan_entries())
+                self._vb_print('Built index: {0}'.format(self._index))
+            self._start_fp = self._data_start
+            self._start = self._read_header_at(self._start_fp)
+            if self._index:
+                self._end_fp = self._index.fp(len(self._index) - 1)
+            elif not self._end_fp:
+                self._vb_print('No end pointer; scanning for final entry.')
+                for index, ts, fp, prev, chan in self._scan_entries():
+                    self._end_fp = fp
+            self._end = self._read_header_at(self._end_fp)
+            self._vb_print('Read end position: {0}'.format(self._end))
+            self._seek_to_fp(self._start_fp)
+        else:
+            self._vb_print('Initialising log for writing.')
+            self._file.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION,
+                0))
+            meta = pickle.dumps(self._meta, pickle.HIGHEST_PROTOCOL)
+            self._file.write(self.META_LEN.pack(len(meta)))
+            self._file.write(meta)
+            self._data_start = self._file.tell()
+            self._codec = ChannelCodec(self._meta)
+            self._write_ind = 0
+            self._prev_pos = 0
+
+    def _keyframe(self, timestamp):
+        if not self._index:
+            self._vb_print('Building index.')
+            self._index = log_index.MemoryIndex(self._scan_entries())
+        if self._keyframes is None:
+            self._keyframes = log_index.Keyframes(self._index,
+                    self._kf_interval)
+            self._vb_print('Built keyframes: {0}'.format(self._keyframes))
+        return self._read_indices(self._index.index(pos)
+                for pos in self._keyframes.latest(timestamp, self._chan_nums))
+
+    def _open(self):
+        if self._is_open:
+            return
+        if self._mode == 'r':
+            flags = 'rb'
+        elif self._mode == 'w':
+            flags = 'wb'
+        else:
+            raise NotImplementedError
+        self._file = open(self._fn, flags)
+        self._init_log()
+        self._is_open = True
+        self._vb_print('Opened file {0} in mode {1}.'.format(self._fn,
+            self._mode))
+
+    def _read_entry(self):
+        '''Read the next entry, including its data, and advance past it.
+
+        The file must be positioned at the start of the next entry's data.
+
+        '''
+        hdr = self._next
+        payload = self._file.read(hdr[self.LEN])
+        if len(payload) != hdr[self.LEN]:
+            raise ilog.EndOfLogError
+        self._fp += self.ENTRY_HEADER.size + hdr[self.LEN]
+        self._next = self._read_header()
+        self._skip_disabled()
+        return (hdr[self.INDEX], self._hdr_ts(hdr),
+                self._codec.decode(hdr[self.CHAN], payload))
+
+    def _read_header(self):
+        '''Read an entry header at the current file position.
+
+        Returns None if there is no complete header.
+
+        '''
+        buf = self._file.read(self.ENTRY_HEADER.size)
+        if len(buf) != self.ENTRY_HEADER.size:
+            return None
+        return self.ENTRY_HEADER.unpack(buf)
+
+    def _read_header_at(self, fp):
+        '''Read the entry header at a file position without moving.'''
+        current = self._file.tell()
+        self._file.seek(fp)
+        hdr = self._read_header()
+        self._file.seek(current)
+        return hdr
+
+    def _reader(self):
+        return HeaderPickleLog(self._fn, mode='r', index=self._index or False,
+                verbose=self._vb)
+
+    def _scan_entries(self):
+        '''Read the position of every entry in the log, skipping the data.
+
+        Returns a generator of (index, timestamp in nanoseconds, file
+        position, previous file position, channel number) tuples. The current
+        position is not changed.
+
+        '''
+        current = self._file.tell()
+        try:
+            fp = self._data_start
+            self._file.seek(fp)
+            hdr = self._read_header()
+            while hdr:
+                yield (hdr[self.INDEX], self._hdr_ns(hdr), fp, hdr[self.PREV],
+                        hdr[self.CHAN])
+                fp += self.ENTRY_HEADER.size + hdr[self.LEN]
+                self._file.seek(fp)
+                hdr = self._read_header()
+        finally:
+            self._file.seek(current)
+
+    def _set_channels(self, channels):
+        if channels is None:
+            self._chan_nums = None
+        else:
+            self._chan_nums = self._codec.numbers(channels)
+        if self._mode == 'r':
+            self._skip_disabled()
+
+    def _skip_disabled(self):
+        '''Advance past entries of channels not being read, reading only their
+        headers.'''
+        nums = self._chan_nums
+        if nums is None:
+            return
+        while self._next and self._next[self.CHAN] not in nums:
+            self._skip_entry()
+
+    def _seek_linear(self, key, target):
+        '''Seek by following entry headers.
+
+        Moves to the first entry for which key(header) >= target.
+
+        '''
+        # Rewind to an entry at or before the target
+        while (self._next is None or key(self._next) > target) and \
+                self._fp != self._start_fp:
+            self._backup_one()
+        # Fast-forward to the first entry at or after the target
+        while self._next and key(self._next) < target:
+            self._skip_entry()
+
+    def _seek_to_fp(self, fp):
+        '''Move to the entry at a file position.'''
+        self._file.seek(fp)
+        self._fp = fp
+        self._next = self._read_header()
+
+    def _seek_to_index_pos(self, pos):
+        '''Move to the entry at a position in the index.'''
+        if pos < len(self._index):
+            self._seek_to_fp(self._index.fp(pos))
+        else:
+            self._seek_to_fp(self._end_fp)
+            self._skip_entry()
+
+    def _skip_entry(self):
+        '''Advance past the next entry without reading its data.'''
+        self._fp += self.ENTRY_HEADER.size + self._next[self.LEN]
+        self._file.seek(self._fp)
+        self._next = self._read_header()
+
+
+# vim: tw=79
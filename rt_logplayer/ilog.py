@@ -19,7 +19,9 @@ Log interface.
 '''
 
 
+import contextlib
 import sys
+import threading
 
 
 ###############################################################################
@@ -38,101 +40,155 @@ class InvalidIndexError(EOFError):
 ###############################################################################
 ## Entry timestamps
 
+def to_ns(value):
+    '''Convert a time stamp or a number of seconds to integer nanoseconds.
+
+    The time stamp may be an EntryTS or anything else with sec and nsec
+    attributes. Numbers of seconds are truncated to whole nanoseconds.
+
+    '''
+    t = type(value)
+    if t is EntryTS:
+        return value._ns
+    elif t is float:
+        return int(value * 1e9)
+    elif t is int or t is long:
+        return value * 1000000000
+    elif hasattr(value, 'nsec'):
+        return value.sec * 1000000000 + value.nsec
+    return int(value * 1000000000)
+
+
 class EntryTS(object):
+    '''The time stamp of a log entry, as an integer number of nanoseconds.
+
+    Time stamps are ordered with each other and with numbers of seconds, but
+    are only equal to other time stamps: many numbers of seconds truncate to
+    the same time stamp, so no hash could match all of them. They are pickled
+    with the same state as the original sec/nsec implementation, so logs
+    written with either can be read with the other.
+
+    '''
+    __slots__ = ('_ns',)
+
     def __init__(self, sec=0, nsec=0, time=None):
-        super(EntryTS, self).__init__()
         if time is not None:
-            self._sec, self._nsec = self._get_values(time)
+            self._ns = to_ns(time)
         else:
-            self._sec = sec
-            self._nsec = nsec
+            self._ns = sec * 1000000000 + nsec
+
+    @classmethod
+    def from_ns(cls, ns):
+        '''Make a time stamp from an integer number of nanoseconds.'''
+        ts = cls.__new__(cls)
+        ts._ns = ns
+        return ts
+
+    def __getstate__(self):
+        sec, nsec = divmod(self._ns, 1000000000)
+        return {'_sec': sec, '_nsec': nsec}
+
+    def __setstate__(self, state):
+        self._ns = state['_sec'] * 1000000000 + state['_nsec']
+
+    def __hash__(self):
+        return hash(self._ns)
 
     def __repr__(self):
-        return 'EntryTS(_sec={0}, _nsec={1})'.format(self._sec, self._nsec)
+        sec, nsec = divmod(self._ns, 1000000000)
+        return 'EntryTS(_sec={0}, _nsec={1})'.format(sec, nsec)
 
     def __str__(self):
-        return '{0}.{1:09}'.format(self._sec, self._nsec)
+        return '{0}.{1:09}'.format(*divmod(self._ns, 1000000000))
 
     def __lt__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec < sec:
-            return True
-        elif self._sec == sec:
-            if self._nsec < nsec:
-                return True
-        return False
+        if type(other) is EntryTS:
+            return self._ns < other._ns
+        return self._ns < to_ns(other)
 
     def __le__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec < sec:
-            return True
-        elif self._sec == sec:
-            if self._nsec <= nsec:
-                return True
-        return False
+        if type(other) is EntryTS:
+            return self._ns <= other._ns
+        return self._ns <= to_ns(other)
 
     def __eq__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec == sec and self._nsec == nsec:
-            return True
+        if type(other) is EntryTS:
+            return self._ns == other._ns
         return False
 
     def __ne__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec != sec or self._nsec != nsec:
-            return True
-        return False
+        if type(other) is EntryTS:
+            return self._ns != other._ns
+        return True
 
     def __gt__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec > sec:
-            return True
-        elif self._sec == sec:
-            if self._nsec > nsec:
-                return True
-        return False
+        if type(other) is EntryTS:
+            return self._ns > other._ns
+        return self._ns > to_ns(other)
 
     def __ge__(self, other):
-        sec, nsec = self._get_values(other)
-        if self._sec > sec:
-            return True
-        elif self._sec == sec:
-            if self._nsec >= nsec:
-                return True
-        return False
+        if type(other) is EntryTS:
+            return self._ns >= other._ns
+        return self._ns >= to_ns(other)
 
     @property
     def float(self):
         '''Get the time value as a float.'''
-        return float(self._sec) + float(self._nsec) / 1e9
+        return self._ns / 1e9
+
+    @property
+    def ns(self):
+        '''Get the time value as an integer number of nanoseconds.'''
+        return self._ns
 
     @property
     def sec(self):
-        return self._sec
+        return self._ns // 1000000000
 
     @sec.setter
     def sec(self, sec):
-        self._sec = sec
+        self._ns = sec * 1000000000 + self._ns % 1000000000
 
     @property
     def nsec(self):
-        return self._nsec
+        return self._ns % 1000000000
 
     @nsec.setter
     def nsec(self, nsec):
-        self._nsec = nsec
+        self._ns = self._ns // 1000000000 * 1000000000 + nsec
+
+
+# Classes to unpickle in place of others: (module, name): class. Logs written
+# by rtshell's rtlog hold its own EntryTS, which is read as this one.
+PICKLE_CLASSES = {('rtshell.ilog', 'EntryTS'): EntryTS}
 
-    def _get_values(self, other):
-        if type(other) == EntryTS:
-            return other.sec, other.nsec
-        else:
-            return int(other), int((other * 1000000000) % 1000000000)
+
+def find_global(module, name):
+    '''Find a class being unpickled, replacing those in PICKLE_CLASSES.
+
+    For use as the find_global attribute of a cPickle.Unpickler.
+
+    '''
+    cls = PICKLE_CLASSES.get((module, name))
+    if cls is not None:
+        return cls
+    __import__(module)
+    return getattr(sys.modules[module], name)
 
 
 ###############################################################################
 ## Log interface. All loggers must conform to this.
 
+# Number of entries read at a time by the iterators of Log.iter_range
+RANGE_BLOCK = 100
+# Maximum number of idle readers a log keeps for reuse
+READER_POOL_SIZE = 4
+
+
 class Log(object):
+    # Idle readers, or None once the log is closed
+    _pool = None
+
     def __init__(self, mode='r', meta=None, verbose=False, *args, **kwargs):
         '''Base constructor.
 
@@ -154,6 +210,10 @@ class Log(object):
         self._mode = mode
         self._meta = meta
         self._vb = verbose
+        # The names of the channels to read, or None for all
+        self._channels = None
+        self._pool = []
+        self._pool_lock = threading.Lock()
         self.open()
 
     def __del__(self):
@@ -181,6 +241,11 @@ class Log(object):
     def __str__(self):
         return 'Log interface object.'
 
+    @property
+    def channels(self):
+        '''The names of the channels being read, or None for all channels.'''
+        return self._channels
+
     @property
     def end(self):
         '''The position of the final entry in the log.
@@ -264,8 +329,110 @@ class Log(object):
         '''
         if finalise:
             self.finalise()
+        self._close_pool()
         self._close()
 
+    def count_range(self, start=None, end=None):
+        '''Count the entries between two times, inclusive.
+
+        The current position is not changed. Logs count from their index
+        where they have one, without reading any entries.
+
+        @param start The time of the first entry to count, or None to count
+                     from the start of the log.
+        @param end The time of the last entry to count, or None to count to
+                   the end of the log.
+        @return The number of entries of all channels.
+
+        '''
+        return self._count_range(start, end)
+
+    def entry_at(self, index):
+        '''Read the entry with an index, without changing the current
+        position.
+
+        @param index The index of the entry.
+        @return An (index, timestamp, data) tuple.
+
+        InvalidIndexError is raised if there is no entry with the index.
+
+        '''
+        return self._entry_at(index)
+
+    def iter_range(self, start=None, end=None, channels=None):
+        '''Iterate over the entries between two times, inclusive.
+
+        The iterator reads from a reader of the log (see @ref reader), taken
+        when iteration starts and returned when it finishes or the iterator
+        is closed, so it has its own position. Any number of iterators may be
+        used at once, in any threads, while the log itself is read. The
+        current position and channels of the log are not used or changed.
+        The log must not be closed while an iterator is in use.
+
+        @param start The time of the first entry, or None to start at the
+                     start of the log.
+        @param end The time of the last entry, or None to continue to the end
+                   of the log.
+        @param channels A sequence of the names of the channels to read
+                        entries of, or None to read all entries.
+        @return An iterator of (index, timestamp, data) tuples.
+
+        '''
+        if channels is not None:
+            channels = frozenset(channels)
+        return self._iter_range(start, end, channels)
+
+    def keyframe(self, timestamp):
+        '''Read the latest entry before a time of each channel being read.
+
+        These are the entries that give the state of every channel at the
+        time. Entries with no channel are not included. Logs find them using
+        a keyframe table of their index where they have one, building it the
+        first time it is needed. The current position is changed, so the log
+        should be moved to where reading is to continue afterwards.
+
+        @param timestamp The time.
+        @return A list of (index, timestamp, data) tuples, in log order.
+
+        '''
+        return self._keyframe(timestamp)
+
+    @contextlib.contextmanager
+    def reader(self):
+        '''Borrow a reader of the log, for use in a with statement.
+
+        The reader is a Log of the same type, reading the same file, with its
+        own file handle and position. Anything read-only, such as the index,
+        is shared with this log. It is positioned at the start of the log and
+        reads all channels. Readers are kept in a pool and reused, so each
+        thread, such as one showing information about the log while another
+        plays it, can read without disturbing the others. A reader must only
+        be used within the with statement, and must not be closed.
+
+        '''
+        r = self._acquire_reader()
+        try:
+            yield r
+        finally:
+            self._release_reader(r)
+
+    def set_channels(self, channels):
+        '''Restrict reading to the entries of some channels.
+
+        Entries of other channels, and entries with no channel, are skipped
+        by @ref read and by seeks, as if they were not in the log. Logs skip
+        them without decoding their data where the format allows. The current
+        position moves forward past any entries that are skipped.
+
+        @param channels A sequence of channel names, or None to read all
+                        entries.
+
+        '''
+        if channels is not None:
+            channels = frozenset(channels)
+        self._channels = channels
+        self._set_channels(channels)
+
     def write(self, timestamp, data):
         '''Writes an entry to the log.
 
@@ -319,9 +486,133 @@ class Log(object):
         '''
         raise NotImplementedError
 
+    def _acquire_reader(self):
+        '''Take a reader from the pool, or open one if none are idle.'''
+        with self._pool_lock:
+            if self._pool:
+                return self._pool.pop()
+        return self._reader()
+
     def _close(self):
         raise NotImplementedError
 
+    def _close_pool(self):
+        '''Close the idle readers. Readers in use are closed when returned.'''
+        if self._pool is None:
+            return
+        with self._pool_lock:
+            pool = self._pool
+            self._pool = None
+        for r in pool or []:
+            r.close()
+
+    def _count_range(self, start, end):
+        '''Count the entries between two times.
+
+        May be implemented by implementation objects that can count entries
+        without reading them. Called by @ref count_range.
+
+        '''
+        return sum(1 for e in self._iter_range(start, end, None))
+
+    def _entry_at(self, index):
+        '''Read the entry with an index using a reader.
+
+        May be overridden by implementation objects that can read an entry
+        without one. Called by @ref entry_at.
+
+        '''
+        with self.reader() as r:
+            r.seek(index=index)
+            entries = r.read()
+        if not entries or entries[0][0] != index:
+            raise InvalidIndexError
+        return entries[0]
+
+    def _iter_range(self, start, end, channels):
+        '''Generate the entries between two times using a reader.
+
+        May be overridden by implementation objects that can read entries
+        without one. Called by @ref iter_range.
+
+        '''
+        # Not a with statement, so that the reader is returned to the pool
+        # when the generator is closed early
+        r = self._acquire_reader()
+        try:
+            if channels is not None:
+                r.set_channels(channels)
+            if start is not None:
+                r.seek(timestamp=start)
+            while True:
+                entries = r.read(number=RANGE_BLOCK)
+                if not entries:
+                    return
+                for e in entries:
+                    if end is not None and e[1] > end:
+                        return
+                    yield e
+        finally:
+            self._release_reader(r)
+
+    def _keyframe(self, timestamp):
+        '''Read the latest entry before a time of each channel being read.
+
+        Should be implemented by implementation objects that support
+        keyframes. Called by @ref keyframe.
+
+        '''
+        raise NotImplementedError
+
+    def _read_indices(self, indices):
+        '''Read the entries with some indices, in order.'''
+        result = []
+        for index in indices:
+            self.seek(index=index)
+            result += self.read()
+        return result
+
+    def _reader(self):
+        '''Open another reader of the log, positioned at its start.
+
+        The reader is a Log of the same type with its own file handle and
+        position, sharing anything read-only, such as the index, with this
+        log. Should be implemented by implementation objects that support
+        random access. Used by @ref reader.
+
+        '''
+        raise NotImplementedError
+
+    def _release_reader(self, r):
+        '''Return a reader to the pool, rewound and reading all channels.
+
+        The reader is closed instead if the pool is full, the log has been
+        closed, or it cannot be rewound.
+
+        '''
+        try:
+            if r.channels is not None:
+                r.set_channels(None)
+            r.rewind()
+        except Exception:
+            r.close()
+            return
+        with self._pool_lock:
+            if self._pool is not None and \
+                    len(self._pool) < READER_POOL_SIZE:
+                self._pool.append(r)
+                return
+        r.close()
+
+    def _set_channels(self, channels):
+        '''Apply a change in the channels to read.
+
+        Should be implemented by implementation objects that support reading
+        a subset of channels. Called by @ref set_channels.
+
+        '''
+        raise NotImplementedError
+
     def _eof(self):
         return True
 
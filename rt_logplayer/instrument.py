@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Playback instrumentation.
+
+'''
+
+
+import bisect
+import collections
+import csv
+import json
+
+
+class Histogram(object):
+    '''Histogram of times, with buckets spaced by powers of two.
+
+    The buckets run from 1us to about 16s. Times below the first bucket,
+    including negative times, are counted in the first bucket, and times above
+    the last in an overflow bucket. The exact minimum, maximum and mean are
+    also kept.
+
+    '''
+    # Upper bounds of the buckets, in seconds
+    BOUNDS = [2 ** ii * 1e-6 for ii in range(25)]
+
+    def __init__(self):
+        super(Histogram, self).__init__()
+        self.reset()
+
+    @property
+    def count(self):
+        return self._count
+
+    @property
+    def max(self):
+        return self._max
+
+    @property
+    def mean(self):
+        if not self._count:
+            return 0.0
+        return self._sum / self._count
+
+    @property
+    def min(self):
+        return self._min
+
+    def add(self, value):
+        '''Add a time, in seconds.'''
+        self._buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self._count += 1
+        self._sum += value
+        if self._min is None or value < self._min:
+            self._min = value
+        if self._max is None or value > self._max:
+            self._max = value
+
+    def merge(self, other):
+        '''Add the counts of another histogram to this one.'''
+        for ii, n in enumerate(other._buckets):
+            self._buckets[ii] += n
+        self._count += other._count
+        self._sum += other._sum
+        if other._min is not None and (self._min is None or
+                other._min < self._min):
+            self._min = other._min
+        if other._max is not None and (self._max is None or
+                other._max > self._max):
+            self._max = other._max
+
+    def percentile(self, p):
+        '''Get the upper bound of the bucket containing a percentile.
+
+        The result is limited to the maximum recorded value.
+
+        '''
+        if not self._count:
+            return 0.0
+        target = self._count * p / 100.0
+        seen = 0
+        for ii, n in enumerate(self._buckets):
+            seen += n
+            if seen >= target and n:
+                if ii < len(self.BOUNDS):
+                    return min(self.BOUNDS[ii], self._max)
+                break
+        return self._max
+
+    def reset(self):
+        self._buckets = [0] * (len(self.BOUNDS) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._min = None
+        self._max = None
+
+    def as_dict(self):
+        '''Get the statistics and bucket counts as a dictionary.'''
+        return {'count': self._count, 'mean': self.mean, 'min': self._min,
+                'max': self._max, 'p50': self.percentile(50),
+                'p90': self.percentile(90), 'p99': self.percentile(99),
+                'buckets': [[b, n] for b, n in zip(self.BOUNDS + [None],
+                    self._buckets) if n]}
+
+
+class Instruments(object):
+    '''Per-channel statistics of the stages of playback.
+
+    Histograms are kept for each channel of:
+     - decode: the time taken to read and unpickle an entry,
+     - lateness: the time at which an entry was written minus the time it was
+       due,
+     - enqueue: the time taken to place an entry in a sinks.ThreadedSink
+       queue,
+     - queue: the time an entry waited in a sinks.ThreadedSink queue before
+       being written, and
+     - write: the time taken to write an entry to the sink.
+    Entries written more than late_threshold seconds after they were due are
+    counted as late, and entries not written at all as dropped.
+
+    The decode times are recorded by the read-ahead thread, the queue and
+    write times and dropped entries by the writer threads of a
+    sinks.ThreadedSink, and the others by the playback thread. Statistics may
+    be read from any thread while they are being recorded, but are not
+    guaranteed to be consistent with each other.
+
+    '''
+    STAGES = ['decode', 'lateness', 'enqueue', 'queue', 'write']
+
+    def __init__(self, late_threshold=0.01):
+        super(Instruments, self).__init__()
+        self._late_threshold = late_threshold
+        self._hists = {}
+        self._late = collections.defaultdict(int)
+        self._dropped = collections.defaultdict(int)
+
+    @property
+    def channels(self):
+        '''The channels for which anything has been recorded.'''
+        chans = set(c for s, c in self._hists.keys())
+        chans.update(self._dropped.keys())
+        return sorted(chans)
+
+    @property
+    def late_threshold(self):
+        return self._late_threshold
+
+    def decode(self, channel, t):
+        self._hist('decode', channel).add(t)
+
+    def drop(self, channel, number=1):
+        self._dropped[channel] += number
+
+    def dropped(self, channel=None):
+        '''Get the number of entries dropped on a channel, or all channels.'''
+        if channel is None:
+            return sum(self._dropped.values())
+        return self._dropped.get(channel, 0)
+
+    def enqueue(self, channel, t):
+        self._hist('enqueue', channel).add(t)
+
+    def histogram(self, stage, channel=None):
+        '''Get the histogram of a stage for a channel, or all channels.'''
+        if channel is not None:
+            return self._hist(stage, channel)
+        result = Histogram()
+        for (s, c), h in self._hists.items():
+            if s == stage:
+                result.merge(h)
+        return result
+
+    def late(self, channel=None):
+        '''Get the number of entries late on a channel, or all channels.'''
+        if channel is None:
+            return sum(self._late.values())
+        return self._late.get(channel, 0)
+
+    def lateness(self, channel, t):
+        self._hist('lateness', channel).add(t)
+        if t > self._late_threshold:
+            self._late[channel] += 1
+
+    def queue(self, channel, t):
+        self._hist('queue', channel).add(t)
+
+    def reset(self):
+        self._hists = {}
+        self._late.clear()
+        self._dropped.clear()
+
+    def write(self, channel, t):
+        self._hist('write', channel).add(t)
+
+    def as_dict(self):
+        '''Get all statistics as a dictionary.'''
+        chans = {}
+        for c in self.channels:
+            chans[c] = dict((s, self.histogram(s, c).as_dict())
+                    for s in self.STAGES)
+            chans[c]['late'] = self.late(c)
+            chans[c]['dropped'] = self.dropped(c)
+        return {'late_threshold': self._late_threshold, 'channels': chans}
+
+    def save(self, filename):
+        '''Save all statistics, as CSV if the file name ends in .csv and as
+        JSON otherwise.'''
+        with open(filename, 'wb') as f:
+            if filename.lower().endswith('.csv'):
+                self.write_csv(f)
+            else:
+                self.write_json(f)
+
+    def summary(self):
+        '''Get a one-line summary of the statistics of all channels.'''
+        def ms(stage):
+            return self.histogram(stage).percentile(99) * 1000.0
+        return 'Late: {0} Dropped: {1} p99 lateness: {2:.2f}ms decode: ' \
+                '{3:.2f}ms write: {4:.2f}ms'.format(self.late(),
+                self.dropped(), ms('lateness'), ms('decode'), ms('write'))
+
+    def write_csv(self, f):
+        '''Write one row of statistics per channel and stage.
+
+        The late and dropped counts are written as stages with only a count.
+
+        '''
+        w = csv.writer(f)
+        w.writerow(['channel', 'stage', 'count', 'mean', 'min', 'max', 'p50',
+            'p90', 'p99'])
+        for c in self.channels:
+            for s in self.STAGES:
+                h = self.histogram(s, c)
+                w.writerow([c, s, h.count, h.mean, h.min, h.max,
+                    h.percentile(50), h.percentile(90), h.percentile(99)])
+            w.writerow([c, 'late', self.late(c)])
+            w.writerow([c, 'dropped', self.dropped(c)])
+
+    def write_json(self, f):
+        json.dump(self.as_dict(), f, sort_keys=True, indent=2)
+
+    def _hist(self, stage, channel):
+        h = self._hists.get((stage, channel))
+        if h is None:
+            h = self._hists.setdefault((stage, channel), Histogram())
+        return h
+
+
+# vim: tw=79
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Opening and converting logs of any supported format.
+
+'''
+
+
+import blk_log
+import hdrpkl_log
+import simpkl_log
+
+
+# Log formats that can be recognised from their file contents, in the order
+# they are checked. Logs that match none of these are opened as
+# SimplePickleLog, the format written by rtlog.
+FORMATS = [blk_log.BlockLog, hdrpkl_log.HeaderPickleLog]
+
+
+def log_class(filename):
+    '''Get the log class that can read a log file.'''
+    for f in FORMATS:
+        if f.is_log(filename):
+            return f
+    return simpkl_log.SimplePickleLog
+
+
+def open_log(filename, **kwargs):
+    '''Open a log file for reading using the class for its format.
+
+    Any keyword arguments are passed to the log class. Options not supported
+    by that class are ignored.
+
+    '''
+    return log_class(filename)(filename=filename, mode='r', **kwargs)
+
+
+def convert(src_fn, dest_fn, dest_class, verbose=False):
+    '''Copy all the entries of a log into a new log of a different format.'''
+    src = open_log(src_fn, verbose=verbose)
+    try:
+        dest = dest_class(filename=dest_fn, mode='w', meta=src.metadata,
+                verbose=verbose)
+        try:
+            entries = src.read()
+            while entries:
+                index, ts, data = entries[0]
+                dest.write(ts, data)
+                entries = src.read()
+        finally:
+            dest.close()
+    finally:
+        src.close()
+
+
+# vim: tw=79
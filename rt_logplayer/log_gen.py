@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Synthetic log generator, for testing and benchmarking.
+
+Data is written using the RTC data types if OpenRTM-aist is installed, and
+using stand-ins with the same attributes otherwise.
+
+'''
+
+
+import os
+import sys
+
+import ilog
+import simpkl_log
+
+try:
+    import RTC
+except ImportError:
+    RTC = None
+
+
+###############################################################################
+## Stand-ins for the RTC data types and rtshell port specifications
+
+class Time(object):
+    def __init__(self, sec=0, nsec=0):
+        self.sec = sec
+        self.nsec = nsec
+
+
+class TimedLong(object):
+    def __init__(self, tm=None, data=0):
+        self.tm = tm
+        self.data = data
+
+
+class TimedOctetSeq(object):
+    def __init__(self, tm=None, data=''):
+        self.tm = tm
+        self.data = data
+
+
+class ChannelSpec(object):
+    '''Describes a channel in the log's metadata.
+
+    Provides the attributes of an rtshell port specification that are used
+    when playing a log.
+
+    '''
+    def __init__(self, name, type_name, raw):
+        self.name = name
+        self.type_name = type_name
+        self.raw = raw
+        self._input = True
+
+    def __repr__(self):
+        return 'ChannelSpec({0!r}, {1!r}, {2!r})'.format(self.name,
+                self.type_name, self.raw)
+
+
+###############################################################################
+## Payloads
+
+# Payload types: name: (data type name, stand-in type)
+PAYLOADS = {'long': ('TimedLong', TimedLong),
+        'octets': ('TimedOctetSeq', TimedOctetSeq)}
+
+
+def payload_type(payload):
+    '''Get the data type name and class for a payload type.'''
+    type_name, standin = PAYLOADS[payload]
+    if RTC:
+        return type_name, getattr(RTC, type_name)
+    return type_name, standin
+
+
+def make_time(ns):
+    '''Make an RTC time from a time in nanoseconds.'''
+    if RTC:
+        return RTC.Time(int(ns // 1000000000), int(ns % 1000000000))
+    return Time(int(ns // 1000000000), int(ns % 1000000000))
+
+
+###############################################################################
+## Generator
+
+def generate(filename, channels=2, rate=100.0, duration=10.0, payload='long',
+        size=0, start=1000.0, log_class=simpkl_log.SimplePickleLog,
+        verbose=False, **kwargs):
+    '''Write a synthetic log.
+
+    Each channel is written at the same rate, with the channels' entries
+    evenly spaced between each other.
+
+    @param filename The file to write.
+    @param channels The number of channels.
+    @param rate The rate, in Hz, of each channel.
+    @param duration The length of the log, in seconds.
+    @param payload The payload type: 'long' for a TimedLong carrying the entry
+                   number, or 'octets' for a TimedOctetSeq of size bytes.
+    @param size The size in bytes of each octets payload.
+    @param start The time, in seconds, of the first entry.
+    @param log_class The log class to write with.
+    @return The number of entries written.
+
+    Other keyword arguments are passed to the log class.
+
+    '''
+    type_name, data_type = payload_type(payload)
+    names = ['chan{0}'.format(ii) for ii in range(channels)]
+    specs = [ChannelSpec(n, type_name, ['/localhost/gen.rtc:' + n])
+            for n in names]
+    # The same random data is used for every entry, as generating it is slow
+    octets = os.urandom(size) if payload == 'octets' else ''
+    start_ns = int(round(start * 1e9))
+    period_ns = 1e9 / rate
+    count = int(duration * rate)
+    log = log_class(filename=filename, mode='w', meta=(start, specs),
+            verbose=verbose, **kwargs)
+    try:
+        for ii in range(count):
+            for c, name in enumerate(names):
+                ns = start_ns + int((ii + float(c) / channels) * period_ns)
+                tm = make_time(ns)
+                if payload == 'octets':
+                    data = data_type(tm, octets)
+                else:
+                    data = data_type(tm, ii)
+                log.write(ilog.EntryTS(sec=ns // 1000000000,
+                    nsec=ns % 1000000000), (name, data))
+    finally:
+        log.close()
+    return count * channels
+
+
+def parse_size(size):
+    '''Parse a size in bytes, with an optional k or M suffix.'''
+    mult = 1
+    if size[-1:] in ('k', 'K'):
+        mult = 1024
+        size = size[:-1]
+    elif size[-1:] == 'M':
+        mult = 1024 * 1024
+        size = size[:-1]
+    return int(size) * mult
+
+
+def main(argv=None):
+    import optparse
+    import blk_log
+    import hdrpkl_log
+
+    usage = '''Usage: %prog [options] <log file>
+Write a synthetic log file.'''
+    parser = optparse.OptionParser(usage=usage)
+    parser.add_option('-c', '--channels', dest='channels', action='store',
+            type='int', default=2,
+            help='Number of channels. [Default: %default]')
+    parser.add_option('-d', '--duration', dest='duration', action='store',
+            type='float', default=10.0,
+            help='Length of the log in seconds. [Default: %default]')
+    parser.add_option('-f', '--format', dest='format', action='store',
+            type='choice', default='simple',
+            choices=['simple', 'header', 'block'],
+            help='Log format: simple, header or block. [Default: %default]')
+    parser.add_option('-p', '--payload', dest='payload', action='store',
+            type='choice', default='long', choices=sorted(PAYLOADS.keys()),
+            help='Payload type: long or octets. [Default: %default]')
+    parser.add_option('-r', '--rate', dest='rate', action='store',
+            type='float', default=100.0,
+            help='Rate of each channel in Hz. [Default: %default]')
+    parser.add_option('-s', '--size', dest='size', action='store',
+            type='string', default='0',
+            help='Size of octets payloads in bytes, optionally with a k or M '
+            'suffix. [Default: %default]')
+    parser.add_option('-v', '--verbose', dest='verbose', action='store_true',
+            default=False, help='Output verbose information. [Default: '
+            '%default]')
+    options, args = parser.parse_args(argv)
+    if len(args) != 1:
+        parser.print_usage(sys.stderr)
+        return 2
+    classes = {'simple': simpkl_log.SimplePickleLog,
+            'header': hdrpkl_log.HeaderPickleLog,
+            'block': blk_log.BlockLog}
+    try:
+        size = parse_size(options.size)
+    except ValueError:
+        print >>sys.stderr, '{0}: Invalid size: {1}'.format(
+                os.path.basename(sys.argv[0]), options.size)
+        return 2
+    n = generate(args[0], channels=options.channels, rate=options.rate,
+            duration=options.duration, payload=options.payload, size=size,
+            log_class=classes[options.format], verbose=options.verbose)
+    print 'Wrote {0} entries to {1}'.format(n, args[0])
+    return 0
+
+
+# vim: tw=79
@@ -0,0 +1,486 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Entry indices for logs, allowing seeking without reading every entry.
+
+'''
+
+
+import array
+import bisect
+import mmap
+import os
+import struct
+import sys
+
+import ilog
+
+
+###############################################################################
+## Timestamp conversion
+
+def ts_to_ns(ts):
+    '''Convert a timestamp to an integer number of nanoseconds.
+
+    The timestamp may be an EntryTS-like object (anything with sec and nsec
+    attributes) or a number of seconds. Numbers are truncated in the same way
+    as EntryTS comparisons truncate them.
+
+    '''
+    return ilog.to_ns(ts)
+
+
+def ns_to_ts(ns):
+    '''Convert an integer number of nanoseconds to an EntryTS.'''
+    return ilog.EntryTS.from_ns(ns)
+
+
+###############################################################################
+## Index interface
+##
+## An index stores the time stamp (in nanoseconds), file position, previous
+## file position and channel number of every entry in a log, in entry order.
+## Channel numbers are those of hdrpkl_log.ChannelCodec, so entries can be
+## skipped by channel without reading them. Positions in the index are
+## numbered from zero. Entry indices are consecutive, so only the index of
+## the first entry is stored.
+
+class EntryIndex(object):
+    # Column numbers
+    TS = 0
+    FP = 1
+    PREV = 2
+    CHAN = 3
+    NUM_COLS = 4
+    # Channel number of entries not sent by a known port
+    NO_CHANNEL = -1
+
+    def __init__(self, start_index=0):
+        super(EntryIndex, self).__init__()
+        self._start_index = start_index
+
+    def __len__(self):
+        raise NotImplementedError
+
+    @property
+    def start_index(self):
+        '''The index of the first entry.'''
+        return self._start_index
+
+    def close(self):
+        '''Release any resources held by the index.'''
+        pass
+
+    def count_ts(self, start=None, end=None):
+        '''Get the number of entries with time stamps from start to end,
+        inclusive. Either may be None for no limit.'''
+        lo = 0 if start is None else self._bisect(self.TS, ts_to_ns(start))
+        if end is None:
+            hi = len(self)
+        else:
+            hi = self._bisect(self.TS, ts_to_ns(end) + 1)
+        return max(hi - lo, 0)
+
+    def find_index(self, index):
+        '''Get the position of the first entry with an index >= index.'''
+        return min(max(index - self._start_index, 0), len(self))
+
+    def find_ts(self, ts):
+        '''Get the position of the first entry with a time stamp >= ts.'''
+        return self._bisect(self.TS, ts_to_ns(ts))
+
+    def find_fp(self, fp):
+        '''Get the position of the first entry with a file position >= fp.'''
+        return self._bisect(self.FP, fp)
+
+    def index(self, pos):
+        '''Get the index of the entry at a position in the index.'''
+        if pos < 0 or pos >= len(self):
+            raise IndexError(pos)
+        return self._start_index + pos
+
+    def ts(self, pos):
+        '''Get the time stamp, in nanoseconds, of the entry at a position.'''
+        return self._get(self.TS, pos)
+
+    def fp(self, pos):
+        '''Get the file position of the entry at a position.'''
+        return self._get(self.FP, pos)
+
+    def prev(self, pos):
+        '''Get the file position of the entry before the entry at a
+        position.'''
+        return self._get(self.PREV, pos)
+
+    def chan(self, pos):
+        '''Get the channel number of the entry at a position.'''
+        return self._get(self.CHAN, pos)
+
+    def next_in(self, pos, chans):
+        '''Get the position of the first entry at or after a position whose
+        channel number is in a set of channel numbers.
+
+        Returns the number of entries if there is none.
+
+        '''
+        n = len(self)
+        while pos < n and self._get(self.CHAN, pos) not in chans:
+            pos += 1
+        return pos
+
+    def _bisect(self, col, value):
+        lo = 0
+        hi = len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._get(col, mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _get(self, col, pos):
+        raise NotImplementedError
+
+
+###############################################################################
+## In-memory index
+##
+## Each column is stored in its own array of 64-bit integers, giving 32 bytes
+## per entry. Where the platform has no 64-bit array type (Python 2 on
+## Windows or a 32-bit system), lists are used instead, which take several
+## times the memory; the index's string form says so.
+
+class MemoryIndex(EntryIndex):
+    def __init__(self, entries=[]):
+        '''Constructor.
+
+        @param entries An iterable of (index, timestamp in nanoseconds, file
+                       position, previous file position, channel number)
+                       tuples, one per entry in the log, in order. The
+                       indices must be consecutive.
+
+        '''
+        super(MemoryIndex, self).__init__()
+        self._cols = [_column() for ii in range(self.NUM_COLS)]
+        for e in entries:
+            self.append(*e)
+
+    def __len__(self):
+        return len(self._cols[self.TS])
+
+    def __str__(self):
+        if INT64_TYPECODE:
+            return 'MemoryIndex of {0} entries.'.format(len(self))
+        return 'MemoryIndex of {0} entries, stored in lists.'.format(
+                len(self))
+
+    def append(self, index, ts, fp, prev, chan=EntryIndex.NO_CHANNEL):
+        '''Add an entry to the end of the index.
+
+        The time stamp must be in nanoseconds. ValueError is raised if the
+        index does not follow that of the last entry.
+
+        '''
+        if not len(self):
+            self._start_index = index
+        elif index != self._start_index + len(self):
+            raise ValueError('Entry index {0} does not follow {1}'.format(
+                index, self._start_index + len(self) - 1))
+        self._cols[self.TS].append(ts)
+        self._cols[self.FP].append(fp)
+        self._cols[self.PREV].append(prev)
+        self._cols[self.CHAN].append(chan)
+
+    def column(self, col):
+        '''Get one of the columns of the index.'''
+        return self._cols[col]
+
+    def next_in(self, pos, chans):
+        col = self._cols[self.CHAN]
+        n = len(col)
+        while pos < n and col[pos] not in chans:
+            pos += 1
+        return pos
+
+    def _bisect(self, col, value):
+        return bisect.bisect_left(self._cols[col], value)
+
+    def _get(self, col, pos):
+        if pos < 0:
+            raise IndexError(pos)
+        return self._cols[col][pos]
+
+
+###############################################################################
+## Sidecar index file
+##
+## The sidecar index is stored next to the log, in a file with the same name
+## plus '.idx'. It consists of a fixed header followed by four columns of
+## little-endian 64-bit integers, each with one value per entry:
+##   Header: (magic, version, log size, log mtime, entry count, first index)
+##   [Time stamps, in nanoseconds]
+##   [File positions of the entries]
+##   [File positions of the previous entries]
+##   [Channel numbers]
+## The log size and modification time are used to detect a stale index.
+## Indices of earlier versions, which store every entry index (version 2) or
+## have no channel numbers (version 1), are treated as stale and rebuilt.
+
+class SidecarIndex(EntryIndex):
+    MAGIC = 'RTLPIDX1'
+    VERSION = 3
+    HEADER = struct.Struct('<8sIqdqq')
+    VALUE = struct.Struct('<q')
+
+    def __init__(self, filename, f, mm, count, start_index):
+        super(SidecarIndex, self).__init__(start_index)
+        self._fn = filename
+        self._file = f
+        self._mm = mm
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __str__(self):
+        return 'SidecarIndex({0}) of {1} entries.'.format(self._fn,
+                self._count)
+
+    @staticmethod
+    def index_name(log_fn):
+        '''Get the name of the sidecar index file for a log file.'''
+        return log_fn + '.idx'
+
+    @classmethod
+    def load(cls, log_fn):
+        '''Load the sidecar index of a log, if it exists and is current.
+
+        Returns None if there is no index file or it does not match the log.
+
+        '''
+        fn = cls.index_name(log_fn)
+        if not os.path.exists(fn):
+            return None
+        log_stat = os.stat(log_fn)
+        f = open(fn, 'rb')
+        try:
+            header = f.read(cls.HEADER.size)
+            if len(header) != cls.HEADER.size:
+                f.close()
+                return None
+            magic, ver, size, mtime, count, start_index = \
+                    cls.HEADER.unpack(header)
+            if magic != cls.MAGIC or ver != cls.VERSION or \
+                    size != log_stat.st_size or \
+                    mtime != log_stat.st_mtime or \
+                    os.fstat(f.fileno()).st_size != cls._file_size(count):
+                # Stale or not an index
+                f.close()
+                return None
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except:
+            f.close()
+            raise
+        return cls(fn, f, mm, count, start_index)
+
+    @classmethod
+    def create(cls, log_fn, index):
+        '''Write the sidecar index of a log and load it.
+
+        @param log_fn The name of the log file.
+        @param index A MemoryIndex of the log's entries.
+
+        '''
+        log_stat = os.stat(log_fn)
+        fn = cls.index_name(log_fn)
+        tmp_fn = fn + '.tmp'
+        f = open(tmp_fn, 'wb')
+        try:
+            f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION,
+                log_stat.st_size, log_stat.st_mtime, len(index),
+                index.start_index))
+            for ii in range(cls.NUM_COLS):
+                f.write(_column_bytes(index.column(ii)))
+        finally:
+            f.close()
+        if os.path.exists(fn):
+            os.remove(fn)
+        os.rename(tmp_fn, fn)
+        return cls.load(log_fn)
+
+    def close(self):
+        '''Close the index file.'''
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @classmethod
+    def _file_size(cls, count):
+        return cls.HEADER.size + cls.NUM_COLS * count * cls.VALUE.size
+
+    def _get(self, col, pos):
+        if pos < 0 or pos >= self._count:
+            raise IndexError(pos)
+        offset = self.HEADER.size + (col * self._count + pos) * \
+                self.VALUE.size
+        return self.VALUE.unpack_from(self._mm, offset)[0]
+
+
+###############################################################################
+## Keyframes
+##
+## A keyframe table records, at every interval of log time from the first
+## entry, the position in an index of the latest entry of each channel before
+## that time. The latest entries before any time are found from the keyframe
+## before it and the entries between the two, so at most one interval of
+## entries is examined, however long ago a channel's latest entry was.
+
+# Default and shortest intervals, in seconds, between keyframes
+KEYFRAME_INTERVAL = 10.0
+MIN_KEYFRAME_INTERVAL = 1.0
+
+
+def check_keyframe_interval(interval):
+    '''Check a keyframe interval, raising ValueError if it is too short.
+
+    Returns the interval.
+
+    '''
+    if not interval >= MIN_KEYFRAME_INTERVAL:
+        raise ValueError('Keyframe interval must be at least {0}s: '\
+                '{1}'.format(MIN_KEYFRAME_INTERVAL, interval))
+    return interval
+
+
+class Keyframes(object):
+    def __init__(self, index, interval=KEYFRAME_INTERVAL):
+        '''Build the keyframe table of an index.
+
+        @param index The EntryIndex of the log.
+        @param interval The log time, in seconds, between keyframes. It must
+                        be at least MIN_KEYFRAME_INTERVAL.
+
+        '''
+        super(Keyframes, self).__init__()
+        self._index = index
+        self._interval = check_keyframe_interval(interval)
+        # The time of each keyframe in nanoseconds, the position in the
+        # index of the first entry at or after it, and a dictionary of
+        # channel number: position of the latest entry before it
+        self._ns = _column()
+        self._pos = _column()
+        self._latest = []
+        self._build()
+
+    def __len__(self):
+        return len(self._ns)
+
+    def __str__(self):
+        return 'Keyframes every {0}s, {1} keyframes.'.format(self._interval,
+                len(self))
+
+    @property
+    def interval(self):
+        '''The log time, in seconds, between keyframes.'''
+        return self._interval
+
+    def latest(self, ts, chans=None):
+        '''Get the latest entry before a time of each channel.
+
+        @param ts The time.
+        @param chans A set of channel numbers, or None for all channels.
+        @return A sorted list of positions in the index, one for each channel
+                with an entry before the time.
+
+        '''
+        ns = ts_to_ns(ts)
+        k = bisect.bisect_right(self._ns, ns) - 1
+        if k < 0:
+            return []
+        latest = dict(self._latest[k])
+        index = self._index
+        pos = self._pos[k]
+        n = len(index)
+        while pos < n and index.ts(pos) < ns:
+            latest[index.chan(pos)] = pos
+            pos += 1
+        latest.pop(EntryIndex.NO_CHANNEL, None)
+        return sorted(p for c, p in latest.iteritems()
+                if chans is None or c in chans)
+
+    def _build(self):
+        index = self._index
+        if not len(index):
+            return
+        interval = int(self._interval * 1e9)
+        latest = {}
+        next_ns = index.ts(0)
+        for pos in xrange(len(index)):
+            ns = index.ts(pos)
+            if ns >= next_ns:
+                # A single keyframe covers any gap of more than an interval
+                next_ns += (ns - next_ns) // interval * interval
+                self._ns.append(next_ns)
+                self._pos.append(pos)
+                self._latest.append(dict(latest))
+                next_ns += interval
+            latest[index.chan(pos)] = pos
+
+
+###############################################################################
+## Column storage
+
+def _int64_typecode():
+    for tc in ('q', 'l'):
+        try:
+            if array.array(tc).itemsize == 8:
+                return tc
+        except ValueError:
+            pass
+    return None
+
+
+INT64_TYPECODE = _int64_typecode()
+
+
+def _column():
+    '''Make an empty column of 64-bit integers.
+
+    An array is used where the platform provides a 64-bit array type.
+    Otherwise, a list is used. Python 2's array module has no 'q' type, so
+    this is only the case where its 'l' type is 64 bits.
+
+    '''
+    if INT64_TYPECODE:
+        return array.array(INT64_TYPECODE)
+    return []
+
+
+def _column_bytes(col):
+    '''Get the little-endian binary representation of a column.'''
+    if type(col) == list:
+        return struct.pack('<{0}q'.format(len(col)), *col)
+    if sys.byteorder == 'big':
+        col = array.array(col.typecode, col)
+        col.byteswap()
+    return col.tostring()
+
+
+# vim: tw=79
@@ -21,173 +21,197 @@ Thread object that manages the playback of data.
 
 from PySide import QtCore
 import sys
-import time
 import traceback
 
+import playback
+import sinks
+
 
 class LogPlayer(QtCore.QThread):
-    NO_CHANGE = 0
-    STOP = 1
-    JUMP = 2
+    # Rate for playing as fast as the ports accept data
+    MAX_RATE = playback.Player.MAX_RATE
+    # Catch-up policies
+    BURST = playback.Player.BURST
+    LATEST = playback.Player.LATEST
+    DROP_LATE = playback.Player.DROP_LATE
+    # Number of passes for looping until stopped
+    LOOP_FOREVER = playback.Player.LOOP_FOREVER
     # Signals
     finished = QtCore.Signal()
     pos_update = QtCore.Signal(int)
-
-    def __init__(self, log, facade, rate=1.0, parent=None):
+    # Emitted with the target position when a seek is requested, and with the
+    # new position when the latest requested seek has been performed
+    seek_started = QtCore.Signal(int)
+    seek_done = QtCore.Signal(int)
+
+    def __init__(self, log, sink=None, rate=1.0, read_ahead_entries=1000,
+            read_ahead_bytes=None, spin_time=0.001, instruments=None,
+            catch_up=BURST, catch_up_threshold=0.05, passes=1,
+            reverse=False, keyframes=False, parent=None):
+        '''Constructor.
+
+        @param log The log to play. It must not be used by anything else
+                   until @ref close is called. A mem_log.MemoryLog can be
+                   given to play without reading or decoding entries.
+        @param sink The sinks.Sink to write to, such as a sinks.FacadeSink
+                    for the component providing the ports. If None, data is
+                    discarded until a sink is given using @ref set_sink.
+        @param rate The playback rate, or MAX_RATE to play as fast as
+                    possible.
+        @param read_ahead_entries The maximum number of entries to read ahead
+                                  of playback.
+        @param read_ahead_bytes The maximum approximate size of the data read
+                                ahead of playback, or None for no limit.
+        @param spin_time The time, in seconds, before an entry is due at which
+                         the player stops sleeping and spins.
+        @param instruments An instrument.Instruments object to record
+                           statistics of each stage of playback in, or None.
+        @param catch_up The policy for catching up when playback falls
+                        behind: BURST, LATEST or DROP_LATE. See
+                        playback.Player.
+        @param catch_up_threshold The lateness, in seconds, above which
+                                  entries are skipped by DROP_LATE.
+        @param passes The number of times to play the log, or LOOP_FOREVER.
+                      Each pass after the first starts from the first entry.
+        @param reverse If True, the log is played backward from the current
+                       position. See playback.Player.
+        @param keyframes If True, the latest entry of each channel is written
+                         after each jump to a new position. See
+                         playback.Player.
+
+        '''
         super(LogPlayer, self).__init__(parent)
-        self._l = log
-        self._c = facade
-        self._rate = 1.0
-        self._start, port_specs = log.metadata
-        self._m = QtCore.QMutex()
-        # When True, run() will exit
-        self._stop = False
-        # When True, the position has been changed (e.g. rewind)
-        self._jump = False
+        if sink is None:
+            sink = sinks.NullSink()
+        self._p = playback.Player(log, sink,
+                rate=rate, read_ahead_entries=read_ahead_entries,
+                read_ahead_bytes=read_ahead_bytes, spin_time=spin_time,
+                on_pos=self.pos_update.emit,
+                on_seek_started=self.seek_started.emit,
+                on_seek_done=self.seek_done.emit, instruments=instruments,
+                catch_up=catch_up, catch_up_threshold=catch_up_threshold,
+                passes=passes, reverse=reverse, keyframes=keyframes)
+
+    def close(self):
+        '''Stop reading the log. The player cannot be used afterwards.'''
+        self.stop()
+        self.wait()
+        self._p.close()
+
+    @property
+    def catch_up(self):
+        '''The catch-up policy and threshold.'''
+        return self._p.catch_up
+
+    @property
+    def channels(self):
+        '''The names of the channels being played, or None for all.'''
+        return self._p.channels
+
+    @property
+    def instruments(self):
+        '''The instrument.Instruments recording statistics, or None.'''
+        return self._p.instruments
+
+    @property
+    def keyframes(self):
+        '''True if the state of each channel is written after a jump.'''
+        return self._p.keyframes
+
+    @property
+    def lateness(self):
+        '''Statistics of how late entries have been played.
+
+        See scheduler.Scheduler.lateness.
+
+        '''
+        return self._p.lateness
+
+    @property
+    def passes(self):
+        '''The number of passes to play, or LOOP_FOREVER.'''
+        return self._p.passes
+
+    @property
+    def rate(self):
+        '''The playback rate, or MAX_RATE.'''
+        return self._p.rate
+
+    @property
+    def reverse(self):
+        '''True if playing backward.'''
+        return self._p.reverse
+
+    @property
+    def seeking(self):
+        '''True if a seek has been requested but not yet performed.'''
+        return self._p.seeking
+
+    @property
+    def skipped(self):
+        '''The number of entries skipped by the catch-up policy.'''
+        return self._p.skipped
+
+    def set_catch_up(self, policy, threshold=None):
+        '''Change the catch-up policy, and optionally its threshold.'''
+        self._p.set_catch_up(policy, threshold)
+
+    def set_channels(self, channels):
+        '''Play only the entries of some channels, or all if None.'''
+        self._p.set_channels(channels)
+
+    def set_keyframes(self, keyframes):
+        '''Turn writing the state of each channel after a jump on or off.'''
+        self._p.set_keyframes(keyframes)
+
+    def set_passes(self, passes):
+        '''Change the number of passes to play, or LOOP_FOREVER.'''
+        self._p.set_passes(passes)
+
+    def set_reverse(self, reverse):
+        '''Change the direction of playback.'''
+        self._p.set_reverse(reverse)
+
+    def set_sink(self, sink):
+        '''Change the sink to write to.'''
+        self._p.set_sink(sink)
+
+    def set_rate(self, rate):
+        '''Change the playback rate without changing the position.'''
+        self._p.set_rate(rate)
 
     def rewind(self):
-        self._m.lock()
-        self._l.seek(timestamp=self._l.start[1])
-        self._jump = True
-        self._m.unlock()
-        self.pos_update.emit(self._cur_pos().float)
+        self._p.rewind()
 
     def skip_back(self):
-        new_pos = self._cur_pos().float - 60
-        if new_pos < self._l.start[1].float:
-            new_pos = self._l.start[1].float
-        self._m.lock()
-        self._l.seek(timestamp=new_pos)
-        self._jump = True
-        self._m.unlock()
-        self.pos_update.emit(self._cur_pos().float)
+        self._p.skip_back()
 
     def skip_forward(self):
-        new_pos = self._cur_pos().float + 60
-        if new_pos > self._l.end[1].float:
-            new_pos = self._l.end[1].float
-        self._m.lock()
-        self._l.seek(timestamp=new_pos)
-        self._jump = True
-        self._m.unlock()
-        self.pos_update.emit(self._cur_pos().float)
+        self._p.skip_forward()
 
     def skip_to(self, new_pos):
-        self._m.lock()
-        self._l.seek(timestamp=new_pos)
-        self._jump = True
-        self._m.unlock()
-        self.pos_update.emit(self._cur_pos().float)
+        '''Move to a new position.
+
+        Returns without waiting for the seek to be performed; seek_done is
+        emitted once it has been. A seek that has not yet been started when
+        another is requested is abandoned.
+
+        '''
+        self._p.skip_to(new_pos)
 
     def stop(self):
-        self._m.lock()
-        self._stop = True
-        self._m.unlock()
+        self._p.stop()
 
     def run(self):
         try:
-            # Get ready to play
-            self._jump = False
-            self._stop = False
-            self._update_times()
-            # "Play it again, Sam." is a misquotation.
-            while True:
-                # Calculate the current time in log-time
-                now = (((time.time() - self._start_time) * self._rate) +
-                        self._play_start)
-                while self._cur_pos() <= now:
-                    if (now - self._last_pos_update) > 0.5:
-                        self._last_pos_update = self._cur_pos().float - self._start
-                        self.pos_update.emit(self._cur_pos().float)
-                    if not self._play_one_entry():
-                        # End of log
-                        self.finished.emit()
-                        return
-                # Check flags
-                flags = self._check_flags()
-                if flags == self.STOP:
-                    # A stop flag was set
-                    self.pos_update.emit(self._l.end[1].float)
-                    return
-                elif flags == self.JUMP:
-                    # The user has changed the log position
-                    self._update_times()
-                else:
-                    # Sleep until the next entry
-                    if not self._wait_for_next():
-                        self.pos_update.emit(self._l.end[1].float)
-                        return
+            if self._p.play():
+                # End of log
+                self.finished.emit()
+            else:
+                # A stop flag was set
+                self.pos_update.emit(self._p.end[1].float)
         except:
             traceback.print_exc()
 
-    def _check_flags(self):
-        res = self.NO_CHANGE
-        self._m.lock()
-        if self._stop:
-            self._stop = False
-            res = self.STOP
-        elif self._jump:
-            self._jump = False
-            res = self.JUMP
-        self._m.unlock()
-        return res
-
-    def _cur_pos(self):
-        self._m.lock()
-        res = self._l.pos[1]
-        self._m.unlock()
-        return res
-
-    def _play_one_entry(self):
-        # Read the next entry from the log file
-        self._m.lock()
-        entries = self._l.read()
-        self._m.unlock()
-        #print 'Playing entry {0}'.format(entries)
-        if len(entries) == 0:
-            # End of log
-            return False
-        index, ts, entry = entries[0]
-        p_name, data = entry
-        self._c.ports[p_name].port.write(data)
-        return True
-
-    def _update_times(self):
-        self._play_start = self._cur_pos().float
-        self._start_time = time.time()
-        self._offset = self._start_time - self._play_start
-        self._last_pos_update = self._cur_pos().float - self._start
-        self.pos_update.emit(self._cur_pos().float)
-
-    def _wait_for_next(self):
-        # Calculate the current time in log-time
-        now = (((time.time() - self._start_time) * self._rate) +
-                self._play_start)
-        sleep_time = (self._cur_pos().float - now) * 1e6 # Convert to microseconds
-        #print 'Sleep time is {0}'.format(sleep_time)
-        if sleep_time <= 0:
-            return
-        # Sleep
-        SLEEP_PERIOD = 1e6
-        #print 'Starting sleep at {0}'.format(time.time())
-        while sleep_time > 0:
-            if sleep_time < SLEEP_PERIOD:
-                self.usleep(sleep_time)
-            else:
-                self.usleep(SLEEP_PERIOD) # Sleep for a tenth of a second
-            sleep_time -= SLEEP_PERIOD
-            # Check flags
-            flags = self._check_flags()
-            if flags == self.STOP:
-                #print 'Sleep broken by stop at {0}'.format(time.time())
-                return False
-            elif flags == self.JUMP:
-                self._update_times()
-                #print 'Sleep broken by jump at {0}'.format(time.time())
-                return True
-        #print 'Sleep done at {0}'.format(time.time())
-        return True
-
 
 # vim: tw=79
-
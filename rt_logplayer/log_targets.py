@@ -22,6 +22,9 @@ from PySide import QtCore
 from PySide import QtGui
 
 class LogTargets(QtCore.QAbstractItemModel):
+    # Emitted when the set of enabled channels changes
+    channels_changed = QtCore.Signal()
+
     def __init__(self, log, parent=None):
         super(LogTargets, self).__init__(parent)
         self._load_chans(log)
@@ -32,21 +35,55 @@ class LogTargets(QtCore.QAbstractItemModel):
         for ii, c in enumerate(chans):
             self._channels.append(Channel(ii, c.name, c.type_name, c.raw))
 
+    @property
+    def enabled_channels(self):
+        '''The names of the channels to play.'''
+        return [c.name for c in self._channels if c.enabled]
+
     def add_target(self, chan, target, conn_id):
         port = target.internalPointer()
         tgt_row = chan.internalPointer().num_targets
         self.beginInsertRows(chan, tgt_row, tgt_row)
         chan.internalPointer().add_target(port, conn_id)
         self.endInsertRows()
+        if tgt_row == 0:
+            # Channels are enabled when they gain their first target
+            self._set_enabled(chan, True)
 
     def rem_target(self, chan, target):
         self.beginRemoveRows(chan, target.row(), target.row())
         chan.internalPointer().rem_target(target.internalPointer())
         self.endRemoveRows()
+        if chan.internalPointer().num_targets == 0:
+            # and disabled when they lose their last
+            self._set_enabled(chan, False)
+
+    def _set_enabled(self, chan, enabled):
+        if chan.internalPointer().enabled == enabled:
+            return
+        chan.internalPointer().enabled = enabled
+        self.dataChanged.emit(chan, chan)
+        self.channels_changed.emit()
 
     def columnCount(self, parent):
         return 1
 
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if not index.internalPointer().parent:
+            # Channels can be enabled and disabled
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        return flags
+
+    def setData(self, index, value, role):
+        if not index.isValid() or index.internalPointer().parent or \
+                role != QtCore.Qt.CheckStateRole:
+            return False
+        self._set_enabled(index, value == QtCore.Qt.Checked)
+        return True
+
     def index(self, row, col, parent):
         if not parent.isValid():
             # Root
@@ -93,6 +130,12 @@ class LogTargets(QtCore.QAbstractItemModel):
             else:
                 # Channel
                 return index.internalPointer().name
+        elif role == QtCore.Qt.CheckStateRole:
+            if not index.internalPointer().parent:
+                # Channel
+                if index.internalPointer().enabled:
+                    return QtCore.Qt.Checked
+                return QtCore.Qt.Unchecked
         elif role == QtCore.Qt.StatusTipRole:
             if index.internalPointer().parent:
                 # Target
@@ -124,6 +167,8 @@ class Channel(object):
         self._data_type = data_type
         self._srcs = sources
         self._targets = []
+        # True if the channel is played
+        self.enabled = False
 
     def __str__(self):
         return self.name + '->' + str(self.targets)
@@ -0,0 +1,315 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Logs held in memory, for playing short logs repeatedly without reading and
+unpickling them each time.
+
+'''
+
+
+import bisect
+import sys
+
+import hdrpkl_log
+import ilog
+import log_index
+import read_ahead
+
+
+class TooLargeError(Exception):
+    '''The entries to load would use more memory than allowed.'''
+    def __init__(self, limit):
+        super(TooLargeError, self).__init__(
+                'Log is larger than the memory limit of {0} bytes'.format(
+                    limit))
+        self.limit = limit
+
+
+###############################################################################
+## Read-only log of decoded entries held in memory.
+##
+## Entries are kept as the (index, timestamp, data) tuples returned by the
+## log they were loaded from, in a list, with their time stamps in nanoseconds
+## in a column of 64-bit integers for seeking. Reading an entry returns the
+## same tuple every time, without copying or decoding anything.
+##
+## Keyframes (see log_index.Keyframes) are built the first time they are
+## needed, from an index whose file positions are positions in the list.
+##
+## Random access and range iteration read the list directly, as nothing is
+## changed by reading it. Readers (see ilog.Log.reader) share the list.
+
+class MemoryLog(ilog.Log):
+    def __init__(self, entries=None, size=0, *args, **kwargs):
+        '''Constructor.
+
+        @param entries A list of (index, timestamp, data) tuples, in time
+                       order. The list is used, not copied.
+        @param size The approximate memory used by the entries, in bytes.
+
+        Other arguments are as for ilog.Log. Only mode 'r' is supported.
+
+        '''
+        self._entries = entries or []
+        self._ns = log_index._column()
+        self._pos = 0
+        self._size = size
+        self._kf_interval = log_index.check_keyframe_interval(
+                kwargs.pop('keyframe_interval', log_index.KEYFRAME_INTERVAL))
+        self._keyframes = None
+        super(MemoryLog, self).__init__(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return 'MemoryLog({0} entries) at position {1}.'.format(
+                len(self._entries), self._pos)
+
+    @property
+    def size(self):
+        '''The approximate memory used by the entries, in bytes.'''
+        return self._size
+
+    def read(self, timestamp=None, number=None):
+        entries = self._entries
+        if number is not None:
+            if number < 0:
+                raise ValueError
+        elif timestamp is not None:
+            if timestamp < 0:
+                raise ValueError
+            end = bisect.bisect_right(self._ns, log_index.ts_to_ns(timestamp),
+                    self._pos)
+        else:
+            number = 1
+        if self._channels is not None:
+            return self._read_channels(timestamp, number)
+        if number is not None:
+            end = min(self._pos + number, len(entries))
+        res = entries[self._pos:end]
+        self._pos = end
+        return res
+
+    def rewind(self):
+        self._pos = 0
+        self._skip_disabled()
+
+    def seek(self, timestamp=None, index=None):
+        if index is not None:
+            if index < 0:
+                raise ilog.InvalidIndexError
+            # Entry indices increase along the log, but need not start at 0
+            self._pos = bisect.bisect_left(_IndexColumn(self._entries), index)
+        elif timestamp is not None:
+            self._pos = bisect.bisect_left(self._ns,
+                    log_index.ts_to_ns(timestamp))
+        self._skip_disabled()
+
+    def write(self, timestamp, data):
+        raise NotImplementedError
+
+    def _close(self):
+        self._entries = []
+        self._ns = log_index._column()
+        self._pos = 0
+        self._keyframes = None
+
+    def _count_range(self, start, end):
+        lo, hi = self._range(start, end)
+        return max(hi - lo, 0)
+
+    def _entry_at(self, index):
+        entries = self._entries
+        pos = bisect.bisect_left(_IndexColumn(entries), index)
+        if index < 0 or pos >= len(entries) or entries[pos][0] != index:
+            raise ilog.InvalidIndexError
+        return entries[pos]
+
+    def _eof(self):
+        return self._pos >= len(self._entries)
+
+    def _get_cur_pos(self):
+        if self._pos < len(self._entries):
+            return self._entries[self._pos][:2]
+        # Past the final entry, as for the file-based logs
+        index, ts = self._get_end()
+        return index + 1, ts
+
+    def _get_start(self):
+        if not self._entries:
+            return 0, ilog.EntryTS()
+        return self._entries[0][:2]
+
+    def _get_end(self):
+        if not self._entries:
+            return 0, ilog.EntryTS()
+        return self._entries[-1][:2]
+
+    def _iter_range(self, start, end, channels):
+        # The entries are only read, so no reader is needed
+        entries = self._entries
+        lo, hi = self._range(start, end)
+        for pos in xrange(lo, hi):
+            e = entries[pos]
+            if channels is None or read_ahead.entry_channel(e) in channels:
+                yield e
+
+    def _keyframe(self, timestamp):
+        codec = hdrpkl_log.ChannelCodec(self._meta)
+        if self._keyframes is None:
+            # The entries' own indices need not be consecutive, so the
+            # index is of positions in the list
+            index = log_index.MemoryIndex((ii, ns, ii, ii - 1,
+                codec.number(e[2]))
+                for ii, (e, ns) in enumerate(zip(self._entries, self._ns)))
+            self._keyframes = log_index.Keyframes(index, self._kf_interval)
+        if self._channels is None:
+            nums = None
+        else:
+            nums = codec.numbers(self._channels)
+        # Positions in the index are positions in the list
+        return [self._entries[pos]
+                for pos in self._keyframes.latest(timestamp, nums)]
+
+    def _range(self, start, end):
+        '''Get the list positions of the first entry at or after start and
+        of the entry after the last at or before end.'''
+        if start is None:
+            lo = 0
+        else:
+            lo = bisect.bisect_left(self._ns, log_index.ts_to_ns(start))
+        if end is None:
+            hi = len(self._entries)
+        else:
+            hi = bisect.bisect_right(self._ns, log_index.ts_to_ns(end))
+        return lo, hi
+
+    def _read_channels(self, timestamp, number):
+        # Read only the entries of the channels being read
+        entries = self._entries
+        chans = self._channels
+        if number is not None:
+            res = []
+            pos = self._pos
+            while pos < len(entries) and len(res) < number:
+                if read_ahead.entry_channel(entries[pos]) in chans:
+                    res.append(entries[pos])
+                pos += 1
+        else:
+            pos = bisect.bisect_right(self._ns, log_index.ts_to_ns(timestamp),
+                    self._pos)
+            res = [e for e in entries[self._pos:pos]
+                    if read_ahead.entry_channel(e) in chans]
+        self._pos = pos
+        self._skip_disabled()
+        return res
+
+    def _reader(self):
+        # Share the entries and their time stamps rather than copying them
+        r = MemoryLog(mode='r', meta=self._meta, verbose=self._vb)
+        r._entries = self._entries
+        r._ns = self._ns
+        r._size = self._size
+        return r
+
+    def _set_channels(self, channels):
+        self._skip_disabled()
+
+    def _skip_disabled(self):
+        # Move past entries of channels not being read
+        chans = self._channels
+        if chans is None:
+            return
+        entries = self._entries
+        while self._pos < len(entries) and \
+                read_ahead.entry_channel(entries[self._pos]) not in chans:
+            self._pos += 1
+
+    def _open(self):
+        if self._mode != 'r':
+            raise NotImplementedError
+        for index, ts, data in self._entries:
+            self._ns.append(log_index.ts_to_ns(ts))
+        self._vb_print('Holding {0} entries in memory.'.format(
+            len(self._entries)))
+
+
+class _IndexColumn(object):
+    '''A view of the indices of a list of entries, for bisecting.'''
+    def __init__(self, entries):
+        self._e = entries
+
+    def __getitem__(self, ii):
+        return self._e[ii][0]
+
+    def __len__(self):
+        return len(self._e)
+
+
+# Number of entries read from the log at a time when preloading
+PRELOAD_BLOCK = 1000
+# Approximate memory used to hold an entry, in addition to its data
+ENTRY_OVERHEAD = sys.getsizeof((0, 0, 0)) + sys.getsizeof(('', 0)) + \
+        sys.getsizeof(ilog.EntryTS()) + 8
+
+
+def preload(log, start=None, end=None, max_bytes=None, verbose=False):
+    '''Decode the entries of a log, or of a time window of it, into memory.
+
+    The log is read from the entry at or after start until the entry after
+    end, and is rewound afterwards, so that it can be streamed instead if the
+    limit is exceeded.
+
+    @param log The log to load from.
+    @param start The time, in seconds, of the first entry to load, or None to
+                 load from the start of the log.
+    @param end The time, in seconds, of the last entry to load, or None to
+               load to the end of the log.
+    @param max_bytes The maximum approximate memory to use, or None for no
+                     limit. TooLargeError is raised if it would be exceeded.
+    @return A MemoryLog with the same metadata as the log.
+
+    '''
+    if start is None:
+        log.rewind()
+    else:
+        log.seek(timestamp=start)
+    entries = []
+    size = 0
+    done = False
+    try:
+        while not done:
+            # Read in blocks so that the limit is checked as loading
+            # progresses
+            read = log.read(number=PRELOAD_BLOCK)
+            if not read:
+                break
+            if end is not None and read[-1][1] > end:
+                read = [e for e in read if e[1] <= end]
+                done = True
+            for e in read:
+                size += read_ahead.entry_size(e) + ENTRY_OVERHEAD
+            if max_bytes is not None and size > max_bytes:
+                raise TooLargeError(max_bytes)
+            entries.extend(read)
+    finally:
+        log.rewind()
+    return MemoryLog(entries=entries, size=size, mode='r',
+            meta=log.metadata, verbose=verbose)
+
+
+# vim: tw=79
@@ -0,0 +1,628 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Playback engine, independent of any user interface.
+
+'''
+
+
+import collections
+import threading
+
+import clock
+import read_ahead
+import scheduler
+import sinks
+
+
+def check_rate(rate):
+    '''Check a playback rate, raising ValueError unless it is a positive,
+    finite number or Player.MAX_RATE.
+
+    Returns the rate.
+
+    '''
+    if rate is not scheduler.Scheduler.MAX_RATE and \
+            not 0 < rate < float('inf'):
+        raise ValueError('Playback rate must be positive: {0}'.format(rate))
+    return rate
+
+
+class Player(object):
+    '''Plays the entries of a log to a sink.
+
+    Playback runs on the thread that calls @ref play. All other methods may
+    be called from any thread, including while playing.
+
+    '''
+    NO_CHANGE = 0
+    STOP = 1
+    JUMP = 2
+    RATE = 3
+    # Rate for playing as fast as the ports accept data
+    MAX_RATE = scheduler.Scheduler.MAX_RATE
+    # Entries played between flag checks when playing at MAX_RATE
+    MAX_RATE_BATCH = 100
+    # Maximum rate, in Hz, at which position updates are given during
+    # playback, no matter how many entries are played
+    POS_UPDATE_RATE = 20.0
+    # Catch-up policies, for when playback falls behind the clock
+    # Write every overdue entry
+    BURST = 'burst'
+    # Write only the newest overdue entry of each channel
+    LATEST = 'latest'
+    # Skip entries later than the catch-up threshold, except the newest
+    # overdue entry of each channel
+    DROP_LATE = 'drop-late'
+    CATCH_UP_POLICIES = [BURST, LATEST, DROP_LATE]
+    # Number of passes for looping until stopped
+    LOOP_FOREVER = None
+
+    def __init__(self, log, sink, rate=1.0, read_ahead_entries=1000,
+            read_ahead_bytes=None, spin_time=0.001, on_pos=None,
+            on_seek_started=None, on_seek_done=None, instruments=None,
+            catch_up=BURST, catch_up_threshold=0.05, passes=1,
+            reverse=False, keyframes=False):
+        '''Constructor.
+
+        @param log The log to play. It must not be used by anything else
+                   until @ref close is called. A mem_log.MemoryLog can be
+                   given to play without reading or decoding entries.
+        @param sink The sinks.Sink to write each entry's data to.
+        @param rate The playback rate, or MAX_RATE to play as fast as
+                    possible. See @ref check_rate.
+        @param read_ahead_entries The maximum number of entries to read ahead
+                                  of playback.
+        @param read_ahead_bytes The maximum approximate size of the data read
+                                ahead of playback, or None for no limit.
+        @param spin_time The time, in seconds, before an entry is due at which
+                         the player stops sleeping and spins.
+        @param on_pos A function called with the current position, as a float,
+                      when it changes during playback.
+        @param on_seek_started A function called with the target position when
+                               a seek is requested.
+        @param on_seek_done A function called with the new position when the
+                            latest requested seek has been performed. It is
+                            called on the read-ahead thread.
+        @param instruments An instrument.Instruments object to record
+                           statistics of each stage of playback in, or None.
+                           Skipped entries are recorded as dropped.
+        @param catch_up The catch-up policy: BURST, LATEST or DROP_LATE. It
+                        only applies when the rate is not MAX_RATE.
+        @param catch_up_threshold The lateness, in seconds, above which
+                                  entries are skipped by DROP_LATE.
+        @param passes The number of times to play the log before @ref play
+                      returns, or LOOP_FOREVER. Each pass after the first
+                      starts from the loop start given to @ref play as soon
+                      as the previous pass has ended.
+        @param reverse If True, the log is played backward, from the entry
+                       before the current position. Entries are due at the
+                       same intervals as forward.
+        @param keyframes If True, after each jump to a new position when
+                         playing forward, the latest entry before the
+                         position of each channel is written immediately, so
+                         that targets have the state of every channel without
+                         waiting for its next entry. See ilog.Log.keyframe.
+
+        '''
+        super(Player, self).__init__()
+        if catch_up not in self.CATCH_UP_POLICIES:
+            raise ValueError(catch_up)
+        self._l = log
+        # The log's own channel selection, restored on closing
+        self._log_channels = log.channels
+        self._rate = check_rate(rate)
+        self._reverse = reverse
+        self._sched = scheduler.Scheduler(rate=self._signed_rate(),
+                spin_time=spin_time)
+        self._start, port_specs = log.metadata
+        self._channels = [ps.name for ps in port_specs]
+        # The channels being played, or None for all
+        self._play_channels = None
+        # The write function for each channel, looked up once rather than for
+        # every entry
+        self._writers = sink.writers(self._channels)
+        # Whether the writers queue entries, in which case the sink records
+        # the time taken to write them
+        self._queued = sink.queues
+        self._on_pos = on_pos
+        self._on_seek_started = on_seek_started
+        self._instr = instruments
+        if on_seek_done:
+            on_moved = lambda pos: on_seek_done(pos[1].float)
+        else:
+            on_moved = None
+        # Entries are read and decoded ahead of playback on another thread.
+        # Seeks are also performed there, so they do not block the caller.
+        self._ra = read_ahead.ReadAhead(log, max_entries=read_ahead_entries,
+                max_bytes=read_ahead_bytes, on_moved=on_moved,
+                instruments=instruments, reverse=reverse)
+        self._m = threading.Lock()
+        # When True, play() will return
+        self._stop = False
+        # When True, the position has been changed (e.g. rewind)
+        self._jump = False
+        # When True, the rate has been changed
+        self._rate_changed = False
+        # The latest position seeked to
+        self._seek_target = None
+        # Monotonic clock time after which the next position update is due
+        self._next_pos_update = 0.0
+        # Log time after which playback ends
+        self._end = None
+        self._played = 0
+        self._catch_up = catch_up
+        self._catch_up_threshold = catch_up_threshold
+        # Entries skipped by the catch-up policy, per channel
+        self._skipped = collections.defaultdict(int)
+        self._passes = passes
+        # Passes completed by the current or last call to play()
+        self._passes_done = 0
+        self._keyframes = keyframes
+
+    def close(self):
+        '''Stop reading the log. The player cannot be used afterwards.
+
+        The channels the log reads are restored to those it read before the
+        player was made, so that it can be used for something else.
+
+        '''
+        self.stop()
+        self._ra.close()
+        self._l.set_channels(self._log_channels)
+
+    @property
+    def catch_up(self):
+        '''The catch-up policy and threshold.'''
+        return self._catch_up, self._catch_up_threshold
+
+    @property
+    def channels(self):
+        '''The names of the channels being played, or None for all.'''
+        return self._play_channels
+
+    @property
+    def end(self):
+        '''The position of the final entry in the log.'''
+        return self._ra.end
+
+    @property
+    def instruments(self):
+        '''The instrument.Instruments recording statistics, or None.'''
+        return self._instr
+
+    @property
+    def keyframes(self):
+        '''True if the state of each channel is written after a jump.'''
+        return self._keyframes
+
+    @property
+    def lateness(self):
+        '''Statistics of how late entries have been played.
+
+        See scheduler.Scheduler.lateness.
+
+        '''
+        return self._sched.lateness
+
+    @property
+    def passes(self):
+        '''The number of passes to play, or LOOP_FOREVER.'''
+        return self._passes
+
+    @property
+    def passes_done(self):
+        '''The number of passes completed by the current or last call to
+        @ref play.'''
+        return self._passes_done
+
+    @property
+    def played(self):
+        '''The number of entries written, not counting skipped entries.'''
+        return self._played
+
+    @property
+    def pos(self):
+        '''The position of the next entry to be played.'''
+        return self._ra.pos
+
+    @property
+    def rate(self):
+        '''The playback rate, or MAX_RATE.'''
+        return self._rate
+
+    @property
+    def reverse(self):
+        '''True if playing backward.'''
+        return self._reverse
+
+    @property
+    def seeking(self):
+        '''True if a seek has been requested but not yet performed.'''
+        return self._ra.seeking
+
+    @property
+    def skipped(self):
+        '''The number of entries skipped by the catch-up policy.'''
+        return sum(self._skipped.values())
+
+    @property
+    def skipped_channels(self):
+        '''A dictionary of channel name: number of entries skipped by the
+        catch-up policy.'''
+        return dict(self._skipped)
+
+    @property
+    def start(self):
+        '''The position of the first entry in the log.'''
+        return self._ra.start
+
+    def set_catch_up(self, policy, threshold=None):
+        '''Change the catch-up policy, and optionally its threshold.'''
+        if policy not in self.CATCH_UP_POLICIES:
+            raise ValueError(policy)
+        with self._m:
+            self._catch_up = policy
+            if threshold is not None:
+                self._catch_up_threshold = threshold
+
+    def set_channels(self, channels):
+        '''Play only the entries of some channels, or all if None.
+
+        Entries of other channels are skipped by the log reader, without
+        decoding their data where the log format allows. Playback continues
+        from the same position.
+
+        '''
+        if channels is not None:
+            channels = frozenset(channels)
+        self._play_channels = channels
+        self._ra.set_channels(channels)
+
+    def set_keyframes(self, keyframes):
+        '''Turn writing the state of each channel after a jump on or off.'''
+        with self._m:
+            self._keyframes = keyframes
+
+    def set_passes(self, passes):
+        '''Change the number of passes to play, or LOOP_FOREVER.
+
+        Takes effect at the end of the current pass.
+
+        '''
+        with self._m:
+            self._passes = passes
+
+    def set_rate(self, rate):
+        '''Change the playback rate without changing the position.
+
+        ValueError is raised, and the rate is not changed, if the rate is not
+        valid. See @ref check_rate.
+
+        '''
+        check_rate(rate)
+        with self._m:
+            self._rate = rate
+            self._rate_changed = True
+
+    def set_reverse(self, reverse):
+        '''Change the direction of playback.
+
+        Playback continues from the entry next to the one played last, in the
+        new direction, with log time running the other way from the current
+        time.
+
+        '''
+        with self._m:
+            if reverse == self._reverse:
+                return
+            self._reverse = reverse
+            self._ra.set_reverse(reverse)
+            self._rate_changed = True
+
+    def set_sink(self, sink):
+        '''Change the sink entries are played to.'''
+        writers = sink.writers(self._channels)
+        with self._m:
+            self._writers = writers
+            self._queued = sink.queues
+
+    def rewind(self):
+        self.skip_to(self._ra.start[1].float)
+
+    def skip_back(self):
+        new_pos = self._nominal_pos() - 60
+        if new_pos < self._ra.start[1].float:
+            new_pos = self._ra.start[1].float
+        self.skip_to(new_pos)
+
+    def skip_forward(self):
+        new_pos = self._nominal_pos() + 60
+        if new_pos > self._ra.end[1].float:
+            new_pos = self._ra.end[1].float
+        self.skip_to(new_pos)
+
+    def skip_to(self, new_pos):
+        '''Move to a new position.
+
+        Returns without waiting for the seek to be performed. A seek that has
+        not yet been started when another is requested is abandoned.
+
+        '''
+        with self._m:
+            self._seek_target = new_pos
+            self._ra.seek(timestamp=new_pos, keyframe=self._keyframes)
+            self._jump = True
+        if self._on_seek_started:
+            self._on_seek_started(new_pos)
+
+    def stop(self):
+        with self._m:
+            self._stop = True
+
+    def play(self, end=None, loop_start=None):
+        '''Play from the current position.
+
+        Returns when the end of the log is reached, or an entry after the end
+        time would be played, on the last pass, or when @ref stop is called.
+        In reverse, the start of the log is the end, and the end time is the
+        earliest time to play.
+
+        @param end The log time, in seconds, of the last entry to play, or None
+                   to play to the end of the log.
+        @param loop_start The log time, in seconds, to start each pass after
+                          the first from, or None to start them from the first
+                          entry (the final entry in reverse).
+        @return True if the end was reached, False if playback was stopped.
+
+        '''
+        self._end = end
+        self._passes_done = 0
+        pass_start = self._played
+        self._jump = False
+        self._stop = False
+        with self._m:
+            self._rate_changed = False
+            self._sched.set_rate(self._signed_rate())
+        self._update_times()
+        # "Play it again, Sam." is a misquotation.
+        while True:
+            if self._sched.unthrottled:
+                # Play a batch of entries, then check the flags
+                more = self._play(timestamp=end, number=self.MAX_RATE_BATCH)
+            else:
+                # Play every entry due by the current time in log-time
+                now = self._sched.now()
+                if end is not None:
+                    if self._reverse:
+                        now = max(now, end)
+                    else:
+                        now = min(now, end)
+                more = self._play(timestamp=now)
+            if not more:
+                self._passes_done += 1
+                with self._m:
+                    passes = self._passes
+                # A pass that played nothing would repeat forever
+                if (passes is self.LOOP_FOREVER or
+                        self._passes_done < passes) and \
+                        self._played > pass_start:
+                    pass_start = self._played
+                    self._loop(loop_start)
+                    continue
+                self._update_pos(force=True)
+                return True
+            # Check flags
+            flags = self._check_flags()
+            if flags == self.STOP:
+                # A stop flag was set
+                return False
+            elif flags == self.JUMP:
+                # The user has changed the log position
+                self._update_times()
+            elif flags == self.RATE:
+                self._change_rate()
+            elif not self._sched.unthrottled:
+                # Sleep until the next entry
+                if not self._wait_for_next():
+                    return False
+
+    def _check_flags(self):
+        res = self.NO_CHANGE
+        with self._m:
+            if self._stop:
+                self._stop = False
+                res = self.STOP
+            elif self._jump:
+                self._jump = False
+                res = self.JUMP
+            elif self._rate_changed:
+                res = self.RATE
+        return res
+
+    def _change_rate(self):
+        with self._m:
+            self._rate_changed = False
+            rate = self._signed_rate()
+        if self._sched.unthrottled or rate is self.MAX_RATE:
+            # Log time does not follow the clock at the maximum rate, so
+            # restart from the next entry
+            self._sched.set_rate(rate, self._cur_pos().float)
+        else:
+            self._sched.set_rate(rate)
+
+    def _cur_pos(self):
+        return self._ra.pos[1]
+
+    def _loop(self, loop_start):
+        # Go back to the loop start and restart the schedule from there, so
+        # that the next pass follows on from the end of this one
+        if loop_start is None:
+            if self._reverse:
+                loop_start = self._ra.end[1].float
+            else:
+                loop_start = self._ra.start[1].float
+        with self._m:
+            self._seek_target = loop_start
+            self._ra.seek(timestamp=loop_start, keyframe=self._keyframes)
+        self._update_times()
+
+    def _nominal_pos(self):
+        # The current position, or the target of an unfinished seek, without
+        # waiting for the seek
+        with self._m:
+            if self._ra.seeking:
+                return self._seek_target
+        return self._cur_pos().float
+
+    def _past_end(self, pos):
+        if self._reverse:
+            return pos < self._end
+        return pos > self._end
+
+    def _play(self, timestamp=None, number=None):
+        '''Play the entries due by a time, or a number of entries.
+
+        Returns False at the end of the log or after the end time.
+
+        '''
+        with self._m:
+            writers = self._writers
+            queued = self._queued
+            catch_up = self._catch_up
+            threshold = self._catch_up_threshold
+        if self._sched.unthrottled:
+            # Nothing is late when playing as fast as possible
+            catch_up = self.BURST
+        played = False
+        while True:
+            entries = self._ra.read(timestamp=timestamp, number=number)
+            if not entries:
+                break
+            if catch_up != self.BURST and len(entries) > 1:
+                entries = self._skip_overdue(entries, catch_up, threshold)
+            if self._instr:
+                self._play_instrumented(entries, writers, queued)
+            else:
+                for index, ts, (p_name, data) in entries:
+                    writers[p_name](data)
+            self._played += len(entries)
+            played = True
+            if number is not None:
+                break
+        if not played and self._ra.eof:
+            return False
+        if self._end is not None and self._past_end(self._cur_pos().float):
+            return False
+        self._update_pos()
+        return True
+
+    def _play_instrumented(self, entries, writers, queued):
+        instr = self._instr
+        deadline = self._sched.deadline
+        timed = not self._sched.unthrottled
+        # Writing to a queue is timed separately from the write itself
+        record = instr.enqueue if queued else instr.write
+        for index, ts, (p_name, data) in entries:
+            t = clock.monotonic()
+            if timed:
+                instr.lateness(p_name, t - deadline(ts.float))
+            writers[p_name](data)
+            record(p_name, clock.monotonic() - t)
+
+    def _signed_rate(self):
+        # The scheduler's rate, which is negative when log time runs backward
+        if self._rate is self.MAX_RATE or not self._reverse:
+            return self._rate
+        return -self._rate
+
+    def _skip_overdue(self, entries, policy, threshold):
+        # Apply a catch-up policy to a batch of overdue entries, returning the
+        # entries to write
+        newest = {}
+        for ii, (index, ts, (p_name, data)) in enumerate(entries):
+            newest[p_name] = ii
+        if len(newest) == len(entries):
+            # No channel has more than one entry to write
+            return entries
+        if policy == self.LATEST:
+            keep = lambda ii, ts, p_name: newest[p_name] == ii
+        else:
+            # Entries due before this log time (after it in reverse) are
+            # later than the threshold
+            limit = self._sched.now() - threshold * self._sched.rate
+            if self._reverse:
+                keep = lambda ii, ts, p_name: newest[p_name] == ii or \
+                        ts.float <= limit
+            else:
+                keep = lambda ii, ts, p_name: newest[p_name] == ii or \
+                        ts.float >= limit
+        result = []
+        for ii, entry in enumerate(entries):
+            index, ts, (p_name, data) = entry
+            if keep(ii, ts, p_name):
+                result.append(entry)
+            else:
+                self._skipped[p_name] += 1
+                if self._instr:
+                    self._instr.drop(p_name)
+        return result
+
+    def _update_times(self):
+        self._play_start = self._cur_pos().float
+        self._write_keyframe()
+        self._sched.reset(self._play_start)
+        self._update_pos(force=True)
+
+    def _update_pos(self, force=False):
+        # Coalesce position updates so that a user interface is not flooded
+        # by logs with high entry rates
+        if not self._on_pos:
+            return
+        now = clock.monotonic()
+        if force or now >= self._next_pos_update:
+            self._next_pos_update = now + 1.0 / self.POS_UPDATE_RATE
+            self._on_pos(self._cur_pos().float)
+
+    def _wait_for_next(self):
+        # Sleep until the next entry is due, checking the flags periodically
+        flags = [self.NO_CHANGE]
+        def check():
+            flags[0] = self._check_flags()
+            return flags[0] != self.NO_CHANGE
+        self._sched.wait_until(self._cur_pos().float, check)
+        if flags[0] == self.STOP:
+            return False
+        elif flags[0] == self.JUMP:
+            self._update_times()
+        elif flags[0] == self.RATE:
+            self._change_rate()
+        return True
+
+    def _write_keyframe(self):
+        # Write the state of each channel at the new position, read by the
+        # seek, immediately
+        entries = self._ra.take_keyframe()
+        if not entries:
+            return
+        with self._m:
+            writers = self._writers
+        for index, ts, (p_name, data) in entries:
+            writers[p_name](data)
+        self._played += len(entries)
+
+
+# vim: tw=79
@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Background reader that decodes log entries ahead of playback.
+
+'''
+
+
+import collections
+import sys
+import threading
+import traceback
+
+import clock
+import ilog
+
+
+def entry_size(entry):
+    '''Estimate the memory used by the data of a log entry.
+
+    Only the data object and its direct attributes are counted, which is
+    enough to account for large sequence members of RTC data types.
+
+    '''
+    data = entry[2]
+    if type(data) == tuple and len(data) == 2:
+        data = data[1]
+    size = sys.getsizeof(data)
+    for v in getattr(data, '__dict__', {}).itervalues():
+        size += sys.getsizeof(v)
+    return size
+
+
+def entry_channel(entry):
+    '''Get the channel of a log entry, or None if it has no channel.'''
+    data = entry[2]
+    if type(data) == tuple and len(data) == 2:
+        return data[0]
+    return None
+
+
+class ReadAhead(object):
+    '''Reads entries from a log into a bounded buffer on its own thread.
+
+    The buffer holds at most max_entries entries and, if max_bytes is given,
+    at most approximately max_bytes bytes of data (at least one entry is
+    always buffered). The reader thread is started on construction and runs
+    until @ref close is called. All access to the log while the reader is
+    running must go through this object, as the reader thread moves the log's
+    position.
+
+    Seeks are also performed by the reader thread, so requesting one does not
+    block. A seek requested while another is waiting to be performed replaces
+    it; only the latest requested position is honoured.
+
+    In reverse, entries are buffered in descending order. The reader fetches
+    them in blocks of up to BACK_BLOCK entries, seeking by index to the start
+    of each block and reading it forward, so a log with an index (or a
+    blk_log.BlockLog) is needed to read backward without rescanning.
+
+    '''
+    # Maximum number of entries read at a time in reverse
+    BACK_BLOCK = 100
+
+    def __init__(self, log, max_entries=1000, max_bytes=None,
+            sizeof=entry_size, on_moved=None, instruments=None,
+            reverse=False):
+        '''Constructor.
+
+        @param log The log to read.
+        @param max_entries The maximum number of entries to buffer.
+        @param max_bytes The maximum approximate size of the buffered data, or
+                         None for no limit.
+        @param sizeof A function estimating the size of an entry's data.
+        @param on_moved A function called on the reader thread with the new
+                        position each time a seek or rewind has been
+                        performed.
+        @param instruments An instrument.Instruments object to record the
+                           time taken to read and decode each entry in, or
+                           None.
+        @param reverse If True, entries are read backward from the log's
+                       current position, starting with the entry before it.
+
+        '''
+        super(ReadAhead, self).__init__()
+        self._l = log
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._on_moved = on_moved
+        self._instr = instruments
+        # The first and last positions do not change while reading, and are
+        # kept so that they can be got without waiting for the log
+        self._start = log.start
+        self._end = log.end
+        # Protects the buffer and state below; the log itself is only used
+        # by the reader thread
+        self._cond = threading.Condition(threading.Lock())
+        self._buf = collections.deque()
+        self._bytes = 0
+        self._eof = False
+        self._eof_pos = None
+        # The exception that stopped reading before the end of the log
+        self._error = None
+        self._stop = False
+        # Incremented on every position change to discard stale reads
+        self._gen = 0
+        # The latest requested move not yet performed by the reader thread
+        self._pending_move = None
+        self._moving = False
+        # A channel change to apply before the next move, as (channels,), so
+        # that it is kept if the move is replaced by a seek
+        self._new_channels = None
+        # The keyframe entries read by the latest move, and those read by the
+        # move being performed
+        self._keyframe = []
+        self._move_keyframe = []
+        # Index of the next entry to be popped, when known
+        self._next_index = log.pos[0]
+        self._reverse = reverse
+        # Index of the latest entry popped since the last move, or None
+        self._last_popped = None
+        # The latest move performed, repeated when the direction changes
+        first = self._next_index
+        self._last_move = lambda rev: self._move_to_index(first, rev)
+        # When reading in reverse, the index before which the reader thread
+        # reads the next block
+        self._hi = first
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def end(self):
+        '''The position of the final entry in the log.'''
+        return self._end
+
+    @property
+    def eof(self):
+        '''True if all entries up to the end of the log, or the start in
+        reverse, have been popped.'''
+        with self._cond:
+            return self._eof and not self._buf
+
+    @property
+    def error(self):
+        '''The exception that stopped reading, or None.
+
+        If reading the log fails, the entries already read are still
+        returned, and reading then stops as if the end of the log had been
+        reached. Moving to a new position clears the error and reading
+        continues from there.
+
+        '''
+        with self._cond:
+            return self._error
+
+    @property
+    def pos(self):
+        '''The position of the next entry to be popped.
+
+        Waits for the entry to be read if necessary. At the end of the log,
+        this is the log's end-of-file position. At the start in reverse, it
+        is the position of the first entry.
+
+        '''
+        with self._cond:
+            self._wait_for_entry()
+            if self._buf:
+                return self._buf[0][0], self._buf[0][1]
+            return self._eof_pos
+
+    @property
+    def reverse(self):
+        '''True if entries are read backward.'''
+        return self._reverse
+
+    @property
+    def seeking(self):
+        '''True if a seek or rewind has not yet been completed.'''
+        with self._cond:
+            return self._pending_move is not None or self._moving
+
+    @property
+    def start(self):
+        '''The position of the first entry in the log.'''
+        return self._start
+
+    def close(self):
+        '''Stop the reader thread.'''
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def pop(self):
+        '''Get the next entry, waiting for it to be read if necessary.
+
+        Returns None at the end of the log.
+
+        '''
+        with self._cond:
+            self._wait_for_entry()
+            if not self._buf:
+                return None
+            entry, size = self._buf.popleft()[2:]
+            self._bytes -= size
+            self._popped(entry[0])
+            self._cond.notify_all()
+            return entry
+
+    def read(self, timestamp=None, number=None):
+        '''Get the next entries, waiting for the next to be read if necessary.
+
+        Takes the same arguments as ilog.Log.read, except that if both a time
+        limit and a number are given, reading stops at whichever is reached
+        first. In reverse, the time limit is the earliest time to read. All
+        entries are taken from the buffer under a single acquisition of the
+        lock. Only entries that have already been read ahead are returned, so
+        fewer entries than requested may be returned even before the end of
+        the log.
+
+        Returns an empty list at the end of the log, or if no entry is due by
+        the time limit.
+
+        '''
+        if timestamp is None and number is None:
+            number = 1
+        if timestamp is not None:
+            # Compared as time stamps, without converting each entry's time
+            # stamp to a float
+            timestamp = ilog.EntryTS(time=timestamp)
+        result = []
+        with self._cond:
+            self._wait_for_entry()
+            buf = self._buf
+            reverse = self._reverse
+            size = 0
+            while buf:
+                if number is not None and len(result) >= number:
+                    break
+                if timestamp is not None:
+                    if reverse:
+                        if buf[0][1] < timestamp:
+                            break
+                    elif buf[0][1] > timestamp:
+                        break
+                e = buf.popleft()
+                result.append(e[2])
+                size += e[3]
+            if result:
+                self._bytes -= size
+                self._popped(result[-1][0])
+                self._cond.notify_all()
+        return result
+
+    def rewind(self):
+        '''Move to the start of the log, discarding buffered entries.
+
+        Returns without waiting for the move to be performed.
+
+        '''
+        def move(reverse):
+            self._l.rewind()
+            if reverse:
+                # Only the first entry is before the start
+                return self._start[0] + 1
+        self._move(move)
+
+    def seek(self, timestamp=None, index=None, keyframe=False):
+        '''Move to a new position in the log, discarding buffered entries.
+
+        In reverse, the next entry is the last one at or before the time or
+        index. Returns without waiting for the move to be performed.
+
+        @param keyframe If True and moving forward to a time, the latest
+                        entry before the time of each channel is also read,
+                        to be got with @ref take_keyframe.
+
+        '''
+        def move(reverse):
+            if index is not None:
+                return self._move_to_index(index, reverse)
+            elif timestamp is None:
+                return None
+            elif not reverse:
+                if keyframe:
+                    try:
+                        self._move_keyframe = self._l.keyframe(timestamp)
+                    except NotImplementedError:
+                        pass
+                self._l.seek(timestamp=timestamp)
+                return None
+            # Find the first entry after the time; reading back starts with
+            # the entry before it
+            self._l.seek(timestamp=ilog.EntryTS.from_ns(
+                ilog.to_ns(timestamp) + 1))
+            return self._log_next()
+        self._move(move)
+
+    def set_channels(self, channels):
+        '''Restrict reading to the entries of some channels.
+
+        See ilog.Log.set_channels. Buffered entries are discarded and reading
+        continues from the next entry to be popped, or from the position of a
+        seek that has not yet been performed. Returns without waiting for the
+        change to be made.
+
+        '''
+        with self._cond:
+            prev = self._pending_move
+            head = self._next_index
+            self._new_channels = (channels,)
+        def move(reverse):
+            if prev is not None:
+                return prev(reverse)
+            elif head is not None:
+                return self._move_to_index(head, reverse)
+        self._move(move)
+
+    def set_reverse(self, reverse):
+        '''Change the direction of reading.
+
+        Buffered entries are discarded. Reading continues from the entry
+        after the one popped last, in the new direction, so it is not read
+        again. If nothing has been popped since the last seek, the seek is
+        repeated in the new direction. Returns without waiting for the change
+        to be made.
+
+        '''
+        with self._cond:
+            if reverse == self._reverse:
+                return
+            prev = self._pending_move
+            last = self._last_popped
+            last_move = self._last_move
+        def move(rev):
+            if prev is not None:
+                return prev(rev)
+            elif last is not None:
+                if rev:
+                    return last
+                return self._move_to_index(last + 1, rev)
+            return last_move(rev)
+        self._move(move, reverse=reverse)
+
+    def take_keyframe(self):
+        '''Get the keyframe entries read by the latest seek, once.
+
+        Waits for the seek to be performed. Returns a list of (index,
+        timestamp, data) tuples in log order, which is empty if the seek did
+        not read a keyframe or the entries have already been taken.
+
+        '''
+        with self._cond:
+            self._wait_for_entry()
+            result = self._keyframe
+            self._keyframe = []
+            return result
+
+    def _add(self, entries, eof_pos):
+        # Must be called with _cond held. No entries means the end of the log
+        # has been reached, at eof_pos.
+        if not entries:
+            self._eof = True
+            self._eof_pos = eof_pos
+        for e in entries:
+            size = self._sizeof(e)
+            self._buf.append(e[:2] + (e, size))
+            self._bytes += size
+
+    def _full(self):
+        if len(self._buf) >= self._max_entries:
+            return True
+        if self._max_bytes is not None and self._buf and \
+                self._bytes >= self._max_bytes:
+            return True
+        return False
+
+    def _log_next(self):
+        '''Get the index of the next entry the log will read, reading it.
+
+        At the end of the log, this is one past the final entry.
+
+        '''
+        entries = self._l.read()
+        if entries:
+            return entries[0][0]
+        return self._end[0] + 1
+
+    def _move(self, move, reverse=None):
+        '''Request a move, performed by calling move(reverse) on the reader
+        thread.
+
+        The move positions the log for reading forward. In reverse, it
+        returns the index before which to start reading back, or None to
+        start before the log's position.
+
+        '''
+        with self._cond:
+            self._gen += 1
+            self._buf.clear()
+            self._bytes = 0
+            self._eof = False
+            self._eof_pos = None
+            self._error = None
+            self._next_index = None
+            self._last_popped = None
+            self._keyframe = []
+            if reverse is not None:
+                self._reverse = reverse
+            # Readers of the buffer will wait until the reader thread has
+            # read from the new position
+            self._pending_move = move
+            self._cond.notify_all()
+
+    def _move_to_index(self, index, reverse):
+        if reverse:
+            # Reading back is by index, so the log need not be moved
+            return min(index, self._end[0]) + 1
+        self._l.seek(index=index)
+
+    def _popped(self, index):
+        # Must be called with _cond held
+        self._last_popped = index
+        if self._reverse:
+            self._next_index = index - 1
+        else:
+            self._next_index = index + 1
+
+    def _read_back(self, count):
+        '''Read up to count entries before the reverse position, latest
+        first.
+
+        Returns an empty list at the start of the log. Blocks that hold no
+        entries of the channels being read are passed over.
+
+        '''
+        start = self._start[0]
+        while self._hi > start:
+            lo = max(self._hi - count, start)
+            self._l.seek(index=lo)
+            if self._l.channels is None:
+                # Indices need not be consecutive (e.g. in a memory log
+                # preloaded from some channels), so the entries read may go
+                # past the end of the block
+                entries = [e for e in self._l.read(number=self._hi - lo)
+                        if e[0] < self._hi]
+            else:
+                # Entries of other channels are skipped, so read until
+                # passing the end of the block
+                entries = []
+                while True:
+                    e = self._l.read()
+                    if not e or e[0][0] >= self._hi:
+                        break
+                    entries.append(e[0])
+            self._hi = lo
+            if entries:
+                entries.reverse()
+                return entries
+        return []
+
+    def _read_entries(self, reverse, count):
+        # Read the next entry, or in reverse the next block of entries
+        if self._instr:
+            t = clock.monotonic()
+        if reverse:
+            entries = self._read_back(count)
+        else:
+            entries = self._l.read()
+        if self._instr and entries:
+            t = (clock.monotonic() - t) / len(entries)
+            for e in entries:
+                self._instr.decode(entry_channel(e), t)
+        return entries
+
+    def _read_failed(self, error):
+        # Reading stops where it failed, as if the end of the log had been
+        # reached there, until the next move
+        with self._cond:
+            self._moving = False
+            self._error = error
+            if self._pending_move is None:
+                self._eof = True
+                if self._eof_pos is None:
+                    self._eof_pos = self._l.pos
+            self._cond.notify_all()
+
+    def _run(self):
+        try:
+            while True:
+                try:
+                    if not self._step():
+                        return
+                except Exception, e:
+                    traceback.print_exc()
+                    self._read_failed(e)
+        finally:
+            # Nothing more will be read, so nothing must wait for it
+            with self._cond:
+                self._stop = True
+                self._cond.notify_all()
+
+    def _step(self):
+        # Perform a move or read the next entries. Returns False when the
+        # thread is to stop.
+        with self._cond:
+            while not self._stop and self._pending_move is None and \
+                    (self._eof or self._full()):
+                self._cond.wait()
+            if self._stop:
+                return False
+            move = self._pending_move
+            self._pending_move = None
+            self._moving = move is not None
+            new_channels = self._new_channels
+            self._new_channels = None
+            gen = self._gen
+            reverse = self._reverse
+            space = self._max_entries - len(self._buf)
+        if new_channels is not None:
+            self._l.set_channels(new_channels[0])
+        if move is not None:
+            self._move_keyframe = []
+            hi = move(reverse)
+            if reverse:
+                self._hi = self._log_next() if hi is None else hi
+                # Read the first block now, so that the new position is known
+                entries = self._read_entries(reverse, self.BACK_BLOCK)
+                pos = entries[0][:2] if entries else self._start
+            else:
+                pos = self._l.pos
+            with self._cond:
+                self._moving = False
+                if gen == self._gen:
+                    self._last_move = move
+                    self._next_index = pos[0]
+                    self._keyframe = self._move_keyframe
+                    if reverse:
+                        self._add(entries, pos)
+                self._cond.notify_all()
+            if self._on_moved and gen == self._gen:
+                self._on_moved(pos)
+            return True
+        entries = self._read_entries(reverse,
+                max(min(self.BACK_BLOCK, space), 1))
+        pos = None
+        if not entries:
+            pos = self._start if reverse else self._l.pos
+        with self._cond:
+            if gen != self._gen:
+                # The position changed while reading
+                return True
+            self._add(entries, pos)
+            self._cond.notify_all()
+        return True
+
+    def _wait_for_entry(self):
+        # Must be called with _cond held
+        while not self._buf and not self._eof and not self._stop:
+            self._cond.wait()
+
+
+# vim: tw=79
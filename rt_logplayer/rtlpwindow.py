@@ -20,30 +20,50 @@ Main window implementation.
 
 
 import math
-import OpenRTM_aist
 from PySide import QtCore
 from PySide import QtGui
-import RTC
-import rtctree.exceptions
-import rtctree.utils
-import rtshell.comp_mgmt
-import rtshell.modmgr
 import sys
 import time
 
-import facade_comp
 import ilog
+import instrument
+import log_formats
 import log_info
 import log_player
 import log_targets
-import simpkl_log
-import rtctree_mdl
+import mem_log
+import sinks
+
+# The CORBA, rtctree and rtshell modules are slow to import, so they are not
+# imported until a name server is added or playback needs the facade
+# component. This lets the window appear immediately.
 
 
 class RTLPWindow(QtGui.QMainWindow):
     NO_FILE = 1
     STOPPED = 2
     PLAYING = 3
+    # Interval, in milliseconds, between updates of the statistics display
+    STATS_UPDATE_INTERVAL = 500
+    # Playback rates offered in the rate selector
+    RATES = [0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0,
+            log_player.LogPlayer.MAX_RATE]
+    # Ways of writing channels offered in the dispatch selector: None to write
+    # every channel from the playback thread, or the overflow policy of a
+    # writer thread per channel
+    DISPATCH = [None, sinks.DROP_OLDEST, sinks.DROP_NEWEST, sinks.BLOCK]
+    # Maximum number of entries queued for each writer thread
+    WRITER_QUEUE_SIZE = 100
+    # Catch-up policies offered in the catch-up selector
+    CATCH_UP = [log_player.LogPlayer.BURST, log_player.LogPlayer.LATEST,
+            log_player.LogPlayer.DROP_LATE]
+    # Lateness, in seconds, above which entries are skipped when dropping
+    # late entries
+    CATCH_UP_THRESHOLD = 0.05
+    # Maximum approximate memory, in bytes, to use for a preloaded log
+    PRELOAD_MAX_BYTES = 256 * 1024 * 1024
+    # Time, in milliseconds, to show status bar messages for
+    MESSAGE_TIMEOUT = 5000
 
     def __init__(self, parent=None):
         super(RTLPWindow, self).__init__(parent)
@@ -52,14 +72,21 @@ class RTLPWindow(QtGui.QMainWindow):
         self._log_fn = None
         # Plays the log file
         self._log_player = None
+        # The log file's entries, when preloaded into memory for playback
+        self._mem_log = None
         # The model representing channels and targets in the log
         self._log_targets = None
         # The model wrapper for the RTC Tree
         self._tree = None
         # Stores the index of the currently-selected channel
         self._cur_chan = None
-        # The module manager
-        self._mm = rtshell.modmgr.ModuleMgr()
+        # The module manager, created when first needed
+        self._mm = None
+        # The facade component providing the ports to play to, and its manager
+        self._comp = None
+        self._mgr = None
+        # The sink writing to the facade component
+        self._sink = None
         # An ever-increasing counter to track connections
         self._id_cnt = 0
 
@@ -142,11 +169,61 @@ class RTLPWindow(QtGui.QMainWindow):
             QtGui.QStyle.SP_FileIcon))
         self._load_mod_act.triggered.connect(self._load_mod)
 
+        self._save_stats_act = QtGui.QAction(
+                self.tr('&Save playback statistics'), self)
+        self._save_stats_act.setShortcuts([QtGui.QKeySequence(
+            QtCore.Qt.CTRL + QtCore.Qt.Key_T)])
+        self._save_stats_act.setStatusTip(self.tr('Save the statistics of '
+            'playback as CSV or JSON'))
+        self._save_stats_act.setIcon(self.style().standardIcon(
+            QtGui.QStyle.SP_DialogSaveButton))
+        self._save_stats_act.triggered.connect(self._save_stats)
+        self._save_stats_act.setEnabled(False)
+
+        self._preload_act = QtGui.QAction(self.tr('&Preload into memory'),
+                self)
+        self._preload_act.setStatusTip(self.tr('Decode the log into memory '
+            'once and play it from there, if it fits'))
+        self._preload_act.setIcon(self.style().standardIcon(
+            QtGui.QStyle.SP_DriveHDIcon))
+        self._preload_act.setCheckable(True)
+        self._preload_act.toggled.connect(self._set_preload)
+
+        self._loop_act = QtGui.QAction(self.tr('L&oop playback'), self)
+        self._loop_act.setStatusTip(self.tr('Play the log again from the '
+            'start each time the end is reached'))
+        self._loop_act.setIcon(self.style().standardIcon(
+            QtGui.QStyle.SP_BrowserReload))
+        self._loop_act.setCheckable(True)
+        self._loop_act.toggled.connect(self._set_loop)
+
+        self._reverse_act = QtGui.QAction(self.tr('Play &backward'), self)
+        self._reverse_act.setStatusTip(self.tr('Play the log in reverse, '
+            'from the current position towards the start'))
+        self._reverse_act.setIcon(self.style().standardIcon(
+            QtGui.QStyle.SP_MediaSeekBackward))
+        self._reverse_act.setCheckable(True)
+        self._reverse_act.toggled.connect(self._set_reverse)
+
+        self._keyframe_act = QtGui.QAction(self.tr('Send &keyframes'), self)
+        self._keyframe_act.setStatusTip(self.tr('After jumping to a new '
+            'position, send the latest value of each channel before it'))
+        self._keyframe_act.setIcon(self.style().standardIcon(
+            QtGui.QStyle.SP_FileDialogInfoView))
+        self._keyframe_act.setCheckable(True)
+        self._keyframe_act.toggled.connect(self._set_keyframes)
+
         self._tb = self.addToolBar(self.tr('Log'))
         self._tb.setObjectName('Toolbar')
         self._tb.addAction(self._open_act)
         self._tb.addAction(self._close_act)
         self._tb.addAction(self._log_info_act)
+        self._tb.addAction(self._save_stats_act)
+        self._tb.addSeparator()
+        self._tb.addAction(self._preload_act)
+        self._tb.addAction(self._loop_act)
+        self._tb.addAction(self._reverse_act)
+        self._tb.addAction(self._keyframe_act)
         self._tb.addSeparator()
         self._tb.addAction(self._add_ns_act)
         self._tb.addAction(self._rem_ns_act)
@@ -166,6 +243,12 @@ class RTLPWindow(QtGui.QMainWindow):
         self._sb_lst_info = QtGui.QLabel()
         self._sb_lst_info.setObjectName('StatBarLstInfo')
         sb.addWidget(self._sb_time)
+        self._sb_stats = QtGui.QLabel()
+        self._sb_stats.setObjectName('StatBarStats')
+        sb.addPermanentWidget(self._sb_stats)
+        self._stats_timer = QtCore.QTimer(self)
+        self._stats_timer.setInterval(self.STATS_UPDATE_INTERVAL)
+        self._stats_timer.timeout.connect(self._update_stats)
 
     def _make_widgets(self):
         central = QtGui.QWidget(self)
@@ -230,6 +313,40 @@ class RTLPWindow(QtGui.QMainWindow):
         self._skip_fwd_btn.clicked.connect(self._skip_fwd)
         self._skip_fwd_btn.setEnabled(False)
         row.addWidget(self._skip_fwd_btn)
+        self._rate_cb = QtGui.QComboBox()
+        self._rate_cb.setObjectName('RateCB')
+        self._rate_cb.setStatusTip(self.tr('Playback rate'))
+        for r in self.RATES:
+            if r is log_player.LogPlayer.MAX_RATE:
+                self._rate_cb.addItem(self.tr('Max'))
+            else:
+                self._rate_cb.addItem('{0}x'.format(r))
+        self._rate_cb.setCurrentIndex(self.RATES.index(1.0))
+        self._rate_cb.currentIndexChanged.connect(self._set_rate)
+        self._rate_cb.setEnabled(False)
+        row.addWidget(self._rate_cb)
+        self._dispatch_cb = QtGui.QComboBox()
+        self._dispatch_cb.setObjectName('DispatchCB')
+        self._dispatch_cb.setStatusTip(self.tr('Write channels from the '
+            'playback thread, or each from its own thread with a bounded '
+            'queue'))
+        self._dispatch_cb.addItem(self.tr('Serial writes'))
+        self._dispatch_cb.addItem(self.tr('Threaded, drop oldest'))
+        self._dispatch_cb.addItem(self.tr('Threaded, drop newest'))
+        self._dispatch_cb.addItem(self.tr('Threaded, block'))
+        self._dispatch_cb.currentIndexChanged.connect(self._set_dispatch)
+        self._dispatch_cb.setEnabled(False)
+        row.addWidget(self._dispatch_cb)
+        self._catch_up_cb = QtGui.QComboBox()
+        self._catch_up_cb.setObjectName('CatchUpCB')
+        self._catch_up_cb.setStatusTip(self.tr('What to write when playback '
+            'falls behind'))
+        self._catch_up_cb.addItem(self.tr('Write all late'))
+        self._catch_up_cb.addItem(self.tr('Write latest'))
+        self._catch_up_cb.addItem(self.tr('Drop late'))
+        self._catch_up_cb.currentIndexChanged.connect(self._set_catch_up)
+        self._catch_up_cb.setEnabled(False)
+        row.addWidget(self._catch_up_cb)
         row.addStretch()
         vbox.addLayout(row)
 
@@ -287,6 +404,7 @@ class RTLPWindow(QtGui.QMainWindow):
             self._open_act.setEnabled(True)
             self._close_act.setEnabled(False)
             self._log_info_act.setEnabled(False)
+            self._save_stats_act.setEnabled(False)
             self._add_ns_act.setEnabled(False)
             self._add_tgt_btn.setEnabled(False)
             self._rem_tgt_btn.setEnabled(False)
@@ -295,28 +413,42 @@ class RTLPWindow(QtGui.QMainWindow):
             self._skip_back_btn.setEnabled(False)
             self._skip_fwd_btn.setEnabled(False)
             self._rewind_btn.setEnabled(False)
+            self._rate_cb.setEnabled(False)
+            self._preload_act.setEnabled(True)
+            self._dispatch_cb.setEnabled(False)
+            self._catch_up_cb.setEnabled(False)
             self._tl.setEnabled(False)
         elif mode == self.STOPPED:
             self._open_act.setEnabled(False)
             self._close_act.setEnabled(True)
             self._log_info_act.setEnabled(True)
+            self._save_stats_act.setEnabled(True)
             self._add_ns_act.setEnabled(True)
             self._play_btn.setEnabled(True)
             self._stop_btn.setEnabled(False)
             self._skip_back_btn.setEnabled(True)
             self._skip_fwd_btn.setEnabled(True)
             self._rewind_btn.setEnabled(True)
+            self._rate_cb.setEnabled(True)
+            self._preload_act.setEnabled(True)
+            self._dispatch_cb.setEnabled(True)
+            self._catch_up_cb.setEnabled(True)
             self._tl.setEnabled(True)
         elif mode == self.PLAYING:
             self._open_act.setEnabled(False)
             self._close_act.setEnabled(True)
             self._log_info_act.setEnabled(True)
+            self._save_stats_act.setEnabled(True)
             self._add_ns_act.setEnabled(True)
             self._play_btn.setEnabled(False)
             self._stop_btn.setEnabled(True)
             self._skip_back_btn.setEnabled(True)
             self._skip_fwd_btn.setEnabled(True)
             self._rewind_btn.setEnabled(True)
+            self._rate_cb.setEnabled(True)
+            self._preload_act.setEnabled(False)
+            self._dispatch_cb.setEnabled(False)
+            self._catch_up_cb.setEnabled(True)
             self._tl.setEnabled(True)
 
     def closeEvent(self, event):
@@ -335,6 +467,9 @@ class RTLPWindow(QtGui.QMainWindow):
                 self.tr('Module name:'), text='')
         if not ok:
             return
+        if not self._mm:
+            import rtshell.modmgr
+            self._mm = rtshell.modmgr.ModuleMgr()
         self._mm.load_mods_and_poas([mod])
 
     def _add_ns(self):
@@ -351,12 +486,15 @@ class RTLPWindow(QtGui.QMainWindow):
                             '{0}').format(res))
 
     def _make_tree(self, servers=[]):
+        import rtctree.exceptions
+        import rtctree_mdl
         try:
             self._tree = rtctree_mdl.RTCTree(servers=servers)
         except rtctree.exceptions.InvalidServiceError, e:
             QtGui.QMessageBox.warning(self, self.tr('Load RTC Tree'),
                 self.tr('Invalid CORBA naming service: {0}').format(e.args[0]))
             self._tree = None
+        self._tree_view.setModel(self._tree)
 
     def _rem_ns(self):
         ns = self._tree_view.selectedIndexes()[0]
@@ -399,8 +537,7 @@ class RTLPWindow(QtGui.QMainWindow):
 
     def _update_timeline(self):
         if self._log:
-            start = self._log.start[1].float
-            end = self._log.end[1].float
+            start, end = self._log_span()
             self._start_lbl.setText(time.strftime('%Y%m%d\n%H:%M:%S',
                     time.localtime(start)))
             self._end_lbl.setText(time.strftime('%Y%m%d\n%H:%M:%S',
@@ -424,14 +561,14 @@ class RTLPWindow(QtGui.QMainWindow):
         if not fn[0]:
             return
         self._log_fn = fn[0]
-        self._log = simpkl_log.SimplePickleLog(filename=fn[0], mode='r')
+        self._log = log_formats.open_log(fn[0], sidecar=True, index=True,
+                mmap=True)
         self._log_targets = log_targets.LogTargets(self._log, parent=self)
+        self._log_targets.channels_changed.connect(self._update_channels)
         self._chan_view.setModel(self._log_targets)
-        self._make_tree()
-        self._tree_view.setModel(self._tree)
         self._update_timeline()
         self._setup_player()
-        self._set_sb_time('Log position', self._log.start[1].float)
+        self._set_sb_time('Log position', self._log_span()[0])
         self._enable_ui(self.STOPPED)
 
     def _close_log(self):
@@ -439,56 +576,145 @@ class RTLPWindow(QtGui.QMainWindow):
         self._tree_view.setModel(None)
         self._destroy_player()
         self._log_targets = None
+        self._log.close()
         self._log = None
         self._tree = None
         self._update_timeline()
         self._enable_ui(self.NO_FILE)
 
+    def _log_span(self):
+        '''Get the times of the first and last entries of the log.
+
+        They are read using a reader of the log, as the log itself may be
+        being read by the playback thread.
+
+        '''
+        with self._log.reader() as r:
+            return r.start[1].float, r.end[1].float
+
     def _show_log_info(self):
         '''Show the log file's information.'''
-        info_dlg = log_info.LogInfoDlg(self._log, self._log_fn, parent=self)
+        with self._log.reader() as r:
+            info_dlg = log_info.LogInfoDlg(r, self._log_fn, parent=self)
         info_dlg.exec_()
 
     # Playback functionality
-    def _make_facade(self, port_specs=[]):
-        '''Creates an empty component to provide the ports for playback.'''
+    def _make_facade(self):
+        '''Creates an empty component to provide the ports for playback.
+
+        Does nothing if the component already exists.
+
+        '''
+        if self._comp:
+            return
+        import facade_comp
+        import rtshell.comp_mgmt
+
+        def to_output(ps):
+            ps._input = False
+
+        if not self._tree:
+            self._make_tree()
+        st, chans = self._log.metadata
+        specs = [to_output(c) for c in chans]
         comp_name, self._mgr = rtshell.comp_mgmt.make_comp('rtlp_player',
-                self._tree.tree, facade_comp.Facade, port_specs)
+                self._tree.tree, facade_comp.Facade, chans)
         self._comp = rtshell.comp_mgmt.find_comp_in_mgr(comp_name, self._mgr)
+        self._update_sink()
 
     def _del_facade(self):
         '''Deletes the facade component.'''
+        if not self._comp:
+            return
+        import rtshell.comp_mgmt
+        if self._sink:
+            self._sink.close(drain=False, timeout=1.0)
+            self._sink = None
         self._comp = None
         self._tree.release_orb()
         rtshell.comp_mgmt.shutdown(self._mgr)
         self._mgr = None
 
-    def _setup_player(self):
-        '''Creates the facade component and the playback thread.'''
-        def to_output(ps):
-            ps._input = False
+    def _update_sink(self):
+        '''Writes to the facade component as chosen in the dispatch
+        selector.'''
+        overflow = self.DISPATCH[self._dispatch_cb.currentIndex()]
+        sink = sinks.FacadeSink(self._comp)
+        if overflow:
+            sink = sinks.ThreadedSink(sink,
+                    queue_size=self.WRITER_QUEUE_SIZE, overflow=overflow,
+                    instruments=self._log_player.instruments)
+        self._log_player.set_sink(sink)
+        if self._sink:
+            self._sink.close(timeout=1.0)
+        self._sink = sink
 
-        st, chans = self._log.metadata
-        specs = [to_output(c) for c in chans]
-        self._make_facade(port_specs=chans)
-        self._log_player = log_player.LogPlayer(self._log, self._comp)
+    def _setup_player(self):
+        '''Creates the playback thread.
+
+        The facade component is not created until it is needed to play or to
+        connect a target.
+
+        '''
+        log = self._log
+        if self._preload_act.isChecked():
+            QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+            try:
+                # Load every channel, so that any can be enabled later
+                self._log.set_channels(None)
+                self._mem_log = mem_log.preload(self._log,
+                        max_bytes=self.PRELOAD_MAX_BYTES)
+                log = self._mem_log
+            except mem_log.TooLargeError, e:
+                self.statusBar().showMessage(self.tr('{0}; playing from the '
+                    'file instead').format(e), self.MESSAGE_TIMEOUT)
+            finally:
+                QtGui.QApplication.restoreOverrideCursor()
+        if self._loop_act.isChecked():
+            passes = log_player.LogPlayer.LOOP_FOREVER
+        else:
+            passes = 1
+        self._log_player = log_player.LogPlayer(log,
+                rate=self.RATES[self._rate_cb.currentIndex()],
+                instruments=instrument.Instruments(),
+                catch_up=self.CATCH_UP[self._catch_up_cb.currentIndex()],
+                catch_up_threshold=self.CATCH_UP_THRESHOLD, passes=passes,
+                reverse=self._reverse_act.isChecked(),
+                keyframes=self._keyframe_act.isChecked())
+        self._log_player.set_channels(self._log_targets.enabled_channels)
         self._log_player.finished.connect(self._playback_done)
         self._log_player.pos_update.connect(self._pos_update)
+        self._log_player.seek_started.connect(self._seek_started)
+        self._log_player.seek_done.connect(self._pos_update)
+
+    def _close_player(self):
+        '''Stops the playback thread and releases a preloaded log.'''
+        self._stats_timer.stop()
+        self._log_player.close()
+        self._log_player = None
+        if self._mem_log:
+            self._mem_log.close()
+            self._mem_log = None
+        self._update_stats()
 
     def _destroy_player(self):
         '''Stops the playback thread and destroys the facade component.'''
-        self._log_player.stop()
-        self._log_player.wait()
-        self._log_player = None
+        self._close_player()
         self._del_facade()
 
     def _playback_done(self):
         self._enable_ui(self.STOPPED)
+        self._stats_timer.stop()
+        self._update_stats()
 
     def _pos_update(self, new_pos):
         self._tl.setValue(new_pos)
         self._set_sb_time('Log position', new_pos)
 
+    def _seek_started(self, target):
+        self._tl.setValue(target)
+        self._set_sb_time('Seeking to', target)
+
     def _set_sb_time(self, msg, new_pos):
         self._sb_time.setText('{0}: {1}'.format(msg, time.strftime(
             '%Y%m%d %H:%M:%S', time.localtime(new_pos))))
@@ -496,8 +722,10 @@ class RTLPWindow(QtGui.QMainWindow):
     # Playback control
     def _play(self):
         '''Starts playback.'''
+        self._make_facade()
         self._enable_ui(self.PLAYING)
         self._log_player.start()
+        self._stats_timer.start()
 
     def _rewind(self):
         '''Rewind the log file.'''
@@ -507,6 +735,62 @@ class RTLPWindow(QtGui.QMainWindow):
         '''Show the current scanning position.'''
         self._set_sb_time('Skip to', pos)
 
+    def _update_channels(self):
+        '''Play only the enabled channels.'''
+        if self._log_player:
+            self._log_player.set_channels(
+                    self._log_targets.enabled_channels)
+
+    def _set_keyframes(self, checked):
+        '''Turn sending keyframes after a jump on or off.'''
+        if self._log_player:
+            self._log_player.set_keyframes(checked)
+
+    def _set_loop(self, checked):
+        '''Turn looping playback on or off.'''
+        if self._log_player:
+            if checked:
+                self._log_player.set_passes(
+                        log_player.LogPlayer.LOOP_FOREVER)
+            else:
+                self._log_player.set_passes(1)
+
+    def _set_reverse(self, checked):
+        '''Switch between playing forward and backward.'''
+        if self._log_player:
+            self._log_player.set_reverse(checked)
+
+    def _set_preload(self, checked):
+        '''Switch between playing from memory and from the file.
+
+        The playback thread is recreated, keeping the facade component and its
+        connections, and the position returns to the start.
+
+        '''
+        if not self._log_player:
+            return
+        self._close_player()
+        self._setup_player()
+        if self._comp:
+            self._update_sink()
+        self._update_timeline()
+        self._set_sb_time('Log position', self._log_span()[0])
+
+    def _set_rate(self, index):
+        '''Change the playback rate.'''
+        if self._log_player:
+            self._log_player.set_rate(self.RATES[index])
+
+    def _set_catch_up(self, index):
+        '''Change the catch-up policy.'''
+        if self._log_player:
+            self._log_player.set_catch_up(self.CATCH_UP[index])
+
+    def _set_dispatch(self, index):
+        '''Change how channels are written.'''
+        if self._comp:
+            self._update_sink()
+
     def _skip_back(self):
         '''Skip backwards 60 seconds.'''
         self._log_player.skip_back()
@@ -523,6 +807,51 @@ class RTLPWindow(QtGui.QMainWindow):
         '''Stop playback.'''
         self._log_player.stop()
         self._enable_ui(self.STOPPED)
+        self._stats_timer.stop()
+        self._update_stats()
+
+    # Playback statistics
+    def _save_stats(self):
+        '''Save the playback statistics.'''
+        fn = QtGui.QFileDialog.getSaveFileName(parent=self,
+            caption=self.tr('Save playback statistics'),
+            filter=self.tr('CSV files (*.csv);;JSON files (*.json)'))
+        if not fn[0]:
+            return
+        try:
+            self._log_player.instruments.save(fn[0])
+        except IOError, e:
+            QtGui.QMessageBox.warning(self,
+                    self.tr('Save playback statistics'),
+                    self.tr('Failed to save statistics: {0}').format(e))
+
+    def _update_stats(self):
+        '''Show the current playback statistics.'''
+        if not self._log_player:
+            self._sb_stats.setText('')
+            self._sb_stats.setToolTip('')
+            return
+        instr = self._log_player.instruments
+        self._sb_stats.setText('{0} Skipped: {1}'.format(instr.summary(),
+            self._log_player.skipped))
+        if isinstance(self._sink, sinks.ThreadedSink):
+            lag = self._sink.lag()
+        else:
+            lag = {}
+        tip = ''
+        for c in instr.channels:
+            tip += '{0}: late {1}, dropped {2}, p99 lateness {3:.2f}ms, ' \
+                    'decode {4:.2f}ms, write {5:.2f}ms'.format(c,
+                    instr.late(c), instr.dropped(c),
+                    instr.histogram('lateness', c).percentile(99) * 1000,
+                    instr.histogram('decode', c).percentile(99) * 1000,
+                    instr.histogram('write', c).percentile(99) * 1000)
+            if c in lag:
+                tip += ', queued {0}, lag {1:.2f}ms, max lag {2:.2f}ms'.format(
+                        lag[c]['queued'], lag[c]['lag'] * 1000,
+                        lag[c]['max_lag'] * 1000)
+            tip += '\n'
+        self._sb_stats.setToolTip(tip[:-1])
 
     # Target management
     def _add_target(self):
@@ -550,23 +879,12 @@ class RTLPWindow(QtGui.QMainWindow):
 
     def _connect_port(self, tgt):
         '''Make the connection to another component's port.'''
-        def find_local_port(name, ports):
-            for p in ports:
-                if p.get_port_profile().name.split('.')[-1] == name:
-                    return p
-
-        props = {'dataport.dataflow_type': 'push',
-                'dataport.interface_type': 'corba_cdr',
-                'dataport.subscription_type': 'new',
-                'dataport.data_type': tgt.properties['dataport.data_type']}
+        import facade_comp
+        self._make_facade()
         local_name = self._cur_chan.internalPointer().name
-        local_port = find_local_port(local_name, self._comp.get_ports())
         id = '{0}'.format(self._id_cnt)
         self._id_cnt += 1
-        prof = RTC.ConnectorProfile(local_name + '_' + tgt.name, id,
-                [local_port, tgt.object], rtctree.utils.dict_to_nvlist(props))
-        res, connector = local_port.connect(prof)
-        if res != RTC.RTC_OK:
+        if not facade_comp.connect_port(self._comp, local_name, tgt, id):
             QtGui.QMessageBox.warning(self, self.tr('Add target'),
                     self.tr('Failed to create connection.'))
             return False, 0
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Playback scheduler mapping log time to deadlines on a monotonic clock.
+
+'''
+
+
+import time
+
+import clock
+
+
+class Scheduler(object):
+    '''Maps log time to absolute deadlines and waits for them.
+
+    Deadlines are calculated from a fixed origin, so errors in individual
+    waits do not accumulate. Waiting sleeps until shortly before the deadline
+    and then spins for the final approach. How much earlier than requested
+    the sleep must end is learnt from the measured oversleep of previous
+    sleeps.
+
+    At MAX_RATE, every log time is due immediately.
+
+    '''
+    # Rate for playing as fast as possible
+    MAX_RATE = None
+
+    def __init__(self, rate=1.0, spin_time=0.001, check_period=0.1):
+        '''Constructor.
+
+        @param rate The playback rate, or MAX_RATE. A negative rate runs log
+                    time backward.
+        @param spin_time The time, in seconds, before a deadline at which to
+                         stop sleeping and start spinning.
+        @param check_period The maximum time to sleep between calls of the
+                            check function given to @ref wait_until.
+
+        '''
+        super(Scheduler, self).__init__()
+        self._rate = rate
+        self._spin_time = spin_time
+        self._check_period = check_period
+        self._origin_log = 0.0
+        self._origin_clock = clock.monotonic()
+        # Smoothed amount by which sleeps overrun their requested time
+        self._oversleep = 0.0
+        self._count = 0
+        self._total_late = 0.0
+        self._max_late = 0.0
+
+    @property
+    def lateness(self):
+        '''Statistics of how late waits have returned.
+
+        A tuple of (number of waits, mean lateness, maximum lateness, current
+        oversleep correction). Times are in seconds.
+
+        '''
+        if self._count:
+            mean = self._total_late / self._count
+        else:
+            mean = 0.0
+        return self._count, mean, self._max_late, self._oversleep
+
+    @property
+    def rate(self):
+        '''The playback rate.'''
+        return self._rate
+
+    @property
+    def unthrottled(self):
+        '''True if playing as fast as possible.'''
+        return self._rate is self.MAX_RATE
+
+    @property
+    def spin_time(self):
+        '''The time before a deadline at which sleeping gives way to
+        spinning.'''
+        return self._spin_time
+
+    @spin_time.setter
+    def spin_time(self, spin_time):
+        self._spin_time = spin_time
+
+    def deadline(self, log_time):
+        '''Get the monotonic clock time at which a log time is due.'''
+        if self.unthrottled:
+            return self._origin_clock
+        return self._origin_clock + (log_time - self._origin_log) / self._rate
+
+    def now(self):
+        '''Get the current time in log time.
+
+        When unthrottled, this is the log time last given to @ref reset.
+
+        '''
+        if self.unthrottled:
+            return self._origin_log
+        return self._origin_log + \
+                (clock.monotonic() - self._origin_clock) * self._rate
+
+    def reset(self, log_time):
+        '''Make a log time be due now.'''
+        self._origin_log = log_time
+        self._origin_clock = clock.monotonic()
+
+    def set_rate(self, rate, log_time=None):
+        '''Change the playback rate.
+
+        The log time that is due now does not change, unless log_time is
+        given, in which case that time becomes due now.
+
+        '''
+        if log_time is None:
+            log_time = self.now()
+        self._rate = rate
+        self.reset(log_time)
+
+    def reset_stats(self):
+        '''Clear the lateness statistics.'''
+        self._count = 0
+        self._total_late = 0.0
+        self._max_late = 0.0
+
+    def wait_until(self, log_time, check=None):
+        '''Wait until a log time is due.
+
+        @param log_time The log time to wait for, in seconds.
+        @param check A function called at least every check_period seconds
+                     while sleeping. If it returns True, the wait is abandoned.
+        @return False if the wait was abandoned, True otherwise.
+
+        '''
+        if self.unthrottled:
+            return True
+        deadline = self.deadline(log_time)
+        while True:
+            now = clock.monotonic()
+            remaining = deadline - now
+            if remaining <= 0:
+                break
+            sleep_time = remaining - self._spin_time - self._oversleep
+            if sleep_time > 0:
+                sleep_time = min(sleep_time, self._check_period)
+                time.sleep(sleep_time)
+                overrun = clock.monotonic() - now - sleep_time
+                self._oversleep += (max(overrun, 0.0) - self._oversleep) / 8
+                if check and check():
+                    return False
+            else:
+                # Spin, yielding to other threads
+                time.sleep(0)
+        self._record(clock.monotonic() - deadline)
+        return True
+
+    def _record(self, late):
+        self._count += 1
+        self._total_late += late
+        if late > self._max_late:
+            self._max_late = late
+
+
+# vim: tw=79
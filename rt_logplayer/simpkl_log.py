@@ -20,11 +20,18 @@ Pickle-based log.
 
 
 import copy
+import cStringIO
+import mmap
 import os
-import pickle
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 import traceback
 
+import hdrpkl_log
 import ilog
+import log_index
 
 
 ###############################################################################
@@ -45,6 +52,13 @@ class CurPos(object):
                         self.prev, self.cache, self.fp)
 
 
+def _unpickler(f):
+    '''Make an unpickler that reads rtshell's time stamps as ilog.EntryTS.'''
+    u = pickle.Unpickler(f)
+    u.find_global = ilog.find_global
+    return u
+
+
 ###############################################################################
 ## Simple pickle-based log object. Its support for the full log interface
 ## is rudimentary and slow (although writing and simple reading should be fast
@@ -53,6 +67,27 @@ class CurPos(object):
 ## The simple pickle-based format is as follows (each entry is serialised):
 ## Port specification (in the metadata block)
 ## [Data entries: (Index, Time stamp, Data)]
+##
+## When opened for reading with index=True, an index of the entries is built
+## in memory (see log_index.MemoryIndex) and used for seeking. With
+## sidecar=True, the index is also stored next to the log (see
+## log_index.SidecarIndex) and loaded from there on later opens.
+##
+## When opened for reading with mmap=True, the log file is memory-mapped and
+## entries are unpickled directly from the mapped memory. The file position is
+## tracked as an integer rather than by the file object.
+##
+## When reading a subset of channels, the channel numbers in the index are
+## used to jump over the entries of other channels without unpickling them.
+## The index is built at that point if the log was opened without one.
+##
+## Keyframes (see log_index.Keyframes) are built from the index, every
+## keyframe_interval seconds, the first time they are needed.
+##
+## Readers (see ilog.Log.reader), which are also used for random access and
+## range iteration, open the file again. They share the index, if there is
+## one, and memory-map the file separately if mmap=True. Entries are counted
+## from the index without reading them.
 
 class SimplePickleLog(ilog.Log):
     # Indices in data entries for bits of data
@@ -67,6 +102,30 @@ class SimplePickleLog(ilog.Log):
     def __init__(self, filename='', *args, **kwargs):
         self._is_open = False
         self._fn = filename
+        self._use_sidecar = kwargs.pop('sidecar', False)
+        index = kwargs.pop('index', False)
+        if isinstance(index, log_index.EntryIndex):
+            # Shared with the log this is a reader of, which closes it
+            self._index = index
+            self._own_index = False
+        else:
+            self._index = None
+            self._own_index = True
+        self._use_index = self._index is not None or bool(index) or \
+                self._use_sidecar
+        self._kf_interval = log_index.check_keyframe_interval(
+                kwargs.pop('keyframe_interval', log_index.KEYFRAME_INTERVAL))
+        self._keyframes = None
+        # Position in the index of the entry at the current file position,
+        # when known
+        self._ipos = None
+        self._codec = None
+        # The channel numbers to read, or None for all
+        self._chan_nums = None
+        self._data_start = 0
+        self._use_mmap = kwargs.pop('mmap', False)
+        self._mm = None
+        self._fpos = 0
         self._cur_pos = CurPos()
         self._start = None
         self._end = None
@@ -109,11 +168,14 @@ class SimplePickleLog(ilog.Log):
         self._vb_print('Rewinding log from position {0}.'.format(
                 self._cur_pos))
         if self._mode == 'r':
-            self._file.seek(0)
+            self._seek(0)
         else:
             self._file.truncate()
         self._write_ind = 0
         self._init_log()
+        if self._mode == 'r' and self._chan_nums is not None:
+            # The first entry may be of a channel not being read
+            self._seek_to_entry(0)
 
     def seek(self, timestamp=None, index=None):
         self._vb_print('Seeking log from position {0}.'.format(self._cur_pos))
@@ -135,26 +197,42 @@ class SimplePickleLog(ilog.Log):
             self._next = None
             target = self._cur_pos.prev
             # Move back in the file one entry
-            self._file.seek(target)
+            self._seek(target)
             # Update the next pointer
             self._next = self._read()
             self._update_cur_pos(self._next)
+            # The entry was read from the target, not from where the current
+            # position was; at the end of the log, that is the end of the file
+            self._cur_pos.cache = target
         self._vb_print('New current position: {0}.'.format(self._cur_pos))
 
     def _close(self):
         if not self._is_open:
             return
+        if self._index:
+            if self._own_index:
+                self._index.close()
+            self._index = None
+        self._keyframes = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
         if self._mode == 'w':
             # Go back to the beginning and write the end position
             self._file.seek(0)
             self._file.seek(self._buf_start) # Skip the meta data
             self._write(self._end)
             self._vb_print('Wrote end pointer: {0}'.format(self._end))
-            self._file.close()
-            self._is_open = False
             self._start = None
             self._end = None
-            self._vb_print('Closed file.')
+        self._file.close()
+        self._is_open = False
+        self._vb_print('Closed file.')
+
+    def _count_range(self, start, end):
+        if not self._index:
+            return super(SimplePickleLog, self)._count_range(start, end)
+        return self._index.count_ts(start, end)
 
     def _eof(self):
         return self._next is None
@@ -173,17 +251,33 @@ class SimplePickleLog(ilog.Log):
         self._vb_print('End position: {0}'.format(self._end))
         return (self._end.index, self._end.ts)
 
+    def _index_pos(self, pos):
+        '''Make a CurPos for the entry at a position in the index.'''
+        if pos + 1 < len(self._index):
+            next_fp = self._index.fp(pos + 1)
+        else:
+            next_fp = os.fstat(self._file.fileno()).st_size
+        return CurPos(self._index.index(pos),
+                log_index.ns_to_ts(self._index.ts(pos)), self._index.prev(pos),
+                self._index.fp(pos), next_fp)
+
     def _init_log(self):
         if self._mode == 'r':
             self._vb_print('Initialising log for reading.')
             # Read out the metadata
             self._meta = self._read()
-            pos = self._file.tell()
+            self._codec = hdrpkl_log.ChannelCodec(self._meta)
+            pos = self._tell()
             # Read the end marker
             self._end = self._read()
             # Skip to the start of the data
-            self._file.seek(pos + self.BUFFER_SIZE)
+            self._data_start = pos + self.BUFFER_SIZE
+            self._seek(self._data_start)
             self._vb_print('Read end position: {0}'.format(self._end))
+            if self._use_index and self._index is None:
+                self._index = self._load_index()
+            if self._index:
+                self._end = self._index_pos(len(self._index) - 1)
             # Grab the position of the first entry and make it the current
             self._set_start()
             self._cur_pos = copy.copy(self._start)
@@ -206,6 +300,16 @@ class SimplePickleLog(ilog.Log):
             self._vb_print('First entry will be written at {0}'.format(
                 self._cur_pos))
 
+    def _keyframe(self, timestamp):
+        if not self._index:
+            self._index = self._load_index()
+        if self._keyframes is None:
+            self._keyframes = log_index.Keyframes(self._index,
+                    self._kf_interval)
+            self._vb_print('Built keyframes: {0}'.format(self._keyframes))
+        return self._read_indices(self._index.index(pos)
+                for pos in self._keyframes.latest(timestamp, self._chan_nums))
+
     def _open(self):
         if self._is_open:
             return
@@ -216,22 +320,97 @@ class SimplePickleLog(ilog.Log):
         else:
             raise NotImplementedError
         self._file = open(self._fn, flags)
+        if self._mode == 'r' and self._use_mmap:
+            self._mm = mmap.mmap(self._file.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            self._fpos = 0
         self._init_log()
         self._is_open = True
         self._vb_print('Opened file {0} in mode {1}.'.format(self._fn,
             self._mode))
 
+    def _load_index(self):
+        '''Load or build the entry index.
+
+        If a sidecar index is in use, it will be loaded if it is current.
+        Otherwise the index is built in memory and, if a sidecar index is in
+        use, written out and loaded. The in-memory index is used if writing
+        or loading it fails.
+
+        '''
+        if self._use_sidecar:
+            try:
+                index = log_index.SidecarIndex.load(self._fn)
+            except (IOError, OSError), e:
+                self._vb_print('Failed to load sidecar index: {0}'.format(e))
+                index = None
+            if index is not None:
+                self._vb_print('Loaded sidecar index: {0}'.format(index))
+                return index
+        self._vb_print('Building index.')
+        index = log_index.MemoryIndex(self._scan_entries())
+        self._vb_print('Built index: {0}'.format(index))
+        if self._use_sidecar:
+            try:
+                sidecar = log_index.SidecarIndex.create(self._fn, index)
+            except (IOError, OSError), e:
+                self._vb_print('Failed to write sidecar index: {0}'.format(e))
+                sidecar = None
+            else:
+                if sidecar is None:
+                    # The log changed while the index was written
+                    self._vb_print('Wrote sidecar index, but it does not '\
+                            'match the log.')
+            if sidecar is None:
+                self._vb_print('Using the in-memory index.')
+                return index
+            self._vb_print('Wrote sidecar index: {0}'.format(sidecar))
+            return sidecar
+        return index
+
     def _read(self):
         '''Read a single entry from the log.'''
         self._vb_print('Reading one data block at {0}.'.format(
-            self._file.tell()))
+            self._tell()))
         try:
-            data = pickle.load(self._file)
+            if self._mm is not None:
+                # Unpickle from a view of the mapped memory, without copying
+                view = cStringIO.StringIO(buffer(self._mm, self._fpos))
+                data = _unpickler(view).load()
+                self._fpos += view.tell()
+            else:
+                data = _unpickler(self._file).load()
         except EOFError:
             self._vb_print('End of log reached.')
             raise ilog.EndOfLogError
         return data
 
+    def _reader(self):
+        return SimplePickleLog(self._fn, mode='r', index=self._index or False,
+                mmap=self._use_mmap, verbose=self._vb)
+
+    def _read_next(self):
+        '''Read the next data entry, jumping over entries of channels not
+        being read.'''
+        nums = self._chan_nums
+        if nums is None:
+            return self._read()
+        fp = self._tell()
+        pos = self._ipos
+        if pos is None or pos >= len(self._index) or \
+                self._index.fp(pos) != fp:
+            pos = self._index.find_fp(fp)
+        pos = self._index.next_in(pos, nums)
+        if pos >= len(self._index):
+            self._seek(os.fstat(self._file.fileno()).st_size)
+            raise ilog.EndOfLogError
+        if self._index.fp(pos) != fp:
+            self._seek(self._index.fp(pos))
+            # Keep the cached position pointing at the entry actually read
+            self._cur_pos.fp = self._index.fp(pos)
+        self._ipos = pos + 1
+        return self._read()
+
     def _read_number(self, number):
         self._vb_print('Reading {0} entries.'.format(number))
         res = []
@@ -244,7 +423,7 @@ class SimplePickleLog(ilog.Log):
             for ii in range(number):
                 res.append((self._next[self.INDEX], self._next[self.TS],
                     self._next[self.DATA]))
-                self._next = self._read()
+                self._next = self._read_next()
                 if not self._next:
                     self._set_eof_pos()
                     self._vb_print('End of log during reading, current '\
@@ -278,7 +457,7 @@ class SimplePickleLog(ilog.Log):
             while self._next[self.TS] <= timestamp:
                 res.append((self._next[self.INDEX], self._next[self.TS],
                     self._next[self.DATA]))
-                self._next = self._read()
+                self._next = self._read_next()
                 if not self._next:
                     self._set_eof_pos()
                     self._vb_print('End of log during reading, current '\
@@ -305,7 +484,7 @@ class SimplePickleLog(ilog.Log):
             res = [(self._next[self.INDEX], self._next[self.TS],
                 self._next[self.DATA])]
             try:
-                self._next = self._read()
+                self._next = self._read_next()
             except ilog.EndOfLogError:
                 self._next = None
             if not self._next:
@@ -319,6 +498,52 @@ class SimplePickleLog(ilog.Log):
             self._vb_print('Cached next entry is {0}'.format(self._next))
             return res
 
+    def _scan_entries(self):
+        '''Read the position of every entry in the log.
+
+        Returns a generator of (index, timestamp in nanoseconds, file
+        position, previous file position, channel number) tuples. The current
+        position is not changed.
+
+        '''
+        current = self._tell()
+        try:
+            self._seek(self._data_start)
+            while True:
+                fp = self._tell()
+                try:
+                    entry = self._read()
+                except ilog.EndOfLogError:
+                    break
+                yield (entry[self.INDEX], log_index.ts_to_ns(entry[self.TS]),
+                        fp, entry[self.PREV],
+                        self._codec.number(entry[self.DATA]))
+        finally:
+            self._seek(current)
+
+    def _seek_to_entry(self, pos):
+        '''Moves to the entry at a position in the index.
+
+        If the position is beyond the last entry, the log is placed at the
+        end, as if the final entry had just been read.
+
+        '''
+        if self._chan_nums is not None:
+            pos = self._index.next_in(pos, self._chan_nums)
+        if pos < len(self._index):
+            self._seek(self._index.fp(pos))
+            self._ipos = pos + 1
+            self._next = self._read()
+            self._cur_pos = CurPos(self._next[self.INDEX],
+                    self._next[self.TS], self._next[self.PREV],
+                    self._index.fp(pos), self._tell())
+        else:
+            last = self._index_pos(len(self._index) - 1)
+            self._seek(last.fp)
+            self._next = None
+            self._cur_pos = CurPos(last.index + 1, last.ts, last.cache, 0,
+                    last.fp)
+
     def _seek_to_index(self, ind):
         '''Seeks forward or backward in the log to find the given index.'''
         if ind == self._cur_pos.index:
@@ -326,11 +551,13 @@ class SimplePickleLog(ilog.Log):
             return
         if ind < 0:
             raise ilog.InvalidIndexError
+        elif self._index:
+            self._vb_print('Seeking to index {0} using the index.'.format(
+                ind))
+            self._seek_to_entry(self._index.find_index(ind))
         elif ind < self._cur_pos.index:
-            # Rewind
-            # TODO: Rewinding may be more efficient in many cases if done by
-            # fast-forwarding from the start of the file rather than traversing
-            # backwards.
+            # Rewind (open the log with an index to avoid traversing
+            # backwards one entry at a time)
             self._vb_print('Rewinding to index {0}.'.format(ind))
             while self._cur_pos.index > ind and self._cur_pos.index > 0:
                 self._backup_one()
@@ -344,9 +571,14 @@ class SimplePickleLog(ilog.Log):
 
     def _seek_to_timestamp(self, ts):
         '''Seeks forward or backward in the log to find the given timestamp.'''
-        if ts == self._cur_pos.ts and not self.eof:
+        if log_index.ts_to_ns(ts) == log_index.ts_to_ns(self._cur_pos.ts) \
+                and not self.eof:
             self._vb_print('Seek by timestamp: already at destination.')
             return
+        elif self._index:
+            self._vb_print('Seeking to timestamp {0} using the index.'.format(
+                ts))
+            self._seek_to_entry(self._index.find_ts(ts))
         elif ts < self._cur_pos.ts or self.eof:
             # Rewind
             self._vb_print('Rewinding to timestamp {0}.'.format(ts))
@@ -364,40 +596,73 @@ class SimplePickleLog(ilog.Log):
                     break # EOF
         self._vb_print('New current position is {0}.'.format(self._cur_pos))
 
+    def _set_channels(self, channels):
+        if channels is None:
+            self._chan_nums = None
+        else:
+            self._chan_nums = self._codec.numbers(channels)
+        if self._mode != 'r':
+            return
+        if self._chan_nums is not None and not self._index:
+            self._index = self._load_index()
+        if self._index and self._next is not None:
+            # Read the next entry again, in case it is in a channel no longer
+            # being read
+            self._seek_to_entry(self._index.find_index(
+                self._next[self.INDEX]))
+
+    def _seek(self, fp):
+        '''Move to a position in the file.'''
+        if self._mm is not None:
+            self._fpos = fp
+        else:
+            self._file.seek(fp)
+
     def _set_eof_pos(self):
         '''Sets the current position to the end-of-file value.'''
         self._vb_print('Setting EOF at file position {0}, prev cur pos '\
-                '{1}'.format(self._file.tell(), self._cur_pos))
+                '{1}'.format(self._tell(), self._cur_pos))
         self._cur_pos.index += 1 # The "next" index
         # Don't touch the time stamp (indicates the end time of the file)
         self._cur_pos.prev = self._cur_pos.cache # This is the final entry
         self._cur_pos.cache = 0 # No valid entry at current file position
-        self._cur_pos.fp = self._file.tell() # This is the end of the file
+        self._cur_pos.fp = self._tell() # This is the end of the file
 
     def _set_start(self):
+        if self._index:
+            self._start = self._index_pos(0)
+            self._vb_print('Start position from index: {0}'.format(
+                self._start))
+            return
         # Save the current position
-        current = self._file.tell()
+        current = self._tell()
         # Move to the start
-        self._file.seek(0)
+        self._seek(0)
         # Skip the metadata block
         self._read()
         # Skip the buffer
-        self._file.seek(self.BUFFER_SIZE, os.SEEK_CUR)
+        self._seek(self._tell() + self.BUFFER_SIZE)
         # Read the first entry
-        pos = self._file.tell()
+        pos = self._tell()
         entry = self._read()
         self._start = CurPos(entry[self.INDEX], entry[self.TS],
-                entry[self.PREV], pos, self._file.tell())
-        self._file.seek(current)
+                entry[self.PREV], pos, self._tell())
+        self._seek(current)
         self._vb_print('Measured start position: {0}'.format(self._start))
 
+    def _tell(self):
+        '''Get the current position in the file.'''
+        if self._mm is not None:
+            return self._fpos
+        return self._file.tell()
+
     def _update_cur_pos(self, val):
         '''Updates the current pos from a data entry.'''
         self._cur_pos.index = val[self.INDEX]
         self._cur_pos.ts = val[self.TS]
         self._cur_pos.prev = val[self.PREV]
         self._cur_pos.cache = self._cur_pos.fp
-        self._cur_pos.fp = self._file.tell()
+        self._cur_pos.fp = self._tell()
 
     def _write(self, data):
         '''Pickle some data and write it to the file.'''
@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Output sinks that played entries are written to.
+
+'''
+
+
+import collections
+import threading
+
+import clock
+
+
+# Overflow policies of a ThreadedSink's queues
+# Wait for space in the queue
+BLOCK = 'block'
+# Discard the oldest entry in the queue to make space
+DROP_OLDEST = 'drop-oldest'
+# Discard the entry being written
+DROP_NEWEST = 'drop-newest'
+OVERFLOW_POLICIES = [BLOCK, DROP_OLDEST, DROP_NEWEST]
+
+
+class Sink(object):
+    '''Interface for the destinations of played data.
+
+    The player asks the sink for a write function for each channel once,
+    when playback is set up, and calls that function with the data of each
+    entry on the channel.
+
+    '''
+    # True if the write functions queue the data to be written later, rather
+    # than writing it
+    queues = False
+
+    def close(self):
+        '''Release any resources held by the sink.'''
+        pass
+
+    def writer(self, channel):
+        '''Get the function to call with the data of a channel's entries.'''
+        raise NotImplementedError
+
+    def writers(self, channels):
+        '''Get a dictionary of channel name: write function.'''
+        return dict((c, self.writer(c)) for c in channels)
+
+
+class NullSink(Sink):
+    '''Discards all data.'''
+    def writer(self, channel):
+        return self._discard
+
+    def _discard(self, data):
+        pass
+
+
+class CountingSink(Sink):
+    '''Counts the entries written to each channel, discarding the data.'''
+    def __init__(self):
+        super(CountingSink, self).__init__()
+        self._counts = collections.defaultdict(int)
+
+    @property
+    def counts(self):
+        '''A dictionary of channel name: number of entries written.'''
+        return dict(self._counts)
+
+    @property
+    def total(self):
+        '''The number of entries written to all channels.'''
+        return sum(self._counts.itervalues())
+
+    def reset(self):
+        self._counts.clear()
+
+    def writer(self, channel):
+        counts = self._counts
+        def write(data):
+            counts[channel] += 1
+        return write
+
+
+class RecordingSink(Sink):
+    '''Records every entry written, with the time it was written.
+
+    Records are (monotonic clock time, channel name, data) tuples.
+
+    '''
+    def __init__(self):
+        super(RecordingSink, self).__init__()
+        self._records = []
+
+    @property
+    def records(self):
+        return self._records
+
+    def reset(self):
+        self._records = []
+
+    def writer(self, channel):
+        def write(data):
+            self._records.append((clock.monotonic(), channel, data))
+        return write
+
+
+class FacadeSink(Sink):
+    '''Writes data to the port for each channel on a facade component.'''
+    def __init__(self, facade):
+        super(FacadeSink, self).__init__()
+        self._c = facade
+
+    def writer(self, channel):
+        return self._c.ports[channel].port.write
+
+
+class ThreadedSink(Sink):
+    '''Writes each channel to another sink from its own thread.
+
+    Entries are placed in a bounded queue for each channel, in order, and
+    written by a worker thread for that channel, so a slow or blocked target
+    only delays its own channel. When a queue is full, the overflow policy
+    decides what happens:
+     - BLOCK: the player waits for space, as if writing directly.
+     - DROP_OLDEST: the oldest queued entry is discarded.
+     - DROP_NEWEST: the entry being written is discarded.
+
+    Worker threads are started when a channel's writer is first requested and
+    stopped by @ref close.
+
+    '''
+    queues = True
+
+    def __init__(self, sink, queue_size=100, overflow=DROP_OLDEST,
+            instruments=None):
+        '''Constructor.
+
+        @param sink The sink to write to from the worker threads.
+        @param queue_size The maximum number of entries queued per channel.
+        @param overflow The overflow policy: BLOCK, DROP_OLDEST or
+                        DROP_NEWEST.
+        @param instruments An instrument.Instruments object to record the
+                           time entries spend queued, the time taken to write
+                           them and the entries dropped in, or None.
+
+        '''
+        super(ThreadedSink, self).__init__()
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(overflow)
+        if queue_size < 1:
+            raise ValueError(queue_size)
+        self._sink = sink
+        self._size = queue_size
+        self._overflow = overflow
+        self._instr = instruments
+        self._queues = {}
+        self._m = threading.Lock()
+
+    @property
+    def overflow(self):
+        return self._overflow
+
+    @property
+    def queue_size(self):
+        return self._size
+
+    @property
+    def sink(self):
+        '''The sink written to by the worker threads.'''
+        return self._sink
+
+    def close(self, drain=True, timeout=None):
+        '''Stop the worker threads.
+
+        @param drain If True, entries already queued are written first.
+                     Otherwise, they are discarded and counted as dropped.
+        @param timeout The maximum time, in seconds, to wait for each worker
+                       thread, or None to wait until it finishes.
+
+        '''
+        with self._m:
+            queues = self._queues.values()
+            self._queues = {}
+        for q in queues:
+            q.close(drain)
+        for q in queues:
+            q.join(timeout)
+
+    def lag(self, channel=None):
+        '''Get the lag statistics of a channel, or of all channels.
+
+        Returns a dictionary of:
+         - queued: the number of entries waiting to be written,
+         - max_queued: the highest number of entries that have been waiting,
+         - lag: the time, in seconds, the oldest waiting entry has waited,
+         - max_lag: the longest time an entry has waited before being written,
+         - written: the number of entries written, and
+         - dropped: the number of entries discarded.
+        For all channels, the result is a dictionary of channel name:
+        statistics. A channel that nothing has been written to has zero
+        statistics.
+
+        '''
+        with self._m:
+            queues = dict(self._queues)
+        if channel is not None:
+            if channel not in queues:
+                return {'queued': 0, 'max_queued': 0, 'lag': 0.0,
+                        'max_lag': 0.0, 'written': 0, 'dropped': 0}
+            return queues[channel].lag()
+        return dict((c, q.lag()) for c, q in queues.iteritems())
+
+    def writer(self, channel):
+        with self._m:
+            q = self._queues.get(channel)
+            if not q:
+                q = _ChannelQueue(channel, self._sink.writer(channel),
+                        self._size, self._overflow, self._instr)
+                self._queues[channel] = q
+        return q.put
+
+
+class _ChannelQueue(object):
+    '''The queue and worker thread of one channel of a ThreadedSink.'''
+    # Interval, in seconds, at which a blocked writer checks for closing
+    BLOCK_CHECK_INTERVAL = 0.1
+
+    def __init__(self, channel, write, size, overflow, instruments):
+        super(_ChannelQueue, self).__init__()
+        self._chan = channel
+        self._write = write
+        self._size = size
+        self._overflow = overflow
+        self._instr = instruments
+        # (monotonic clock time queued, data)
+        self._q = collections.deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._max_queued = 0
+        self._max_lag = 0.0
+        self._written = 0
+        self._dropped = 0
+        self._t = threading.Thread(target=self._run,
+                name='rtlp writer: ' + channel)
+        self._t.daemon = True
+        self._t.start()
+
+    def close(self, drain):
+        with self._cond:
+            self._closed = True
+            if not drain:
+                self._drop(len(self._q))
+                self._q.clear()
+            self._cond.notify_all()
+
+    def join(self, timeout):
+        self._t.join(timeout)
+
+    def lag(self):
+        with self._cond:
+            if self._q:
+                lag = clock.monotonic() - self._q[0][0]
+            else:
+                lag = 0.0
+            return {'queued': len(self._q), 'max_queued': self._max_queued,
+                    'lag': lag, 'max_lag': self._max_lag,
+                    'written': self._written, 'dropped': self._dropped}
+
+    def put(self, data):
+        with self._cond:
+            if self._closed:
+                self._drop(1)
+                return
+            if len(self._q) >= self._size:
+                if self._overflow == DROP_NEWEST:
+                    self._drop(1)
+                    return
+                elif self._overflow == DROP_OLDEST:
+                    self._q.popleft()
+                    self._drop(1)
+                else:
+                    while len(self._q) >= self._size and not self._closed:
+                        self._cond.wait(self.BLOCK_CHECK_INTERVAL)
+                    if self._closed:
+                        self._drop(1)
+                        return
+            self._q.append((clock.monotonic(), data))
+            if len(self._q) > self._max_queued:
+                self._max_queued = len(self._q)
+            self._cond.notify_all()
+
+    def _drop(self, number):
+        # Must be called with the condition held
+        if not number:
+            return
+        self._dropped += number
+        if self._instr:
+            self._instr.drop(self._chan, number)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._q and not self._closed:
+                    self._cond.wait()
+                if not self._q:
+                    return
+                queued, data = self._q.popleft()
+                # Wake a blocked writer
+                self._cond.notify_all()
+            lag = clock.monotonic() - queued
+            if self._instr:
+                self._instr.queue(self._chan, lag)
+            t = clock.monotonic()
+            try:
+                self._write(data)
+            except Exception:
+                # The player is not waiting for the write, so there is no one
+                # to report the error to; count the entry as dropped instead
+                with self._cond:
+                    self._drop(1)
+                continue
+            if self._instr:
+                self._instr.write(self._chan, clock.monotonic() - t)
+            with self._cond:
+                self._written += 1
+                if lag > self._max_lag:
+                    self._max_lag = lag
+
+
+# vim: tw=79
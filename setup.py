@@ -41,7 +41,7 @@ setup(name='rtlogplayer',
           'Topic :: Software Development',
           ],
       packages=['rt_logplayer'],
-      scripts=['rtlogplayer']
+      scripts=['rtlogplayer', 'rtlogplayer-cli']
       )
 
 
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Helpers shared by the tests.
+
+Run the tests from the top of the source tree with:
+    python -m unittest discover -s tests
+
+'''
+
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rt_logplayer import log_gen
+
+
+def entry_keys(entries):
+    '''Get comparable (index, timestamp, channel, value) tuples for entries
+    of a generated log.'''
+    return [(e[0], e[1], e[2][0], e[2][1].data) for e in entries]
+
+
+class LogTestCase(unittest.TestCase):
+    '''A test case with a temporary directory to write logs in.'''
+    # Time, in seconds, to wait for a call that might block forever
+    TIMEOUT = 10.0
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='rtlp_test')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def call(self, f, *args, **kwargs):
+        '''Call a function, failing the test if it does not return in time.
+
+        The function is called on another thread, so that a test of a call
+        that blocks forever fails rather than hanging.
+
+        '''
+        result = []
+        def run():
+            try:
+                result.append((True, f(*args, **kwargs)))
+            except Exception, e:
+                result.append((False, e))
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        t.join(self.TIMEOUT)
+        self.assertFalse(t.is_alive(), 'Call did not return: {0}'.format(f))
+        ok, value = result[0]
+        if not ok:
+            raise value
+        return value
+
+    def wait_for(self, condition):
+        '''Wait for a condition to become true, failing the test if it does
+        not in time.'''
+        def wait():
+            while not condition():
+                time.sleep(0.01)
+        self.call(wait)
+
+    def make_log(self, name='test.rtlog', channels=3, rate=50.0,
+            duration=4.0, **kwargs):
+        '''Generate a log in the temporary directory.
+
+        Entries of each channel are rate Hz apart, starting at 1000.0s. Other
+        arguments are as for log_gen.generate.
+
+        @return The file name of the log.
+
+        '''
+        fn = os.path.join(self.dir, name)
+        log_gen.generate(fn, channels=channels, rate=rate, duration=duration,
+                **kwargs)
+        return fn
+
+    def assertEntries(self, first, second):
+        '''Check that two lists of generated entries are the same.'''
+        self.assertEqual(entry_keys(first), entry_keys(second))
+
+    def read_all(self, log):
+        '''Read the remaining entries of a log.'''
+        entries = []
+        while True:
+            read = log.read(number=100)
+            if not read:
+                return entries
+            entries += read
+
+
+# vim: tw=79
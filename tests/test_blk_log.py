@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the block-compressed log.
+
+'''
+
+
+import os
+import unittest
+
+import helpers
+
+from rt_logplayer import blk_log
+from rt_logplayer import ilog
+from rt_logplayer import simpkl_log
+
+
+class CompressionTest(helpers.LogTestCase):
+    def setUp(self):
+        super(CompressionTest, self).setUp()
+        log = simpkl_log.SimplePickleLog(self.make_log(duration=1.0),
+                mode='r')
+        self.entries = self.read_all(log)
+        log.close()
+
+    def check_round_trip(self, compression):
+        fn = self.make_log('test.blk', duration=1.0,
+                log_class=blk_log.BlockLog, compression=compression,
+                block_size=1024)
+        log = blk_log.BlockLog(fn, mode='r')
+        try:
+            self.assertTrue(log.num_blocks > 1)
+            self.assertEntries(self.read_all(log), self.entries)
+        finally:
+            log.close()
+
+    def test_none(self):
+        self.check_round_trip('none')
+
+    def test_zlib(self):
+        self.check_round_trip('zlib')
+
+    def test_lzma(self):
+        if blk_log.lzma is None:
+            fn = os.path.join(self.dir, 'test.blk')
+            self.assertRaises(ValueError, blk_log.BlockLog, fn, mode='w',
+                    compression='lzma')
+            # Nothing is written
+            self.assertFalse(os.path.exists(fn))
+        else:
+            self.check_round_trip('lzma')
+
+    def test_unknown(self):
+        fn = os.path.join(self.dir, 'test.blk')
+        self.assertRaises(ValueError, blk_log.BlockLog, fn, mode='w',
+                compression='bzip2')
+        self.assertFalse(os.path.exists(fn))
+
+
+class EmptyLogTest(helpers.LogTestCase):
+    def test_empty(self):
+        fn = self.make_log('test.blk', duration=0.0,
+                log_class=blk_log.BlockLog)
+        log = blk_log.BlockLog(fn, mode='r')
+        try:
+            self.assertEqual(log.num_blocks, 0)
+            self.assertEqual(log.start, (0, ilog.EntryTS()))
+            self.assertEqual(log.end, (0, ilog.EntryTS()))
+            self.assertEqual(log.read(), [])
+            self.assertTrue(log.eof)
+        finally:
+            log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the command-line player.
+
+'''
+
+
+import cStringIO
+import os
+import subprocess
+import sys
+import unittest
+
+import helpers
+
+from rt_logplayer import cli
+from rt_logplayer import playback
+
+
+class ParseRateTest(unittest.TestCase):
+    def test_valid(self):
+        self.assertEqual(cli.parse_rate('2.5'), 2.5)
+        self.assertTrue(cli.parse_rate('MAX') is playback.Player.MAX_RATE)
+
+    def test_invalid(self):
+        for rate in ('0', '-1', 'nan', 'inf', '-inf', 'Infinity', 'fast'):
+            self.assertRaises(ValueError, cli.parse_rate, rate)
+
+
+class MainTest(helpers.LogTestCase):
+    def main(self, *args):
+        # Run the player, hiding its output
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = cStringIO.StringIO()
+        try:
+            return cli.main(list(args))
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def test_invalid_rate(self):
+        self.assertEqual(self.main('play', 'test.rtlog', '-r', 'nan'),
+                cli.EXIT_USAGE)
+
+    def test_map_without_rtctree(self):
+        try:
+            import rtctree
+        except ImportError:
+            pass
+        else:
+            self.skipTest('rtctree is available')
+        self.assertEqual(self.main('play', self.make_log(),
+            '--map', 'chan0=/localhost/comp.rtc:in'), cli.EXIT_ERROR)
+
+
+class ImportTest(unittest.TestCase):
+    '''The slow CORBA, rtctree and rtshell modules are not imported until a
+    component is needed.'''
+    # Records the attempts to import the modules in a fresh interpreter,
+    # whether or not they are installed
+    SCRIPT = '''
+import sys
+HEAVY = set(['omniORB', 'OpenRTM_aist', 'RTC', 'rtctree', 'rtshell'])
+tried = set()
+class Finder(object):
+    def find_module(self, name, path=None):
+        if set(name.split('.')) & HEAVY:
+            tried.add(name)
+sys.meta_path.insert(0, Finder())
+%s
+print ' '.join(sorted(tried))
+'''
+
+    def tried(self, code):
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        p = subprocess.Popen([sys.executable, '-c', self.SCRIPT % code],
+                cwd=root, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        out, err = p.communicate()
+        self.assertEqual(p.returncode, 0, err)
+        return out.split()
+
+    def test_import(self):
+        self.assertEqual(self.tried('''
+from rt_logplayer import cli
+from rt_logplayer import log_formats
+from rt_logplayer import mem_log
+from rt_logplayer import playback
+from rt_logplayer import sinks
+'''), [])
+
+    def test_usage_error(self):
+        self.assertEqual(self.tried('''
+import os
+from rt_logplayer import cli
+sys.stderr = sys.stdout = open(os.devnull, 'w')
+cli.main(['play', 'test.rtlog', '-r', '0'])
+sys.stdout = sys.__stdout__
+'''), [])
+
+    def test_finder(self):
+        # Check that the attempts are seen
+        self.assertTrue('RTC' in self.tried('''
+from rt_logplayer import log_gen
+'''))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the monotonic clock.
+
+'''
+
+
+import ctypes
+import unittest
+
+import helpers
+
+from rt_logplayer import clock
+
+
+class MonotonicTest(unittest.TestCase):
+    def check_unshared(self, monotonic):
+        # The clock is read from many threads at once, so a result buffer
+        # kept between calls could be overwritten while being read
+        if monotonic is None:
+            self.skipTest('Clock not available')
+        cells = [c.cell_contents for c in monotonic.func_closure or []]
+        self.assertEqual([c for c in cells
+            if isinstance(c, (ctypes.Structure, ctypes._SimpleCData))], [])
+        self.assertTrue(monotonic() <= monotonic())
+
+    def test_posix(self):
+        self.check_unshared(clock._posix_monotonic())
+
+    def test_windows(self):
+        self.check_unshared(clock._windows_monotonic())
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the header pickle log.
+
+'''
+
+
+import os
+import unittest
+
+import helpers
+
+from rt_logplayer import hdrpkl_log
+from rt_logplayer import read_ahead
+
+
+class TruncatedLogTest(helpers.LogTestCase):
+    def setUp(self):
+        super(TruncatedLogTest, self).setUp()
+        self.fn = self.make_log(log_class=hdrpkl_log.HeaderPickleLog)
+        log = hdrpkl_log.HeaderPickleLog(self.fn, mode='r')
+        self.entries = self.read_all(log)
+        log.close()
+        # Cut the data of the final entry short
+        with open(self.fn, 'r+b') as f:
+            f.truncate(os.path.getsize(self.fn) - 3)
+
+    def check_read(self, **kwargs):
+        log = hdrpkl_log.HeaderPickleLog(self.fn, mode='r', **kwargs)
+        try:
+            self.assertEntries(self.read_all(log), self.entries[:-1])
+            self.assertTrue(log.eof)
+            # Reading at the end returns nothing rather than raising
+            self.assertEqual(log.read(), [])
+            log.seek(index=len(self.entries) - 1)
+            self.assertEqual(log.read(number=5), [])
+            log.seek(index=len(self.entries) - 3)
+            self.assertEntries(log.read(timestamp=2000.0),
+                    self.entries[-3:-1])
+        finally:
+            log.close()
+
+    def test_read(self):
+        self.check_read()
+
+    def test_read_with_index(self):
+        self.check_read(index=True)
+
+    def test_read_ahead_rewind_at_end(self):
+        log = hdrpkl_log.HeaderPickleLog(self.fn, mode='r')
+        ra = read_ahead.ReadAhead(log)
+        try:
+            popped = []
+            while True:
+                e = self.call(ra.pop)
+                if e is None:
+                    break
+                popped.append(e)
+            self.assertEntries(popped, self.entries[:-1])
+            self.assertEqual(ra.error, None)
+            ra.rewind()
+            self.assertEqual(self.call(lambda: ra.pos), self.entries[0][:2])
+        finally:
+            ra.close()
+            log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the log interface.
+
+'''
+
+
+import unittest
+
+import helpers
+
+from rt_logplayer import ilog
+from rt_logplayer import log_formats
+from rt_logplayer import mem_log
+
+
+class EntryTSTest(unittest.TestCase):
+    def test_hash(self):
+        # Objects that are equal must hash the same
+        a = ilog.EntryTS(1000, 500)
+        b = ilog.EntryTS.from_ns(1000000000500)
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertEqual(len(set([a, b])), 1)
+        for n in (1000, 1000L, 1000.0000005):
+            for ts in (a, ilog.EntryTS(1000)):
+                if ts == n or n == ts:
+                    self.assertEqual(hash(ts), hash(n))
+
+    def test_equality(self):
+        ts = ilog.EntryTS(1000)
+        self.assertFalse(ts == 1000)
+        self.assertTrue(ts != 1000)
+        self.assertFalse(1000.0 == ts)
+        self.assertTrue(ts == ilog.EntryTS(time=1000.0))
+        self.assertTrue(ts != ilog.EntryTS(1000, 1))
+
+    def test_order(self):
+        ts = ilog.EntryTS(1000, 500)
+        self.assertTrue(ts > 1000)
+        self.assertTrue(ts < 1000.001)
+        self.assertTrue(ts >= 1000.0000005)
+        self.assertTrue(ts <= 1000.0000005)
+        self.assertTrue(999 < ts)
+        self.assertTrue(ilog.EntryTS(1000) < ts)
+
+
+class TrackedLog(mem_log.MemoryLog):
+    '''A memory log that records whether it has been closed, as do its
+    readers.'''
+    closed = False
+
+    def _close(self):
+        self.closed = True
+        super(TrackedLog, self)._close()
+
+    def _reader(self):
+        return TrackedLog(entries=self._entries, mode='r', meta=self._meta)
+
+
+class ReaderPoolTest(helpers.LogTestCase):
+    def setUp(self):
+        super(ReaderPoolTest, self).setUp()
+        log = log_formats.open_log(self.make_log(duration=1.0))
+        self.entries = self.read_all(log)
+        self.meta = log.metadata
+        log.close()
+        self.log = TrackedLog(entries=self.entries, mode='r', meta=self.meta)
+
+    def tearDown(self):
+        self.log.close()
+        super(ReaderPoolTest, self).tearDown()
+
+    def test_reuse(self):
+        with self.log.reader() as r:
+            r.set_channels(['chan1'])
+            r.seek(index=20)
+            r.read(number=5)
+        with self.log.reader() as r2:
+            self.assertTrue(r2 is r)
+            # Returned readers are rewound and read every channel
+            self.assertEqual(r2.channels, None)
+            self.assertEqual(r2.pos, self.entries[0][:2])
+            self.assertEntries(self.read_all(r2), self.entries)
+        self.assertFalse(r.closed)
+
+    def test_overflow(self):
+        size = ilog.READER_POOL_SIZE
+        readers = [self.log._acquire_reader() for ii in range(size + 2)]
+        self.assertEqual(len(set(id(r) for r in readers)), size + 2)
+        for r in readers:
+            self.log._release_reader(r)
+        # Readers returned to a full pool are closed
+        self.assertEqual([r.closed for r in readers],
+                [False] * size + [True] * 2)
+        again = [self.log._acquire_reader() for ii in range(size)]
+        self.assertEqual(set(id(r) for r in again),
+                set(id(r) for r in readers[:size]))
+        for r in again:
+            self.log._release_reader(r)
+
+    def test_close_while_borrowed(self):
+        with self.log.reader() as idle:
+            pass
+        borrowed = self.log._acquire_reader()
+        self.assertTrue(borrowed is idle)
+        with self.log.reader() as idle:
+            pass
+        self.log.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(borrowed.closed)
+        self.log._release_reader(borrowed)
+        self.assertTrue(borrowed.closed)
+
+    def test_file_log(self):
+        # Readers of a file log have their own position
+        log = log_formats.open_log(self.make_log('file.rtlog',
+            duration=1.0), index=True)
+        try:
+            log.seek(index=30)
+            with log.reader() as r:
+                self.assertFalse(r is log)
+                self.assertEntries(r.read(number=3), self.entries[:3])
+                with log.reader() as r2:
+                    self.assertFalse(r2 is r)
+                    r2.seek(index=100)
+                    self.assertEntries(r2.read(), self.entries[100:101])
+                self.assertEntries(r.read(), self.entries[3:4])
+            self.assertEntries(log.read(), self.entries[30:31])
+        finally:
+            log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
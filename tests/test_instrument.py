@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the playback instrumentation.
+
+'''
+
+
+import csv
+import json
+import os
+import unittest
+
+import helpers
+
+from rt_logplayer import instrument
+
+
+class HistogramTest(unittest.TestCase):
+    def test_empty(self):
+        h = instrument.Histogram()
+        self.assertEqual(h.count, 0)
+        self.assertEqual(h.mean, 0.0)
+        self.assertEqual(h.min, None)
+        self.assertEqual(h.max, None)
+        self.assertEqual(h.percentile(99), 0.0)
+
+    def test_stats(self):
+        h = instrument.Histogram()
+        for ii in range(90):
+            h.add(1e-6)
+        for ii in range(10):
+            h.add(0.5)
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.min, 1e-6)
+        self.assertEqual(h.max, 0.5)
+        self.assertAlmostEqual(h.mean, (90 * 1e-6 + 10 * 0.5) / 100)
+        self.assertEqual(h.percentile(50), 1e-6)
+        self.assertEqual(h.percentile(90), 1e-6)
+        # The bucket's upper bound, limited to the maximum
+        self.assertEqual(h.percentile(91), 0.5)
+        h.add(1.0)
+        self.assertEqual(h.percentile(91), 2 ** 19 * 1e-6)
+        h.reset()
+        self.assertEqual(h.count, 0)
+        self.assertEqual(h.max, None)
+
+    def test_out_of_range(self):
+        # Negative times are counted in the first bucket, and times above the
+        # last bucket in an overflow bucket
+        h = instrument.Histogram()
+        h.add(-0.5)
+        self.assertEqual(h.percentile(100), -0.5)
+        h.add(100.0)
+        self.assertEqual(h.percentile(100), 100.0)
+        self.assertEqual(h.as_dict()['buckets'],
+                [[1e-6, 1], [None, 1]])
+
+    def test_merge(self):
+        a = instrument.Histogram()
+        b = instrument.Histogram()
+        a.add(0.001)
+        b.add(0.004)
+        b.add(0.0001)
+        a.merge(b)
+        self.assertEqual(a.count, 3)
+        self.assertEqual(a.min, 0.0001)
+        self.assertEqual(a.max, 0.004)
+        self.assertAlmostEqual(a.mean, 0.0051 / 3)
+        a.merge(instrument.Histogram())
+        self.assertEqual(a.count, 3)
+        self.assertEqual(a.min, 0.0001)
+
+
+class InstrumentsTest(helpers.LogTestCase):
+    def setUp(self):
+        super(InstrumentsTest, self).setUp()
+        self.instr = instrument.Instruments(late_threshold=0.01)
+        self.instr.decode('a', 0.001)
+        self.instr.lateness('a', 0.005)
+        self.instr.lateness('a', 0.02)
+        self.instr.lateness('b', 0.03)
+        self.instr.write('b', 0.002)
+        self.instr.drop('c', 2)
+
+    def test_counts(self):
+        self.assertEqual(self.instr.channels, ['a', 'b', 'c'])
+        self.assertEqual(self.instr.late('a'), 1)
+        self.assertEqual(self.instr.late(), 2)
+        self.assertEqual(self.instr.dropped('c'), 2)
+        self.assertEqual(self.instr.dropped('a'), 0)
+        self.assertEqual(self.instr.dropped(), 2)
+        # Histograms of all channels are merged
+        self.assertEqual(self.instr.histogram('lateness').count, 3)
+        self.assertEqual(self.instr.histogram('lateness', 'a').count, 2)
+        self.assertEqual(self.instr.histogram('queue').count, 0)
+        self.instr.reset()
+        self.assertEqual(self.instr.channels, [])
+        self.assertEqual(self.instr.late(), 0)
+
+    def test_json(self):
+        fn = os.path.join(self.dir, 'stats.json')
+        self.instr.save(fn)
+        with open(fn, 'rb') as f:
+            stats = json.load(f)
+        self.assertEqual(stats['late_threshold'], 0.01)
+        self.assertEqual(sorted(stats['channels'].keys()), ['a', 'b', 'c'])
+        a = stats['channels']['a']
+        self.assertEqual(a['late'], 1)
+        self.assertEqual(a['lateness']['count'], 2)
+        self.assertEqual(a['lateness']['max'], 0.02)
+        self.assertEqual(stats['channels']['c']['dropped'], 2)
+
+    def test_csv(self):
+        fn = os.path.join(self.dir, 'stats.CSV')
+        self.instr.save(fn)
+        with open(fn, 'rb') as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(rows[0][:3], ['channel', 'stage', 'count'])
+        # A row per stage, and the late and dropped counts, per channel
+        self.assertEqual(len(rows),
+                1 + 3 * (len(instrument.Instruments.STAGES) + 2))
+        self.assertTrue(['a', 'late', '1'] in rows)
+        self.assertTrue(['c', 'dropped', '2'] in rows)
+        self.assertEqual([r[2] for r in rows
+            if r[:2] == ['b', 'write']], ['1'])
+
+    def test_summary(self):
+        summary = self.instr.summary()
+        self.assertTrue(summary.startswith('Late: 2 Dropped: 2 '), summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
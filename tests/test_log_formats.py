@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of seeking and reverse reading that apply to every log format.
+
+'''
+
+
+import unittest
+
+import helpers
+
+from rt_logplayer import blk_log
+from rt_logplayer import hdrpkl_log
+from rt_logplayer import ilog
+from rt_logplayer import mem_log
+from rt_logplayer import playback
+from rt_logplayer import read_ahead
+from rt_logplayer import simpkl_log
+from rt_logplayer import sinks
+
+
+class FormatTests(object):
+    '''Tests run for each log format, with and without an index where the
+    format has one.'''
+    # The log class, and the keyword arguments to open it with
+    LOG_CLASS = None
+    OPTIONS = [{}]
+
+    def setUp(self):
+        super(FormatTests, self).setUp()
+        self.fn = self.make_log(duration=2.0, log_class=self.LOG_CLASS)
+        log = self.open()
+        self.entries = self.read_all(log)
+        log.close()
+
+    def open(self, **kwargs):
+        return self.LOG_CLASS(self.fn, mode='r', **kwargs)
+
+    def for_each(self, check, **kwargs):
+        for options in self.OPTIONS:
+            options = dict(options, **kwargs)
+            log = self.open(**options)
+            try:
+                check(log)
+            except AssertionError, e:
+                raise AssertionError('{0} (options {1})'.format(e, options))
+            finally:
+                log.close()
+
+    def latest_before(self, ts, channels=None):
+        # The latest entry before a time of each channel, the slow way
+        latest = {}
+        for e in self.entries:
+            if e[1] < ts and (channels is None or e[2][0] in channels):
+                latest[e[2][0]] = e
+        return sorted(latest.values())
+
+    def pop_all(self, ra):
+        popped = []
+        while True:
+            e = self.call(ra.pop)
+            if e is None:
+                return popped
+            popped.append(e)
+
+    def test_seek_index(self):
+        def check(log):
+            log.seek(index=200)
+            self.assertEntries(log.read(number=10), self.entries[200:210])
+            log.seek(index=20)
+            self.assertEntries(log.read(number=10), self.entries[20:30])
+            log.seek(index=len(self.entries))
+            self.assertEqual(log.read(), [])
+            self.assertTrue(log.eof)
+            log.seek(index=0)
+            self.assertEntries(self.read_all(log), self.entries)
+        self.for_each(check)
+
+    def test_seek_timestamp(self):
+        def check(log):
+            # Between entries, and exactly at one
+            for pos in (150, 40, 41):
+                ts = self.entries[pos][1]
+                if pos == 41:
+                    log.seek(timestamp=ts)
+                else:
+                    log.seek(timestamp=ts.float - 0.001)
+                self.assertEntries(log.read(number=5),
+                        self.entries[pos:pos + 5])
+        self.for_each(check)
+
+    def test_reverse(self):
+        def check(log):
+            ra = read_ahead.ReadAhead(log, reverse=True)
+            try:
+                ra.seek(timestamp=self.entries[-1][1])
+                self.assertEntries(self.pop_all(ra), self.entries[::-1])
+                ra.seek(timestamp=self.entries[100][1])
+                self.assertEntries(self.pop_all(ra), self.entries[100::-1])
+                self.assertEqual(ra.error, None)
+            finally:
+                ra.close()
+        self.for_each(check)
+
+    def test_reverse_after_eof(self):
+        def check(log):
+            self.read_all(log)
+            ra = read_ahead.ReadAhead(log, reverse=True)
+            try:
+                ra.seek(timestamp=self.entries[-1][1])
+                self.assertEntries(self.pop_all(ra), self.entries[::-1])
+                self.assertEqual(ra.error, None)
+            finally:
+                ra.close()
+        self.for_each(check)
+
+    def test_keyframe(self):
+        def check(log):
+            for pos in (0, 1, 2, 3, 150, 151, len(self.entries) - 1):
+                ts = self.entries[pos][1]
+                self.assertEntries(log.keyframe(ts), self.latest_before(ts))
+            log.set_channels(['chan0', 'chan2'])
+            ts = self.entries[200][1]
+            self.assertEntries(log.keyframe(ts),
+                    self.latest_before(ts, ['chan0', 'chan2']))
+        self.for_each(check, keyframe_interval=1.0)
+
+    def test_keyframe_interval(self):
+        for options in self.OPTIONS:
+            self.assertRaises(ValueError, self.open, keyframe_interval=0,
+                    **options)
+
+    def test_player_keyframes(self):
+        # After a jump, the latest entry of each channel is written first
+        pos = 160
+        def check(log):
+            rec = sinks.RecordingSink()
+            p = playback.Player(log, rec, rate=playback.Player.MAX_RATE,
+                    keyframes=True)
+            try:
+                p.skip_to(self.entries[pos][1].float - 0.001)
+                self.call(p.play)
+            finally:
+                p.close()
+            expected = self.latest_before(self.entries[pos][1]) + \
+                    self.entries[pos:]
+            self.assertEqual([(r[1], r[2].data) for r in rec.records],
+                    [(e[2][0], e[2][1].data) for e in expected])
+        self.for_each(check, keyframe_interval=1.0)
+
+    def in_range(self, start=None, end=None, channels=None):
+        return [e for e in self.entries
+                if (start is None or e[1] >= start) and
+                (end is None or e[1] <= end) and
+                (channels is None or e[2][0] in channels)]
+
+    def test_random_access(self):
+        n = len(self.entries)
+        t1 = self.entries[40][1]
+        t2 = self.entries[250][1]
+        ranges = [(None, None), (t1, None), (None, t2), (t1, t2),
+                # Between entries
+                (t1.float + 0.001, t2.float - 0.001),
+                # Beyond the ends of the log
+                (t1.float - 100, t2.float + 100), (t2, t1)]
+        def check(log):
+            log.seek(index=50)
+            # The log's channels do not limit random access
+            log.set_channels(['chan2'])
+            pos = log.pos
+            for index in (0, 123, n - 1):
+                self.assertEntries([log.entry_at(index)],
+                        [self.entries[index]])
+            for index in (-1, n):
+                self.assertRaises(ilog.InvalidIndexError, log.entry_at,
+                        index)
+            for start, end in ranges:
+                self.assertEntries(list(log.iter_range(start, end)),
+                        self.in_range(start, end))
+                self.assertEqual(log.count_range(start, end),
+                        len(self.in_range(start, end)))
+                self.assertEntries(
+                        list(log.iter_range(start, end, ['chan0', 'chan1'])),
+                        self.in_range(start, end, ['chan0', 'chan1']))
+            # Stopping iteration early
+            it = log.iter_range()
+            self.assertEntries([it.next(), it.next()], self.entries[:2])
+            it.close()
+            self.assertEqual(log.pos, pos)
+            self.assertEntries(log.read(number=5),
+                    [e for e in self.entries[50:] if e[2][0] == 'chan2'][:5])
+        self.for_each(check)
+
+    def test_rewind_with_channels(self):
+        chan = [e for e in self.entries if e[2][0] == 'chan2']
+        def check(log):
+            log.set_channels(['chan2'])
+            self.assertEntries(self.read_all(log), chan)
+            log.rewind()
+            self.assertEqual(log.pos, chan[0][:2])
+            self.assertEntries(self.read_all(log), chan)
+        self.for_each(check)
+
+
+class SimplePickleLogTest(FormatTests, helpers.LogTestCase):
+    LOG_CLASS = simpkl_log.SimplePickleLog
+    OPTIONS = [{}, {'index': True}, {'mmap': True},
+            {'index': True, 'mmap': True}, {'sidecar': True, 'mmap': True}]
+
+
+class HeaderPickleLogTest(FormatTests, helpers.LogTestCase):
+    LOG_CLASS = hdrpkl_log.HeaderPickleLog
+    OPTIONS = [{}, {'index': True}]
+
+
+class BlockLogTest(FormatTests, helpers.LogTestCase):
+    LOG_CLASS = blk_log.BlockLog
+
+
+class MemoryLogTest(FormatTests, helpers.LogTestCase):
+    LOG_CLASS = simpkl_log.SimplePickleLog
+
+    def open(self, **kwargs):
+        # Load the entries of the log written by the simple pickle log
+        log = self.LOG_CLASS(self.fn, mode='r')
+        try:
+            return mem_log.MemoryLog(entries=self.read_all(log), mode='r',
+                    meta=log.metadata, **kwargs)
+        finally:
+            log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
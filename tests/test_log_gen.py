@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the synthetic log generator.
+
+'''
+
+
+import cStringIO
+import os
+import sys
+import unittest
+
+import helpers
+
+from rt_logplayer import blk_log
+from rt_logplayer import hdrpkl_log
+from rt_logplayer import log_formats
+from rt_logplayer import log_gen
+from rt_logplayer import simpkl_log
+
+
+class GenerateTest(helpers.LogTestCase):
+    def read(self, fn):
+        log = log_formats.open_log(fn)
+        try:
+            return log.metadata, self.read_all(log)
+        finally:
+            log.close()
+
+    def test_entries(self):
+        fn = os.path.join(self.dir, 'gen.rtlog')
+        self.assertEqual(log_gen.generate(fn, channels=2, rate=10.0,
+            duration=1.0, start=50.0), 20)
+        (start, specs), entries = self.read(fn)
+        self.assertEqual(start, 50.0)
+        self.assertEqual([s.name for s in specs], ['chan0', 'chan1'])
+        self.assertEqual([s.type_name for s in specs], ['TimedLong'] * 2)
+        self.assertEqual([e[0] for e in entries], range(20))
+        # The channels alternate, evenly spaced, each at the rate
+        self.assertEqual([e[2][0] for e in entries], ['chan0', 'chan1'] * 10)
+        for ii, e in enumerate(entries):
+            self.assertAlmostEqual(e[1].float, 50.0 + ii * 0.05)
+            self.assertEqual(e[2][1].data, ii // 2)
+            tm = e[2][1].tm
+            self.assertEqual(tm.sec * 1000000000 + tm.nsec,
+                    e[1].sec * 1000000000 + e[1].nsec)
+
+    def test_octets(self):
+        fn = os.path.join(self.dir, 'gen.rtlog')
+        log_gen.generate(fn, channels=1, rate=10.0, duration=0.5,
+                payload='octets', size=1000)
+        (start, specs), entries = self.read(fn)
+        self.assertEqual(specs[0].type_name, 'TimedOctetSeq')
+        self.assertEqual(len(entries), 5)
+        self.assertEqual([len(e[2][1].data) for e in entries], [1000] * 5)
+
+    def test_formats(self):
+        for cls in [simpkl_log.SimplePickleLog, hdrpkl_log.HeaderPickleLog,
+                blk_log.BlockLog]:
+            fn = self.make_log(name=cls.__name__, duration=1.0,
+                    log_class=cls)
+            self.assertTrue(log_formats.log_class(fn) is cls)
+            self.assertEqual(len(self.read(fn)[1]), 150)
+
+
+class MainTest(helpers.LogTestCase):
+    def main(self, *args):
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = cStringIO.StringIO()
+        try:
+            return log_gen.main(list(args))
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+    def test_main(self):
+        fn = os.path.join(self.dir, 'gen.rtlog')
+        self.assertEqual(self.main('-c', '3', '-r', '20', '-d', '0.5', '-f',
+            'block', '-p', 'octets', '-s', '1k', fn), 0)
+        self.assertTrue(log_formats.log_class(fn) is blk_log.BlockLog)
+        log = log_formats.open_log(fn)
+        try:
+            entries = self.read_all(log)
+        finally:
+            log.close()
+        self.assertEqual(len(entries), 30)
+        self.assertEqual(len(entries[0][2][1].data), 1024)
+
+    def test_invalid(self):
+        fn = os.path.join(self.dir, 'gen.rtlog')
+        self.assertEqual(self.main('-s', 'big', fn), 2)
+        self.assertEqual(self.main(), 2)
+        self.assertFalse(os.path.exists(fn))
+
+    def test_parse_size(self):
+        self.assertEqual(log_gen.parse_size('10'), 10)
+        self.assertEqual(log_gen.parse_size('2k'), 2048)
+        self.assertEqual(log_gen.parse_size('3M'), 3 * 1024 * 1024)
+        self.assertRaises(ValueError, log_gen.parse_size, '1G')
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the entry indices.
+
+'''
+
+
+import os
+import struct
+import unittest
+
+import helpers
+
+from rt_logplayer import log_index
+
+
+def make_entries(start_index=5, count=10):
+    return [(start_index + ii, 1000 + ii * 10, 300 + ii * 20, 280 + ii * 20,
+        ii % 3) for ii in range(count)]
+
+
+class MemoryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.entries = make_entries()
+        self.index = log_index.MemoryIndex(self.entries)
+
+    def test_columns(self):
+        self.assertEqual(len(self.index), len(self.entries))
+        self.assertEqual(self.index.start_index, 5)
+        for pos, e in enumerate(self.entries):
+            self.assertEqual((self.index.index(pos), self.index.ts(pos),
+                self.index.fp(pos), self.index.prev(pos),
+                self.index.chan(pos)), e)
+        self.assertRaises(IndexError, self.index.index, -1)
+        self.assertRaises(IndexError, self.index.index, len(self.entries))
+
+    def test_find(self):
+        self.assertEqual(self.index.find_index(0), 0)
+        self.assertEqual(self.index.find_index(7), 2)
+        self.assertEqual(self.index.find_index(100), len(self.entries))
+        ts = log_index.ns_to_ts
+        self.assertEqual(self.index.find_ts(ts(1015)), 2)
+        self.assertEqual(self.index.find_fp(340), 2)
+        self.assertEqual(self.index.count_ts(ts(1010), ts(1030)), 3)
+
+    def test_entry_size(self):
+        if not log_index.INT64_TYPECODE:
+            self.skipTest('No 64-bit array type')
+        self.assertEqual(sum(self.index.column(ii).itemsize
+            for ii in range(self.index.NUM_COLS)), 32)
+
+    def test_not_consecutive(self):
+        entries = make_entries()
+        del entries[4]
+        self.assertRaises(ValueError, log_index.MemoryIndex, entries)
+
+
+class SidecarIndexTest(helpers.LogTestCase):
+    def setUp(self):
+        super(SidecarIndexTest, self).setUp()
+        self.log_fn = os.path.join(self.dir, 'test.rtlog')
+        with open(self.log_fn, 'wb') as f:
+            f.write('log')
+        self.entries = make_entries()
+
+    def test_create(self):
+        index = log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries))
+        try:
+            self.assertEqual(len(index), len(self.entries))
+            self.assertEqual(index.start_index, 5)
+            for pos, e in enumerate(self.entries):
+                self.assertEqual((index.index(pos), index.ts(pos),
+                    index.fp(pos), index.prev(pos), index.chan(pos)), e)
+            self.assertEqual(index.find_index(8), 3)
+        finally:
+            index.close()
+
+    def test_old_version(self):
+        log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries)).close()
+        fn = log_index.SidecarIndex.index_name(self.log_fn)
+        with open(fn, 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack('<I', 2))
+        self.assertEqual(log_index.SidecarIndex.load(self.log_fn), None)
+
+    def test_load(self):
+        log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries)).close()
+        index = log_index.SidecarIndex.load(self.log_fn)
+        try:
+            self.assertEqual(len(index), len(self.entries))
+            self.assertEqual(index.ts(3), self.entries[3][1])
+        finally:
+            index.close()
+
+    def test_log_changed(self):
+        # The index is not used once the log's size or modification time
+        # has changed
+        log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries)).close()
+        st = os.stat(self.log_fn)
+        os.utime(self.log_fn, (st.st_atime, st.st_mtime + 10))
+        self.assertEqual(log_index.SidecarIndex.load(self.log_fn), None)
+        log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries)).close()
+        with open(self.log_fn, 'ab') as f:
+            f.write('more')
+        os.utime(self.log_fn, (st.st_atime, st.st_mtime))
+        self.assertEqual(log_index.SidecarIndex.load(self.log_fn), None)
+
+    def test_truncated(self):
+        log_index.SidecarIndex.create(self.log_fn,
+                log_index.MemoryIndex(self.entries)).close()
+        fn = log_index.SidecarIndex.index_name(self.log_fn)
+        with open(fn, 'r+b') as f:
+            f.truncate(os.path.getsize(fn) - 1)
+        self.assertEqual(log_index.SidecarIndex.load(self.log_fn), None)
+        with open(fn, 'r+b') as f:
+            f.truncate(4)
+        self.assertEqual(log_index.SidecarIndex.load(self.log_fn), None)
+
+
+class KeyframesTest(unittest.TestCase):
+    def setUp(self):
+        # Channel 0 every 0.5s, channel 1 every 0.1s, and channel 2 once,
+        # near the start; times in nanoseconds
+        entries = [(0.05, 2)] + [(t * 0.5, 0) for t in range(20)] + \
+                [(t * 0.1 + 0.01, 1) for t in range(100)]
+        entries.sort()
+        self.entries = [(ii, int(t * 1e9) + 1000000000000, fp, fp - 1, c)
+                for ii, (fp, (t, c)) in enumerate(zip(range(1, 10000, 7),
+                    entries))]
+        self.index = log_index.MemoryIndex(self.entries)
+
+    def latest(self, ns, chans=None):
+        # The latest entry before a time of each channel, the slow way
+        latest = {}
+        for pos, e in enumerate(self.entries):
+            if e[1] < ns and (chans is None or e[4] in chans):
+                latest[e[4]] = pos
+        return sorted(latest.values())
+
+    def test_latest(self):
+        kf = log_index.Keyframes(self.index, 1.0)
+        self.assertEqual(len(kf), 10)
+        start = self.entries[0][1]
+        for ns in range(start - 1000, start + 11000000000, 77777777):
+            ts = log_index.ns_to_ts(ns)
+            self.assertEqual(kf.latest(ts), self.latest(ns))
+            self.assertEqual(kf.latest(ts, set([0, 2])),
+                    self.latest(ns, set([0, 2])))
+        # Exactly at an entry, which is not before itself
+        ns = self.entries[30][1]
+        self.assertEqual(kf.latest(log_index.ns_to_ts(ns)), self.latest(ns))
+
+    def test_gap(self):
+        # One keyframe covers a gap of several intervals
+        entries = [(0, 0, 0, 0, 0), (1, 1000000000, 1, 0, 1),
+                (2, 9500000000, 2, 1, 0)]
+        kf = log_index.Keyframes(log_index.MemoryIndex(entries), 1.0)
+        self.assertEqual(len(kf), 3)
+        self.assertEqual(kf.latest(log_index.ns_to_ts(9000000000)), [0, 1])
+
+    def test_interval(self):
+        for interval in (0, -1.0, 0.5, float('nan')):
+            self.assertRaises(ValueError, log_index.Keyframes, self.index,
+                    interval)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
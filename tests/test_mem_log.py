@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the in-memory log.
+
+'''
+
+
+import unittest
+
+import helpers
+
+from rt_logplayer import log_formats
+from rt_logplayer import mem_log
+from rt_logplayer import playback
+from rt_logplayer import sinks
+
+
+class PreloadTest(helpers.LogTestCase):
+    def setUp(self):
+        super(PreloadTest, self).setUp()
+        self.log = log_formats.open_log(self.make_log(duration=10.0))
+        self.addCleanup(self.log.close)
+        self.entries = self.read_all(self.log)
+        self.log.rewind()
+
+    def test_preload(self):
+        loaded = mem_log.preload(self.log)
+        self.assertEntries(self.read_all(loaded), self.entries)
+        self.assertTrue(loaded.size > 0)
+        # The size fits within a limit of the size
+        loaded = mem_log.preload(self.log, max_bytes=loaded.size)
+        self.assertEntries(self.read_all(loaded), self.entries)
+
+    def test_window(self):
+        start = self.entries[100][1].float
+        end = self.entries[200][1].float
+        loaded = mem_log.preload(self.log, start=start, end=end)
+        self.assertEntries(self.read_all(loaded), self.entries[100:201])
+
+    def test_too_large(self):
+        size = mem_log.preload(self.log).size
+        # The limit is exceeded part way through loading
+        self.assertTrue(len(self.entries) > mem_log.PRELOAD_BLOCK)
+        try:
+            mem_log.preload(self.log, max_bytes=size / 2)
+        except mem_log.TooLargeError, e:
+            self.assertEqual(e.limit, size / 2)
+        else:
+            self.fail('TooLargeError not raised')
+        self.assertRaises(mem_log.TooLargeError, mem_log.preload, self.log,
+                max_bytes=size - 1)
+
+    def test_fallback(self):
+        # The log is rewound after exceeding the limit, so it can be played
+        # from the file instead
+        self.log.read(number=10)
+        self.assertRaises(mem_log.TooLargeError, mem_log.preload, self.log,
+                max_bytes=1)
+        counts = sinks.CountingSink()
+        p = playback.Player(self.log, counts, rate=playback.Player.MAX_RATE)
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+        self.assertEqual(counts.total, len(self.entries))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,535 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the playback engine.
+
+'''
+
+
+import threading
+import time
+import unittest
+
+import helpers
+
+from rt_logplayer import clock
+from rt_logplayer import log_formats
+from rt_logplayer import mem_log
+from rt_logplayer import playback
+from rt_logplayer import simpkl_log
+from rt_logplayer import sinks
+
+
+class ChannelsTest(helpers.LogTestCase):
+    def setUp(self):
+        super(ChannelsTest, self).setUp()
+        self.log = simpkl_log.SimplePickleLog(self.make_log(duration=1.0),
+                mode='r')
+        self.addCleanup(self.log.close)
+        self.entries = self.read_all(self.log)
+        self.log.rewind()
+
+    def test_close_restores_channels(self):
+        # Channels chosen for playback do not stay chosen on the log, which
+        # can then be preloaded in full
+        p = playback.Player(self.log, sinks.NullSink())
+        p.set_channels([])
+        # Wait for the log to be set to read no channels
+        self.call(lambda: p.pos)
+        p.close()
+        self.assertEqual(self.log.channels, None)
+        loaded = mem_log.preload(self.log)
+        self.assertEntries(self.read_all(loaded), self.entries)
+        loaded.rewind()
+        counts = sinks.CountingSink()
+        p = playback.Player(loaded, counts, rate=playback.Player.MAX_RATE)
+        p.set_channels(['chan0'])
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+        self.assertEqual(counts.counts, {'chan0': len([e for e in
+            self.entries if e[2][0] == 'chan0'])})
+
+    def test_close_keeps_log_channels(self):
+        self.log.set_channels(['chan1'])
+        p = playback.Player(self.log, sinks.NullSink())
+        p.set_channels(['chan0', 'chan2'])
+        self.call(lambda: p.pos)
+        p.close()
+        self.assertEqual(self.log.channels, frozenset(['chan1']))
+
+
+class ReverseTest(helpers.LogTestCase):
+    def test_gapped_memory_log(self):
+        # A log preloaded from one channel has gaps in its indices
+        log = log_formats.open_log(self.make_log())
+        log.set_channels(['chan1'])
+        loaded = mem_log.preload(log)
+        log.close()
+        entries = self.read_all(loaded)
+        rec = sinks.RecordingSink()
+        p = playback.Player(loaded, rec, rate=playback.Player.MAX_RATE,
+                reverse=True)
+        try:
+            p.skip_to(entries[-1][1].float)
+            self.call(p.play)
+        finally:
+            p.close()
+        self.assertEqual([r[2].data for r in rec.records],
+                [e[2][1].data for e in reversed(entries)])
+
+
+class SlowSink(sinks.RecordingSink):
+    '''Records entries, taking a time to write each.'''
+    def __init__(self, delay):
+        super(SlowSink, self).__init__()
+        self.delay = delay
+
+    def writer(self, channel):
+        record = super(SlowSink, self).writer(channel)
+        def write(data):
+            time.sleep(self.delay)
+            record(data)
+        return write
+
+
+class SeekTest(helpers.LogTestCase):
+    def test_callbacks(self):
+        # A seek is reported when requested, and when it has been performed
+        log = log_formats.open_log(self.make_log())
+        self.addCleanup(log.close)
+        entries = self.read_all(log)
+        log.rewind()
+        started = []
+        done = []
+        p = playback.Player(log, sinks.NullSink(),
+                on_seek_started=started.append, on_seek_done=done.append)
+        self.addCleanup(p.close)
+        target = entries[300][1].float
+        p.skip_to(target)
+        self.assertEqual(started, [target])
+        self.assertEqual(self.call(lambda: p.pos), entries[300][:2])
+        self.assertFalse(p.seeking)
+        self.wait_for(lambda: done)
+        self.assertEqual(done, [target])
+
+
+class WritersTest(helpers.LogTestCase):
+    def setUp(self):
+        super(WritersTest, self).setUp()
+        self.log = log_formats.open_log(self.make_log(duration=1.0))
+        self.addCleanup(self.log.close)
+        self.entries = self.read_all(self.log)
+        self.log.rewind()
+        self.values = [e[2][1].data for e in self.entries]
+
+    def test_looked_up_once(self):
+        # The write function of each channel is looked up when the player is
+        # created, not for each entry
+        rec = sinks.RecordingSink()
+        looked_up = []
+        def writer(channel):
+            looked_up.append(channel)
+            return sinks.RecordingSink.writer(rec, channel)
+        rec.writer = writer
+        p = playback.Player(self.log, rec, rate=playback.Player.MAX_RATE)
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+        self.assertEqual(sorted(looked_up), ['chan0', 'chan1', 'chan2'])
+        self.assertEqual([r[2].data for r in rec.records], self.values)
+
+    def test_set_sink(self):
+        # Entries after a change of sink go to the new sink, without
+        # repeating or missing any
+        first = sinks.RecordingSink()
+        second = sinks.RecordingSink()
+        p = playback.Player(self.log, first)
+        self.addCleanup(p.close)
+        result = []
+        t = threading.Thread(target=lambda: result.append(p.play()))
+        t.daemon = True
+        t.start()
+        time.sleep(0.3)
+        p.set_sink(second)
+        t.join(self.TIMEOUT)
+        self.assertEqual(result, [True])
+        self.assertTrue(first.records and second.records)
+        self.assertEqual([r[2].data for r in first.records + second.records],
+                self.values)
+
+
+class PositionTest(helpers.LogTestCase):
+    def setUp(self):
+        super(PositionTest, self).setUp()
+        self.log = log_formats.open_log(self.make_log(duration=1.0,
+            rate=500.0))
+        self.addCleanup(self.log.close)
+        self.updates = []
+
+    def on_pos(self, pos):
+        self.updates.append((clock.monotonic(), pos))
+
+    def play(self, rate):
+        p = playback.Player(self.log, sinks.NullSink(), rate=rate,
+                on_pos=self.on_pos)
+        try:
+            self.assertTrue(self.call(p.play))
+        finally:
+            p.close()
+        return p
+
+    def test_real_time(self):
+        # Updates are limited by the update rate, not the 1500 entries/s
+        p = self.play(1.0)
+        self.assertEqual(p.played, 1500)
+        interval = 1.0 / playback.Player.POS_UPDATE_RATE
+        self.assertTrue(10 <= len(self.updates) <=
+                playback.Player.POS_UPDATE_RATE + 3)
+        # Other than the forced updates at the start and end, updates are at
+        # least the interval apart
+        gaps = [b[0] - a[0] for a, b in zip(self.updates[1:-2],
+            self.updates[2:-1])]
+        self.assertTrue(min(gaps) >= interval * 0.99, min(gaps))
+        # Positions increase, ending at the end of the log
+        positions = [u[1] for u in self.updates]
+        self.assertEqual(positions, sorted(positions))
+        self.assertEqual(positions[-1], p.pos[1].float)
+
+    def test_max_rate(self):
+        p = self.play(playback.Player.MAX_RATE)
+        self.assertEqual(p.played, 1500)
+        self.assertTrue(len(self.updates) < 10)
+
+
+class RateTest(helpers.LogTestCase):
+    def setUp(self):
+        super(RateTest, self).setUp()
+        self.log = log_formats.open_log(self.make_log(duration=2.0))
+        self.addCleanup(self.log.close)
+        self.entries = self.read_all(self.log)
+        self.log.rewind()
+        self.values = [e[2][1].data for e in self.entries]
+
+    def start(self, p):
+        '''Start playing on another thread.'''
+        result = []
+        t = threading.Thread(target=lambda: result.append(p.play()))
+        t.daemon = True
+        t.start()
+        return t, result
+
+    def test_invalid_rate(self):
+        for rate in [0, 0.0, -1.0, float('nan'), float('inf')]:
+            self.assertRaises(ValueError, playback.Player, self.log,
+                    sinks.NullSink(), rate=rate)
+        p = playback.Player(self.log, sinks.NullSink(), rate=2.0)
+        self.addCleanup(p.close)
+        for rate in [0, -2.0, float('nan'), float('-inf')]:
+            self.assertRaises(ValueError, p.set_rate, rate)
+            self.assertEqual(p.rate, 2.0)
+        p.set_rate(playback.Player.MAX_RATE)
+        self.assertTrue(p.rate is playback.Player.MAX_RATE)
+
+    def test_change(self):
+        # Changing the rate does not change the position, and the entries
+        # after the change are played at the new rate
+        rec = sinks.RecordingSink()
+        p = playback.Player(self.log, rec)
+        self.addCleanup(p.close)
+        t, result = self.start(p)
+        time.sleep(0.3)
+        changed = clock.monotonic()
+        p.set_rate(4.0)
+        t.join(self.TIMEOUT)
+        self.assertEqual(result, [True])
+        self.assertEqual([r[2].data for r in rec.records], self.values)
+        after = [ii for ii, r in enumerate(rec.records) if r[0] > changed]
+        first, last = self.entries[after[0]], self.entries[-1]
+        self.assertAlmostEqual(rec.records[-1][0] - rec.records[after[0]][0],
+                (last[1].float - first[1].float) / 4.0, delta=0.05)
+
+    def test_max_rate(self):
+        # Entries are played as fast as the sink accepts them, and on
+        # changing back, the schedule restarts from the next entry
+        rec = SlowSink(0.004)
+        p = playback.Player(self.log, rec, rate=playback.Player.MAX_RATE)
+        self.addCleanup(p.close)
+        t, result = self.start(p)
+        time.sleep(0.1)
+        changed = clock.monotonic()
+        p.set_rate(1.0)
+        t.join(self.TIMEOUT)
+        self.assertEqual(result, [True])
+        self.assertEqual([r[2].data for r in rec.records], self.values)
+        first = [ii for ii, r in enumerate(rec.records) if r[0] > changed][0]
+        # At most a batch is played after the change at the maximum rate
+        self.assertTrue(first > 1)
+        self.assertTrue(first <= len([r for r in rec.records
+            if r[0] <= changed]) + playback.Player.MAX_RATE_BATCH)
+        # The entries after the change take no longer than they span in the
+        # log, as they would if the schedule started from the log's start
+        self.assertTrue(rec.records[-1][0] - changed <
+                self.entries[-1][1].float - self.entries[first][1].float +
+                0.05)
+        # The last entries, after any batch, are played in real time
+        n = 100
+        self.assertTrue(first + playback.Player.MAX_RATE_BATCH <
+                len(self.entries) - n)
+        self.assertAlmostEqual(rec.records[-1][0] - rec.records[-n][0],
+                self.entries[-1][1].float - self.entries[-n][1].float,
+                delta=0.05)
+
+    def test_stop_at_max_rate(self):
+        # Stopping takes effect within a batch of entries
+        rec = SlowSink(0.002)
+        p = playback.Player(self.log, rec, rate=playback.Player.MAX_RATE)
+        self.addCleanup(p.close)
+        t, result = self.start(p)
+        time.sleep(0.02)
+        stopped = len(rec.records)
+        p.stop()
+        t.join(self.TIMEOUT)
+        self.assertEqual(result, [False])
+        self.assertTrue(0 < p.played < len(self.entries))
+        self.assertTrue(p.played <= stopped + playback.Player.MAX_RATE_BATCH)
+        self.assertEqual([r[2].data for r in rec.records],
+                self.values[:p.played])
+
+
+class LoopTest(helpers.LogTestCase):
+    def setUp(self):
+        super(LoopTest, self).setUp()
+        self.fn = self.make_log(duration=0.4)
+        self.log = log_formats.open_log(self.fn)
+        self.addCleanup(self.log.close)
+        self.entries = self.read_all(self.log)
+        self.log.rewind()
+        self.values = [e[2][1].data for e in self.entries]
+
+    def play(self, rate=playback.Player.MAX_RATE, reverse=False, **kwargs):
+        '''Play the log with a number of passes.
+
+        @return The player, and the records of the entries written.
+
+        '''
+        rec = sinks.RecordingSink()
+        p = playback.Player(self.log, rec, rate=rate, reverse=reverse,
+                passes=kwargs.pop('passes', 1))
+        self.addCleanup(p.close)
+        if reverse:
+            p.skip_to(self.entries[-1][1].float)
+        self.assertTrue(self.call(p.play, **kwargs))
+        return p, rec.records
+
+    def test_passes(self):
+        p, records = self.play(passes=3)
+        self.assertEqual(p.passes_done, 3)
+        self.assertEqual(p.played, 3 * len(self.entries))
+        self.assertEqual([r[2].data for r in records], self.values * 3)
+
+    def test_reverse(self):
+        p, records = self.play(passes=2, reverse=True)
+        self.assertEqual(p.passes_done, 2)
+        self.assertEqual([r[2].data for r in records],
+                list(reversed(self.values)) * 2)
+
+    def test_loop_start(self):
+        # Passes after the first start from the loop start
+        start = 50
+        p, records = self.play(passes=3,
+                loop_start=self.entries[start][1].float)
+        self.assertEqual([r[2].data for r in records],
+                self.values + self.values[start:] * 2)
+        self.assertEqual(p.pos[0], self.entries[-1][0] + 1)
+
+    def test_timing(self):
+        # Each pass takes as long as the log, and the next follows on from
+        # it without a gap
+        p, records = self.play(rate=1.0, passes=2)
+        self.assertEqual(len(records), 2 * len(self.entries))
+        n = len(self.entries)
+        span = self.entries[-1][1].float - self.entries[0][1].float
+        for first, last in [(records[0], records[n - 1]),
+                (records[n], records[-1])]:
+            self.assertAlmostEqual(last[0] - first[0], span, delta=0.05)
+        self.assertTrue(records[n][0] - records[n - 1][0] < 0.05)
+
+    def test_loop_forever(self):
+        counts = sinks.CountingSink()
+        p = playback.Player(self.log, counts, rate=playback.Player.MAX_RATE,
+                passes=playback.Player.LOOP_FOREVER)
+        self.addCleanup(p.close)
+        result = []
+        t = threading.Thread(target=lambda: result.append(p.play()))
+        t.daemon = True
+        t.start()
+        while counts.total < 5 * len(self.entries) and t.is_alive():
+            time.sleep(0.01)
+        p.stop()
+        t.join(self.TIMEOUT)
+        self.assertFalse(t.is_alive())
+        self.assertEqual(result, [False])
+        self.assertTrue(p.passes_done >= 4)
+
+    def test_empty_pass(self):
+        # Looping forever stops when a pass plays nothing
+        p, records = self.play(passes=playback.Player.LOOP_FOREVER,
+                end=self.entries[0][1].float - 1.0)
+        self.assertEqual(records, [])
+
+    def test_set_passes(self):
+        # A change takes effect at the end of the current pass
+        counts = sinks.CountingSink()
+        p = playback.Player(self.log, counts, rate=1.0,
+                passes=playback.Player.LOOP_FOREVER)
+        self.addCleanup(p.close)
+        result = []
+        t = threading.Thread(target=lambda: result.append(p.play()))
+        t.daemon = True
+        t.start()
+        time.sleep(0.1)
+        p.set_passes(1)
+        t.join(self.TIMEOUT)
+        self.assertEqual(result, [True])
+        self.assertEqual(p.passes_done, 1)
+        self.assertEqual(counts.total, len(self.entries))
+
+
+class StallingSink(sinks.RecordingSink):
+    '''Records entries, stalling on the first write.'''
+    def __init__(self, stall):
+        super(StallingSink, self).__init__()
+        self.stall = stall
+
+    def writer(self, channel):
+        record = super(StallingSink, self).writer(channel)
+        def write(data):
+            if not self.records:
+                time.sleep(self.stall)
+            record(data)
+        return write
+
+
+class CatchUpTest(helpers.LogTestCase):
+    # Time, in seconds, the first write takes, making the entries after it
+    # overdue
+    STALL = 0.4
+
+    def setUp(self):
+        super(CatchUpTest, self).setUp()
+        self.fn = self.make_log(duration=1.0)
+        log = log_formats.open_log(self.fn)
+        self.entries = self.read_all(log)
+        log.close()
+        self.start = self.entries[0][1].float
+        # Entry position by (channel, value)
+        self.keys = dict(((e[2][0], e[2][1].data), ii)
+                for ii, e in enumerate(self.entries))
+        self.assertEqual(len(self.keys), len(self.entries))
+
+    def play(self, policy, threshold=0.05):
+        '''Play the log in real time with a catch-up policy.
+
+        @return The player, and the positions of the entries written.
+
+        '''
+        log = log_formats.open_log(self.fn)
+        self.addCleanup(log.close)
+        rec = StallingSink(self.STALL)
+        p = playback.Player(log, rec, catch_up=policy,
+                catch_up_threshold=threshold)
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+        return p, [self.keys[(c, d.data)] for t, c, d in rec.records]
+
+    def check_skipped(self, p, written):
+        # Entries are written in order, and skipped entries are counted
+        self.assertEqual(written, sorted(written))
+        self.assertEqual(p.played, len(written))
+        self.assertEqual(p.skipped, len(self.entries) - len(written))
+        skipped = {}
+        for ii in set(range(len(self.entries))) - set(written):
+            chan = self.entries[ii][2][0]
+            skipped[chan] = skipped.get(chan, 0) + 1
+        self.assertEqual(p.skipped_channels, skipped)
+
+    def test_burst(self):
+        p, written = self.play(playback.Player.BURST)
+        self.assertEqual(written, range(len(self.entries)))
+        self.assertEqual(p.skipped, 0)
+
+    def test_latest(self):
+        p, written = self.play(playback.Player.LATEST)
+        self.check_skipped(p, written)
+        # Most of the entries due during the stall are skipped
+        self.assertTrue(p.skipped > self.STALL * 150 * 0.5)
+        # A skipped entry is replaced by a later entry of its channel
+        for ii in set(range(len(self.entries))) - set(written):
+            chan = self.entries[ii][2][0]
+            self.assertTrue([w for w in written
+                if w > ii and self.entries[w][2][0] == chan])
+        # The last entry of each channel is always written
+        self.assertEqual(written[-3:], range(len(self.entries) - 3,
+            len(self.entries)))
+
+    def test_drop_late(self):
+        threshold = self.STALL / 2
+        p, written = self.play(playback.Player.DROP_LATE, threshold)
+        self.check_skipped(p, written)
+        self.assertTrue(p.skipped > 0)
+        for ii, e in enumerate(self.entries[1:], 1):
+            due = e[1].float - self.start
+            if 0.02 < due < self.STALL - threshold - 0.05:
+                # Later than the threshold when the stall ends
+                self.assertFalse(ii in written, due)
+            elif self.STALL - threshold + 0.05 < due < self.STALL:
+                # Late, but within the threshold
+                self.assertTrue(ii in written, due)
+
+    def test_drop_late_threshold(self):
+        # Nothing is skipped when the lateness stays under the threshold
+        p, written = self.play(playback.Player.DROP_LATE, self.STALL * 2)
+        self.assertEqual(written, range(len(self.entries)))
+        self.assertEqual(p.skipped, 0)
+
+    def test_skip_overdue(self):
+        log = log_formats.open_log(self.fn)
+        self.addCleanup(log.close)
+        p = playback.Player(log, sinks.NullSink())
+        self.addCleanup(p.close)
+        batch = self.entries[:9]
+        # LATEST keeps only the newest entry of each channel in a batch
+        self.assertEntries(p._skip_overdue(batch, playback.Player.LATEST,
+            0.0), batch[-3:])
+        # DROP_LATE also keeps entries within the threshold of the current
+        # time
+        p._sched.reset(batch[-1][1].float)
+        self.assertEntries(p._skip_overdue(batch,
+            playback.Player.DROP_LATE, 0.0), batch[-3:])
+        self.assertEntries(p._skip_overdue(batch,
+            playback.Player.DROP_LATE, 1.0), batch)
+        self.assertEqual(p.skipped, 12)
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
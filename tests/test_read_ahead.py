@@ -0,0 +1,232 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the read-ahead buffer.
+
+'''
+
+
+import threading
+import unittest
+
+import helpers
+
+from rt_logplayer import log_formats
+from rt_logplayer import mem_log
+from rt_logplayer import read_ahead
+
+
+class FailingLog(mem_log.MemoryLog):
+    '''A memory log whose entries from a position onward cannot be read.'''
+    def __init__(self, fail_at, *args, **kwargs):
+        self.fail_at = fail_at
+        super(FailingLog, self).__init__(*args, **kwargs)
+
+    def read(self, timestamp=None, number=None):
+        if self._pos >= self.fail_at:
+            raise ValueError('Corrupt entry')
+        return super(FailingLog, self).read(timestamp, number)
+
+
+class ReadFailureTest(helpers.LogTestCase):
+    def setUp(self):
+        super(ReadFailureTest, self).setUp()
+        log = log_formats.open_log(self.make_log())
+        self.entries = self.read_all(log)
+        log.close()
+        self.log = FailingLog(100, entries=self.entries, mode='r',
+                meta=log.metadata)
+        self.ra = read_ahead.ReadAhead(self.log)
+
+    def tearDown(self):
+        self.ra.close()
+        super(ReadFailureTest, self).tearDown()
+
+    def pop_all(self):
+        popped = []
+        while True:
+            e = self.call(self.ra.pop)
+            if e is None:
+                return popped
+            popped.append(e)
+
+    def test_stops_at_failure(self):
+        self.assertEqual(self.pop_all(), self.entries[:100])
+        self.assertTrue(self.ra.eof)
+        self.assertTrue(isinstance(self.ra.error, ValueError))
+
+    def test_rewind_after_failure(self):
+        self.pop_all()
+        self.ra.rewind()
+        self.assertEqual(self.call(lambda: self.ra.pos),
+                self.entries[0][:2])
+        self.assertEqual(self.pop_all(), self.entries[:100])
+
+    def test_seek_after_failure(self):
+        self.pop_all()
+        self.log.fail_at = len(self.entries) + 1
+        self.ra.seek(index=50)
+        self.assertEqual(self.pop_all(), self.entries[50:])
+        self.assertEqual(self.ra.error, None)
+
+    def test_no_wait_after_close(self):
+        self.ra.close()
+        self.ra.seek(index=50)
+        self.call(lambda: self.ra.pos)
+        self.assertEqual(self.call(self.ra.pop), None)
+        self.assertEqual(self.call(self.ra.read, number=10), [])
+
+
+class GatedLog(mem_log.MemoryLog):
+    '''A memory log whose seeks wait until go is set.'''
+    def __init__(self, *args, **kwargs):
+        super(GatedLog, self).__init__(*args, **kwargs)
+        self.go = threading.Event()
+        self.go.set()
+        self.seeking = threading.Event()
+        self.seeks = []
+
+    def seek(self, timestamp=None, index=None):
+        self.seeks.append(index)
+        self.seeking.set()
+        self.go.wait()
+        super(GatedLog, self).seek(timestamp=timestamp, index=index)
+
+
+class SeekTest(helpers.LogTestCase):
+    '''Seeks performed on the reader thread.'''
+    def setUp(self):
+        super(SeekTest, self).setUp()
+        log = log_formats.open_log(self.make_log())
+        self.entries = self.read_all(log)
+        log.close()
+        self.log = GatedLog(entries=self.entries, mode='r',
+                meta=log.metadata)
+        self.moved = []
+        self.ra = read_ahead.ReadAhead(self.log, on_moved=self.moved.append)
+        self.addCleanup(self.ra.close)
+        self.addCleanup(self.log.go.set)
+        self.call(lambda: self.ra.pos)
+
+    def test_no_wait(self):
+        # Seeking returns while the log is still moving
+        self.log.go.clear()
+        self.ra.seek(index=100)
+        self.assertTrue(self.log.seeking.wait(1.0))
+        self.assertTrue(self.ra.seeking)
+        self.assertEqual(self.moved, [])
+        self.log.go.set()
+        self.assertEqual(self.call(lambda: self.ra.pos),
+                self.entries[100][:2])
+        self.assertFalse(self.ra.seeking)
+        self.wait_for(lambda: self.moved)
+        self.assertEqual(self.moved, [self.entries[100][:2]])
+        self.assertEntries(self.call(self.ra.read, number=1),
+                self.entries[100:101])
+
+    def test_superseded(self):
+        # Seeks requested while another is being performed replace each
+        # other; only the latest is performed and reported
+        self.log.go.clear()
+        self.ra.seek(index=100)
+        self.assertTrue(self.log.seeking.wait(1.0))
+        self.ra.seek(index=200)
+        self.ra.seek(index=300)
+        self.log.go.set()
+        self.assertEqual(self.call(lambda: self.ra.pos),
+                self.entries[300][:2])
+        self.assertEqual(self.log.seeks, [100, 300])
+        self.wait_for(lambda: self.moved)
+        self.assertEqual(self.moved, [self.entries[300][:2]])
+        self.assertEntries(self.call(self.ra.read, number=1),
+                self.entries[300:301])
+
+
+class ReadTest(helpers.LogTestCase):
+    '''Reading the entries due by a time in one call.'''
+    def setUp(self):
+        super(ReadTest, self).setUp()
+        log = log_formats.open_log(self.make_log())
+        self.entries = self.read_all(log)
+        log.close()
+        self.log = mem_log.MemoryLog(entries=self.entries, mode='r',
+                meta=log.metadata)
+
+    def read_until(self, ra, timestamp):
+        read = []
+        while True:
+            entries = self.call(ra.read, timestamp=timestamp)
+            if not entries:
+                return read
+            read += entries
+
+    def test_timestamp(self):
+        ra = read_ahead.ReadAhead(self.log)
+        self.addCleanup(ra.close)
+        t = self.entries[100][1]
+        self.assertEntries(self.read_until(ra, t.float), self.entries[:101])
+        self.assertEqual(self.call(ra.read, timestamp=t.float), [])
+        self.assertEqual(ra.pos, self.entries[101][:2])
+
+    def test_number(self):
+        # Whichever of the time and the number is reached first stops the
+        # read
+        ra = read_ahead.ReadAhead(self.log)
+        self.addCleanup(ra.close)
+        self.call(lambda: ra.pos)
+        t = self.entries[100][1].float
+        read = self.call(ra.read, timestamp=t, number=10)
+        self.assertTrue(0 < len(read) <= 10)
+        self.assertEntries(read, self.entries[:len(read)])
+        read += self.read_until(ra, t)
+        self.assertEntries(read, self.entries[:101])
+
+    def test_reverse(self):
+        ra = read_ahead.ReadAhead(self.log, reverse=True)
+        self.addCleanup(ra.close)
+        ra.seek(timestamp=self.entries[200][1])
+        t = self.entries[100][1]
+        self.assertEntries(self.read_until(ra, t.float),
+                self.entries[200:99:-1])
+
+
+class GappedReverseTest(helpers.LogTestCase):
+    '''Reading back through a log whose indices are not consecutive.'''
+    def test_reverse(self):
+        log = log_formats.open_log(self.make_log())
+        log.set_channels(['chan0'])
+        loaded = mem_log.preload(log)
+        log.close()
+        entries = self.read_all(loaded)
+        self.assertEqual(entries[1][0] - entries[0][0], 3)
+        ra = read_ahead.ReadAhead(loaded, reverse=True)
+        self.addCleanup(ra.close)
+        for pos in (len(entries) - 1, 100):
+            ra.seek(timestamp=entries[pos][1])
+            popped = []
+            while True:
+                e = self.call(ra.pop)
+                if e is None:
+                    break
+                popped.append(e)
+            self.assertEntries(popped, entries[pos::-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
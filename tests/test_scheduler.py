@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the playback scheduler.
+
+'''
+
+
+import unittest
+
+import helpers
+
+from rt_logplayer import clock
+from rt_logplayer import scheduler
+
+
+class TimeTest(unittest.TestCase):
+    '''Mapping between log time and the clock.'''
+    def test_deadline(self):
+        s = scheduler.Scheduler(rate=2.0)
+        s.reset(100.0)
+        origin = s.deadline(100.0)
+        self.assertAlmostEqual(s.deadline(101.0) - origin, 0.5)
+        self.assertAlmostEqual(s.deadline(99.0) - origin, -0.5)
+        self.assertTrue(100.0 <= s.now() < 100.01)
+
+    def test_reverse(self):
+        # A negative rate runs log time backward
+        s = scheduler.Scheduler(rate=-1.0)
+        s.reset(100.0)
+        origin = s.deadline(100.0)
+        self.assertAlmostEqual(s.deadline(99.0) - origin, 1.0)
+        self.assertTrue(99.99 < s.now() <= 100.0)
+
+    def test_set_rate(self):
+        # The log time due now does not change, unless one is given
+        s = scheduler.Scheduler()
+        s.reset(100.0)
+        s.set_rate(10.0)
+        self.assertEqual(s.rate, 10.0)
+        self.assertTrue(100.0 <= s.now() < 100.1)
+        s.set_rate(0.5, 200.0)
+        self.assertTrue(200.0 <= s.now() < 200.01)
+        self.assertAlmostEqual(s.deadline(201.0) - s.deadline(200.0), 2.0)
+
+    def test_unthrottled(self):
+        # Every log time is due immediately
+        s = scheduler.Scheduler(rate=scheduler.Scheduler.MAX_RATE)
+        self.assertTrue(s.unthrottled)
+        s.reset(100.0)
+        self.assertEqual(s.now(), 100.0)
+        self.assertEqual(s.deadline(1000.0), s.deadline(100.0))
+        start = clock.monotonic()
+        self.assertTrue(s.wait_until(1000.0))
+        self.assertTrue(clock.monotonic() - start < 0.01)
+        self.assertEqual(s.lateness[0], 0)
+
+
+class WaitTest(helpers.LogTestCase):
+    def test_wait(self):
+        s = scheduler.Scheduler()
+        s.reset(100.0)
+        self.assertTrue(self.call(s.wait_until, 100.1))
+        now = clock.monotonic()
+        self.assertTrue(now >= s.deadline(100.1))
+        count, mean, max_late, oversleep = s.lateness
+        self.assertEqual(count, 1)
+        self.assertTrue(0.0 <= mean == max_late < 0.02)
+        s.reset_stats()
+        self.assertEqual(s.lateness[:3], (0, 0.0, 0.0))
+
+    def test_no_drift(self):
+        # Deadlines are from the origin, so the lateness of each wait does
+        # not add up
+        s = scheduler.Scheduler()
+        s.reset(0.0)
+        for ii in range(1, 51):
+            self.assertTrue(s.wait_until(ii * 0.005))
+        count, mean, max_late, oversleep = s.lateness
+        self.assertEqual(count, 50)
+        self.assertTrue(mean < 0.005)
+        self.assertTrue(clock.monotonic() - s.deadline(0.25) < 0.02)
+
+    def test_check(self):
+        # A wait is abandoned when the check function returns True
+        s = scheduler.Scheduler(check_period=0.01)
+        s.reset(0.0)
+        checks = []
+        def check():
+            checks.append(clock.monotonic())
+            return len(checks) == 3
+        start = clock.monotonic()
+        self.assertFalse(self.call(s.wait_until, 5.0, check))
+        self.assertEqual(len(checks), 3)
+        self.assertTrue(checks[-1] - start < 0.1)
+        self.assertEqual(s.lateness[0], 0)
+
+    def test_past(self):
+        s = scheduler.Scheduler()
+        s.reset(100.0)
+        self.assertTrue(s.wait_until(99.0))
+        self.assertTrue(s.lateness[2] >= 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
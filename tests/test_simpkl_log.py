@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the simple pickle log.
+
+'''
+
+
+import os
+import unittest
+
+import helpers
+
+from rt_logplayer import ilog
+from rt_logplayer import log_index
+from rt_logplayer import mem_log
+from rt_logplayer import read_ahead
+from rt_logplayer import simpkl_log
+
+
+class ReverseTest(helpers.LogTestCase):
+    '''Moving back from the end of the log, with and without an index.'''
+    def setUp(self):
+        super(ReverseTest, self).setUp()
+        self.fn = self.make_log(duration=1.0,
+                log_class=simpkl_log.SimplePickleLog)
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r')
+        self.entries = self.read_all(log)
+        log.close()
+
+    def open(self, **kwargs):
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r', **kwargs)
+        self.addCleanup(log.close)
+        return log
+
+    def check_seek_after_eof(self, **kwargs):
+        log = self.open(**kwargs)
+        self.read_all(log)
+        self.assertTrue(log.eof)
+        end = log.end
+        log.seek(timestamp=ilog.EntryTS.from_ns(ilog.to_ns(end[1]) + 1))
+        self.assertTrue(log.eof)
+        self.assertEqual(log.pos[0], end[0] + 1)
+        log.seek(index=end[0] - 9)
+        self.assertEntries(log.read(number=10), self.entries[-10:])
+        self.assertTrue(log.eof)
+        log.seek(index=0)
+        self.assertEntries(self.read_all(log), self.entries)
+
+    def test_seek_after_eof(self):
+        self.check_seek_after_eof()
+
+    def test_seek_after_eof_with_index(self):
+        self.check_seek_after_eof(index=True)
+
+    def check_read_ahead(self, **kwargs):
+        log = self.open(**kwargs)
+        self.read_all(log)
+        ra = read_ahead.ReadAhead(log, reverse=True)
+        self.addCleanup(ra.close)
+        end = log.end
+        ra.seek(timestamp=end[1])
+        popped = []
+        while True:
+            e = self.call(ra.pop)
+            if e is None:
+                break
+            popped.append(e)
+        self.assertEqual(ra.error, None)
+        self.assertEntries(popped, self.entries[::-1])
+
+    def test_read_ahead(self):
+        self.check_read_ahead()
+
+    def test_read_ahead_with_index(self):
+        self.check_read_ahead(index=True)
+
+
+class ChannelsTest(helpers.LogTestCase):
+    '''Reading a subset of the channels.'''
+    def setUp(self):
+        super(ChannelsTest, self).setUp()
+        self.fn = self.make_log(duration=1.0,
+                log_class=simpkl_log.SimplePickleLog)
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r')
+        # The first entry of the log is not of this channel
+        self.entries = [e for e in self.read_all(log) if e[2][0] == 'chan1']
+        log.close()
+
+    def open(self, **kwargs):
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r', **kwargs)
+        self.addCleanup(log.close)
+        log.set_channels(['chan1'])
+        return log
+
+    def check_rewind(self, **kwargs):
+        log = self.open(**kwargs)
+        self.assertEntries(self.read_all(log), self.entries)
+        log.rewind()
+        self.assertEqual(log.pos, self.entries[0][:2])
+        self.assertEntries(self.read_all(log), self.entries)
+
+    def test_rewind(self):
+        self.check_rewind()
+
+    def test_rewind_with_index(self):
+        self.check_rewind(index=True)
+
+    def test_preload(self):
+        log = self.open()
+        loaded = mem_log.preload(log)
+        self.assertEntries(self.read_all(loaded), self.entries)
+        self.assertEntries(self.read_all(log), self.entries)
+
+
+class SidecarTest(helpers.LogTestCase):
+    '''Falling back to an in-memory index when the sidecar index cannot be
+    used.'''
+    def setUp(self):
+        super(SidecarTest, self).setUp()
+        self.fn = self.make_log(duration=1.0,
+                log_class=simpkl_log.SimplePickleLog)
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r')
+        self.entries = self.read_all(log)
+        log.close()
+        self.idx_fn = log_index.SidecarIndex.index_name(self.fn)
+
+    def check_memory_index(self):
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r', sidecar=True)
+        self.addCleanup(log.close)
+        self.assertTrue(isinstance(log._index, log_index.MemoryIndex))
+        log.seek(index=20)
+        self.assertEntries(self.read_all(log), self.entries[20:])
+
+    def test_write_failure(self):
+        # The temporary file the index is written to cannot be opened
+        os.mkdir(self.idx_fn + '.tmp')
+        self.check_memory_index()
+        self.assertFalse(os.path.exists(self.idx_fn))
+
+    def test_load_failure(self):
+        load = log_index.SidecarIndex.load
+        def no_load(cls, log_fn):
+            return None
+        log_index.SidecarIndex.load = classmethod(no_load)
+        try:
+            self.check_memory_index()
+        finally:
+            log_index.SidecarIndex.load = load
+        self.assertTrue(os.path.exists(self.idx_fn))
+
+    def test_sidecar(self):
+        for ii in range(2):
+            log = simpkl_log.SimplePickleLog(self.fn, mode='r', sidecar=True)
+            try:
+                self.assertTrue(isinstance(log._index,
+                    log_index.SidecarIndex))
+                log.seek(index=20)
+                self.assertEntries(self.read_all(log), self.entries[20:])
+            finally:
+                log.close()
+
+    def test_log_replaced(self):
+        # A sidecar index left from an older log of the same name is rebuilt
+        simpkl_log.SimplePickleLog(self.fn, mode='r', sidecar=True).close()
+        self.make_log(duration=2.0, log_class=simpkl_log.SimplePickleLog)
+        st = os.stat(self.fn)
+        os.utime(self.fn, (st.st_atime, st.st_mtime + 10))
+        log = simpkl_log.SimplePickleLog(self.fn, mode='r')
+        entries = self.read_all(log)
+        log.close()
+        self.assertNotEqual(len(entries), len(self.entries))
+        for ii in range(2):
+            log = simpkl_log.SimplePickleLog(self.fn, mode='r', sidecar=True)
+            try:
+                self.assertEqual(len(log._index), len(entries))
+                log.seek(index=200)
+                self.assertEntries(self.read_all(log), entries[200:])
+            finally:
+                log.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79
@@ -0,0 +1,296 @@
+#!/usr/bin/env python
+# -*- Python -*-
+# -*- coding: utf-8 -*-
+
+'''RTLogPlayer
+
+Copyright (C) 2011
+    Geoffrey Biggs
+    RT-Synthesis Research Group
+    Intelligent Systems Research Institute,
+    National Institute of Advanced Industrial Science and Technology (AIST),
+    Japan
+    All rights reserved.
+Licensed under the Eclipse Public License -v 1.0 (EPL)
+http://www.opensource.org/licenses/eclipse-1.0.txt
+
+Tests of the output sinks.
+
+'''
+
+
+import threading
+import time
+import unittest
+
+import helpers
+
+from rt_logplayer import instrument
+from rt_logplayer import log_formats
+from rt_logplayer import playback
+from rt_logplayer import sinks
+
+
+class SlowSink(sinks.CountingSink):
+    '''Counts entries, taking a time to write each.'''
+    def __init__(self, delay):
+        super(SlowSink, self).__init__()
+        self.delay = delay
+
+    def writer(self, channel):
+        count = super(SlowSink, self).writer(channel)
+        def write(data):
+            time.sleep(self.delay)
+            count(data)
+        return write
+
+
+class FakePort(object):
+    '''Stands in for a facade component's port, recording written data.'''
+    def __init__(self):
+        self.port = self
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+class FakeFacade(object):
+    def __init__(self, channels):
+        self.ports = dict((c, FakePort()) for c in channels)
+
+
+class SinkTest(unittest.TestCase):
+    def test_null(self):
+        sink = sinks.NullSink()
+        writers = sink.writers(['a', 'b'])
+        self.assertEqual(sorted(writers.keys()), ['a', 'b'])
+        writers['a'](1)
+        self.assertFalse(sink.queues)
+
+    def test_counting(self):
+        sink = sinks.CountingSink()
+        writers = sink.writers(['a', 'b'])
+        for c in ['a', 'b', 'a']:
+            writers[c](None)
+        self.assertEqual(sink.counts, {'a': 2, 'b': 1})
+        self.assertEqual(sink.total, 3)
+        sink.reset()
+        self.assertEqual(sink.counts, {})
+        # Write functions got before a reset still count
+        writers['b'](None)
+        self.assertEqual(sink.counts, {'b': 1})
+
+    def test_recording(self):
+        sink = sinks.RecordingSink()
+        writers = sink.writers(['a', 'b'])
+        writers['b'](1)
+        writers['a'](2)
+        self.assertEqual([r[1:] for r in sink.records], [('b', 1), ('a', 2)])
+        self.assertTrue(sink.records[0][0] <= sink.records[1][0])
+        sink.reset()
+        self.assertEqual(sink.records, [])
+
+    def test_facade(self):
+        facade = FakeFacade(['a', 'b'])
+        sink = sinks.FacadeSink(facade)
+        writers = sink.writers(['a', 'b'])
+        writers['a'](1)
+        writers['b'](2)
+        writers['a'](3)
+        self.assertEqual(facade.ports['a'].written, [1, 3])
+        self.assertEqual(facade.ports['b'].written, [2])
+
+
+class BlockingSink(sinks.Sink):
+    '''Records entries, each write waiting until go is set.
+
+    Writing the entry 'bad' raises an error.
+
+    '''
+    def __init__(self):
+        super(BlockingSink, self).__init__()
+        self.go = threading.Event()
+        self.started = threading.Event()
+        self.written = []
+
+    def writer(self, channel):
+        def write(data):
+            self.started.set()
+            self.go.wait()
+            if data == 'bad':
+                raise ValueError('Bad entry')
+            self.written.append(data)
+        return write
+
+
+class OverflowTest(helpers.LogTestCase):
+    def setUp(self):
+        super(OverflowTest, self).setUp()
+        self.instr = instrument.Instruments()
+        self.target = BlockingSink()
+        self.addCleanup(self.target.go.set)
+
+    def fill(self, overflow, queue_size=2):
+        # Queue entries until the first is being written and the queue is
+        # full behind it
+        sink = sinks.ThreadedSink(self.target, queue_size=queue_size,
+                overflow=overflow, instruments=self.instr)
+        self.addCleanup(sink.close, False, 1.0)
+        write = sink.writer('chan')
+        write(0)
+        self.assertTrue(self.target.started.wait(1.0))
+        for ii in range(1, queue_size + 1):
+            write(ii)
+        return sink, write
+
+    def finish(self, sink):
+        self.target.go.set()
+        sink.close(drain=True, timeout=1.0)
+
+    def wait_written(self, sink, number):
+        while sink.lag('chan')['written'] < number:
+            time.sleep(0.01)
+
+    def test_block(self):
+        sink, write = self.fill(sinks.BLOCK)
+        t = threading.Thread(target=write, args=(3,))
+        t.daemon = True
+        t.start()
+        t.join(0.2)
+        self.assertTrue(t.is_alive())
+        self.target.go.set()
+        t.join(1.0)
+        self.assertFalse(t.is_alive())
+        self.finish(sink)
+        self.assertEqual(self.target.written, [0, 1, 2, 3])
+        self.assertEqual(self.instr.dropped('chan'), 0)
+
+    def test_drop_oldest(self):
+        sink, write = self.fill(sinks.DROP_OLDEST)
+        self.call(write, 3)
+        self.assertEqual(sink.lag('chan')['dropped'], 1)
+        self.finish(sink)
+        self.assertEqual(self.target.written, [0, 2, 3])
+        self.assertEqual(self.instr.dropped('chan'), 1)
+
+    def test_drop_newest(self):
+        sink, write = self.fill(sinks.DROP_NEWEST)
+        self.call(write, 3)
+        self.assertEqual(sink.lag('chan')['dropped'], 1)
+        self.finish(sink)
+        self.assertEqual(self.target.written, [0, 1, 2])
+        self.assertEqual(self.instr.dropped('chan'), 1)
+
+    def test_lag(self):
+        sink, write = self.fill(sinks.BLOCK)
+        time.sleep(0.05)
+        lag = sink.lag('chan')
+        self.assertEqual(lag['queued'], 2)
+        self.assertEqual(lag['max_queued'], 2)
+        self.assertEqual(lag['written'], 0)
+        self.assertEqual(lag['dropped'], 0)
+        self.assertTrue(lag['lag'] >= 0.04)
+        self.assertEqual(sink.lag().keys(), ['chan'])
+        self.target.go.set()
+        self.call(lambda: self.wait_written(sink, 3))
+        lag = sink.lag('chan')
+        self.assertEqual(lag['queued'], 0)
+        self.assertEqual(lag['max_queued'], 2)
+        self.assertEqual(lag['lag'], 0.0)
+        self.assertTrue(lag['max_lag'] >= 0.04)
+
+    def test_unknown_channel(self):
+        sink = sinks.ThreadedSink(self.target)
+        self.addCleanup(sink.close)
+        self.assertEqual(sink.lag('chan'), {'queued': 0, 'max_queued': 0,
+            'lag': 0.0, 'max_lag': 0.0, 'written': 0, 'dropped': 0})
+        self.assertEqual(sink.lag(), {})
+
+    def test_close_without_draining(self):
+        # Queued entries are dropped; the entry being written is finished
+        sink, write = self.fill(sinks.BLOCK)
+        sink.close(drain=False, timeout=0.1)
+        self.assertEqual(self.instr.dropped('chan'), 2)
+        # Entries written after closing are dropped
+        write(3)
+        self.assertEqual(self.instr.dropped('chan'), 3)
+        self.target.go.set()
+        sink.close()
+        time.sleep(0.05)
+        self.assertEqual(self.target.written, [0])
+
+    def test_close_draining(self):
+        sink, write = self.fill(sinks.BLOCK)
+        self.finish(sink)
+        self.assertEqual(self.target.written, [0, 1, 2])
+        self.assertEqual(self.instr.dropped('chan'), 0)
+
+    def test_write_error(self):
+        # An entry that fails to write is counted as dropped, and later
+        # entries are still written
+        self.target.go.set()
+        sink = sinks.ThreadedSink(self.target, overflow=sinks.BLOCK,
+                instruments=self.instr)
+        write = sink.writer('chan')
+        for data in [0, 'bad', 2]:
+            write(data)
+        self.call(lambda: self.wait_written(sink, 2))
+        lag = sink.lag('chan')
+        sink.close()
+        self.assertEqual(self.target.written, [0, 2])
+        self.assertEqual(lag['written'], 2)
+        self.assertEqual(lag['dropped'], 1)
+        self.assertEqual(self.instr.dropped('chan'), 1)
+
+
+class ThreadedSinkTest(helpers.LogTestCase):
+    DELAY = 0.02
+
+    def test_write_time(self):
+        # The time taken to write to the sink is recorded as the write time,
+        # and the time taken to queue the entry as the enqueue time
+        log = log_formats.open_log(self.make_log(channels=1, rate=10.0,
+            duration=1.0))
+        instr = instrument.Instruments()
+        slow = SlowSink(self.DELAY)
+        sink = sinks.ThreadedSink(slow, queue_size=100,
+                overflow=sinks.BLOCK, instruments=instr)
+        p = playback.Player(log, sink, rate=playback.Player.MAX_RATE,
+                instruments=instr)
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+            sink.close()
+            log.close()
+        played = p.played
+        self.assertEqual(slow.total, played)
+        write = instr.histogram('write')
+        self.assertEqual(write.count, played)
+        self.assertTrue(write.min >= self.DELAY * 0.9)
+        enqueue = instr.histogram('enqueue')
+        self.assertEqual(enqueue.count, played)
+        self.assertTrue(enqueue.max < self.DELAY)
+
+    def test_direct_write_time(self):
+        log = log_formats.open_log(self.make_log(channels=1, rate=10.0,
+            duration=0.5))
+        instr = instrument.Instruments()
+        p = playback.Player(log, SlowSink(self.DELAY),
+                rate=playback.Player.MAX_RATE, instruments=instr)
+        try:
+            self.call(p.play)
+        finally:
+            p.close()
+            log.close()
+        self.assertEqual(instr.histogram('write').count, p.played)
+        self.assertTrue(instr.histogram('write').min >= self.DELAY * 0.9)
+        self.assertEqual(instr.histogram('enqueue').count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+# vim: tw=79